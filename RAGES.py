@@ -3,16 +3,40 @@ import json
 import asyncio
 import uuid
 import shutil
+import hashlib
+import time
 import tempfile
+import queue
+import math
 
-from elasticsearch import AsyncElasticsearch, Elasticsearch
-from llama_index.core import VectorStoreIndex, SimpleDirectoryReader, Settings, StorageContext
+from llama_index.core import VectorStoreIndex, SimpleDirectoryReader, Settings, StorageContext, get_response_synthesizer
+from llama_index.core.instrumentation import get_dispatcher
 from llama_index.core.ingestion import IngestionPipeline
 from llama_index.vector_stores.elasticsearch import ElasticsearchStore
-from llama_index.embeddings.huggingface import HuggingFaceEmbedding
 from llama_index.llms.ollama import Ollama
-from github_api_calls import set_up_github_connection, get_repo_contents, get_commit_history, get_issue_history
-from flask import Flask, request, jsonify
+from github_api_calls import set_up_github_connection
+from github_downloader import DownloadReport, GitHubDownloader
+from blob_cache import BlobCache
+from embedding_cache import CachedEmbedding, EmbeddingStore
+from embedding_engine import ParallelEmbedding, check_embedding_dims, load_embed_model
+from es_pool import ElasticsearchPool
+from index_manifest import ManifestCache, iter_composite_buckets
+from index_layout import IndexLayout
+from answer_cache import AnswerCache
+from llm_scheduler import BACKGROUND_PRIORITY, LIVE_PRIORITY, PrioritySemaphore
+from warmup import WarmupManager
+from ingest_jobs import CountNodes, JobManager, JobProgress
+from streaming_ingest import RssSampler, stream_ingest
+from es_ingest import BulkWriter, bulk_load_profile
+from code_chunker import CodeNodeParser
+from retrieval import CODE_ANALYSIS, RETRIEVAL_SCOPES, HybridRetriever, fetch_file_chunks, scope_filters
+from vector_index import choose_index_options, index_footprint
+from session_registry import SessionReaper, SessionRegistry, dir_size
+from snapshots import SingleFlight, SnapshotRegistry, config_hash
+from context_packer import ContextPacker, LLMUsage, load_token_counter, track_llm_usage
+from summary_tree import SummaryBuilder, SummaryManager, SummaryStore, summary_nodes
+from structural_index import StructureStore, build_structure, file_tree, functions_by_file, render_tree
+from flask import Flask, Response, request, jsonify
 import requests
 
 from flask_cors import CORS
@@ -29,92 +53,365 @@ async def after_request(response):
   return response
 
 ES_URL = "http://127.0.0.1:9201"
+# Shared client pool: connections kept alive per ES node, per-request timeout (s) and retries
+ES_POOL_CONNECTIONS = 16
+ES_REQUEST_TIMEOUT = 60
+ES_MAX_RETRIES = 3
 INDEX_PREFIX = "github_rag_index"
 EMBED_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+EMBED_DIMS = 384
+# "torch" (full precision), "int8" (dynamically quantized) or "onnx" (ONNX Runtime)
+EMBED_BACKEND = "torch"
+# Chunks per forward pass, and worker processes (one model copy each) used for ingestion
+EMBED_BATCH_SIZE = 32
+EMBED_WORKERS = min(4, os.cpu_count() or 1)
 PROMPTS_FILE = "CodeMap-prompts/prompt_templates.json"
+# Templates that are asked about one selected file
+FILE_TEMPLATE_IDS = ["C1", "C2", "C3", "D2"]
+REQUIRED_EXTS = [".py", ".md", ".txt", ".js", ".json", ".ts", ".go", ".c", ".cpp", ".h", ".hpp", ".java"]
+# "tree" reuses cached blobs and fetches only changed ones, "archive" pulls one
+# tarball per repo, "contents" crawls the Contents API file by file
+GITHUB_DOWNLOAD_MODE = "tree"
+# Upper bound on concurrent GitHub requests (and pooled connections)
+GITHUB_MAX_WORKERS = 8
+BLOB_CACHE_DIR = "/tmp/CodeMap-cache/blobs"
+BLOB_CACHE_MAX_BYTES = 2 * 1024**3
+EMBED_CACHE_DIR = "/tmp/CodeMap-cache/embeddings"
+# ~1.6 KB per cached chunk at 384 dims
+EMBED_CACHE_MAX_ENTRIES = 200_000
+# Template answers kept in memory; set ANSWER_CACHE_DB to None to keep them in memory only
+ANSWER_CACHE_MAX_ENTRIES = 256
+ANSWER_CACHE_DB = "/tmp/CodeMap-cache/answers.sqlite3"
+# Downloaded repositories, one folder per session
+SESSION_ROOT = "/tmp/CodeMap"
+# Idle sessions (folder, index, manifest, cached answers) are deleted after SESSION_TTL_S; beyond
+# that the least recently used go first while folders exceed the disk budget or sessions with an
+# index exceed the index budget. None disables a budget.
+SESSION_REAPER_ENABLED = True
+SESSION_TTL_S = 24 * 3600
+SESSION_MAX_DISK_BYTES = 10 * 1024**3
+SESSION_MAX_INDICES = 50
+SESSION_REAP_INTERVAL_S = 300
+# Never deleted by the reaper
+REAPER_PROTECTED_DIRS = ["/tmp/CodeMap-cache"]
+# Last access of every session, kept across restarts
+SESSION_DB = "/tmp/CodeMap-cache/sessions.sqlite3"
+# Sessions for the same owner/repo at the same commit, with the same ingest settings, share one
+# download and one index instead of each getting their own
+SNAPSHOT_SHARING = True
+# Concurrent Ollama generations; background work never takes the reserved slots
+LLM_MAX_CONCURRENCY = 2
+LLM_RESERVED_FOR_LIVE = 1
+# Answer the repo-wide templates in the background after ingestion unless the request opts out
+WARMUP_ENABLED = True
+WARMUP_TEMPLATE_IDS = ["A1", "A2", "A3", "B1", "B2", "B3", "B4"]
+WARMUP_CONCURRENCY = 1
+# Seconds between keep-alive comments on idle SSE streams
+SSE_KEEPALIVE_S = 15
+# Ingestion runs as background jobs; more requests than this wait in a queue
+INGEST_MAX_CONCURRENT_JOBS = 1
+# Documents pushed through chunk/embed/write per pipeline run, so progress moves and cancels land quickly
+INGEST_BATCH_DOCS = 64
+# "streaming" overlaps read/chunk/embed/write under a memory ceiling; "batch" reads every file first
+INGEST_MODES = ("streaming", "batch")
+INGEST_MODE = "streaming"
+INGEST_QUEUE_DEPTH = 2
+# Source text held between reading and writing in streaming mode
+INGEST_MEMORY_CEILING_MB = 256
+# Bulk writes during ingest: documents per bulk request and requests in flight
+ES_BULK_CHUNK_SIZE = 500
+ES_BULK_PARALLEL = 4
+# Force-merge to this many segments after a load; None skips the merge
+ES_FORCE_MERGE_SEGMENTS = None
+# Chunk along functions, classes and headings; False goes back to 512-token sentence splitting
+CODE_AWARE_CHUNKING = True
+# About 512 tokens of code
+CODE_CHUNK_MAX_CHARS = 2000
+# Vector index type for new indices (vector_index.VECTOR_INDEX_TYPES); None picks one from the
+# estimated chunk count, flat for tiny repos and quantized HNSW above that
+ES_VECTOR_INDEX_TYPE = None
+# HNSW graph for the embedding field: links per node and candidate list size while building
+ES_HNSW_M = 16
+ES_HNSW_EF_CONSTRUCTION = 100
+# "hybrid" fuses BM25 and kNN with reciprocal rank fusion; "dense" or "bm25" run one of them
+RETRIEVAL_MODE = "hybrid"
+# Chunks retrieved per query; as many as fit the context budget are used, best first
+RETRIEVAL_TOP_K = 8
+RETRIEVAL_NUM_CANDIDATES = 100
+# Where file templates search by default (retrieval.RETRIEVAL_SCOPES): the selected file only,
+# its directory, or the whole repository; requests can override it with "scope"
+FILE_TEMPLATE_SCOPE = "file"
+# Hits taken from each leg before fusion, and the RRF rank constant
+RETRIEVAL_WINDOW = 20
+RETRIEVAL_RRF_K = 60
+# Ollama context window (num_ctx; unset, Ollama allocates the model's full 128k) and the part of it
+# kept free for the answer
+LLM_CONTEXT_WINDOW = 8192
+LLM_ANSWER_TOKENS = 1024
+# Hugging Face tokenizer used to count prompt tokens; without it they are estimated from characters
+LLM_TOKENIZER = "meta-llama/Llama-3.1-8B-Instruct"
+# Context tokens (file sections + retrieved chunks) per template id; file templates give
+# CONTEXT_FILE_SHARE of theirs to sections of the selected file
+CONTEXT_TOKEN_BUDGETS = {"default": 2500, "C1": 4000, "C2": 4000, "C3": 4000, "D2": 4000}
+CONTEXT_FILE_SHARE = 0.7
+# After each ingest every file, then every directory up to the root, is summarized in the
+# background; SUMMARY_TEMPLATE_IDS are answered from the root and directory summaries down to
+# SUMMARY_CONTEXT_DEPTH, which get SUMMARY_CONTEXT_SHARE of the context budget
+SUMMARY_TREE_ENABLED = True
+SUMMARY_TEMPLATE_IDS = ["A1", "A2", "A3", "B2", "B3", "B4", "D1"]
+SUMMARY_CONTEXT_DEPTH = 2
+SUMMARY_CONTEXT_SHARE = 0.8
+# Prompt size of one summary call, and summary calls in flight. Each call also takes an
+# LLM_SCHEDULER background slot, so at most min(SUMMARY_CONCURRENCY, LLM_MAX_CONCURRENCY -
+# LLM_RESERVED_FOR_LIVE) run at once; more only queue up in the scheduler
+SUMMARY_INPUT_TOKENS = 3000
+SUMMARY_CONCURRENCY = max(1, LLM_MAX_CONCURRENCY - LLM_RESERVED_FOR_LIVE)
+SUMMARY_DB = "/tmp/CodeMap-cache/summaries.sqlite3"
+# Listing templates answered from the structural index built at ingest, without the LLM
+# unless a request asks for "narrate" (default STRUCTURE_NARRATION)
+STRUCTURE_TEMPLATE_IDS = ["B1", "E1", "E2"]
+STRUCTURE_NARRATION = False
+STRUCTURE_DIR = "/tmp/CodeMap-cache/structure"
+# "dedicated" gives every session its own index; "shared" packs sessions into ES_SHARED_INDICES
+# indices, keyed by a tenant field, so the cluster's index and shard count stays flat
+INDEX_LAYOUT_MODE = "dedicated"
+ES_SHARED_INDICES = 2
+# Chunks a shared index is sized for when picking its vector index type
+ES_SHARED_EXPECTED_CHUNKS = 1_000_000
+
+LAYOUT = IndexLayout(INDEX_LAYOUT_MODE, shared_indices=ES_SHARED_INDICES)
+MANIFESTS = ManifestCache(resolve=LAYOUT.resolve)
+# Only touched from the ES pool loop
+LLM_SCHEDULER = PrioritySemaphore(LLM_MAX_CONCURRENCY, reserved_for_live=LLM_RESERVED_FOR_LIVE)
+INGEST_JOBS = JobManager(max_concurrent=INGEST_MAX_CONCURRENT_JOBS)
+SNAPSHOTS = SnapshotRegistry(SESSION_ROOT, INDEX_PREFIX)
+SNAPSHOT_DOWNLOADS = SingleFlight()
+
+def set_up_app():
+    """
+    Loads the models and opens the ES pool and the on-disk stores. Called once
+    by the process that serves the app, never at import: embedding workers are
+    spawned processes that re-import this module and must not repeat any of it.
+    The session reaper is created but not started.
+    """
+    global EMBED_ENGINE, INGEST_EMBED_MODEL, ES_POOL, CONTEXT_PACKER, ANSWER_CACHE, SESSIONS
+    global SUMMARY_STORE, STRUCTURES, GITHUB_DOWNLOADER, SUMMARIES, REAPER
+
+    Settings.embed_model = load_embed_model(EMBED_MODEL_NAME, EMBED_BATCH_SIZE, backend=EMBED_BACKEND)
+    check_embedding_dims(Settings.embed_model, EMBED_DIMS)
+    Settings.llm = Ollama(model="llama3.1", request_timeout=360.0, context_window=LLM_CONTEXT_WINDOW)
+    if CODE_AWARE_CHUNKING:
+        Settings.node_parser = CodeNodeParser(max_chars=CODE_CHUNK_MAX_CHARS)
+    else:
+        Settings.chunk_size = 512
+        Settings.chunk_overlap = 50
 
-Settings.embed_model = HuggingFaceEmbedding(model_name=EMBED_MODEL_NAME)
-Settings.llm = Ollama(model="llama3.1", request_timeout=360.0)
-Settings.chunk_size = 512
-Settings.chunk_overlap = 50
+    # Chunk embeddings for ingestion go through a persistent cache; queries use the model directly
+    EMBED_ENGINE = ParallelEmbedding(
+        Settings.embed_model, workers=EMBED_WORKERS, batch_size=EMBED_BATCH_SIZE, backend=EMBED_BACKEND
+    )
+    INGEST_EMBED_MODEL = CachedEmbedding(
+        EMBED_ENGINE,
+        EmbeddingStore(EMBED_CACHE_DIR, f"{EMBED_MODEL_NAME}:{EMBED_BACKEND}", EMBED_DIMS, EMBED_CACHE_MAX_ENTRIES),
+        embed_batch_size=EMBED_ENGINE.embed_batch_size,
+    )
+
+    ES_POOL = ElasticsearchPool(
+        ES_URL,
+        connections_per_node=ES_POOL_CONNECTIONS,
+        request_timeout=ES_REQUEST_TIMEOUT,
+        max_retries=ES_MAX_RETRIES,
+    )
 
-def download_github_repo(owner: str, repo: str, temp_dir: str) -> str:
+    CONTEXT_PACKER = ContextPacker(load_token_counter(LLM_TOKENIZER))
+    # Collects Ollama's prompt token counts and timings for the query that made each call
+    get_dispatcher().add_event_handler(LLMUsage())
+
+    ANSWER_CACHE = AnswerCache(max_entries=ANSWER_CACHE_MAX_ENTRIES, db_path=ANSWER_CACHE_DB)
+    SESSIONS = SessionRegistry(SESSION_DB)
+    SUMMARY_STORE = SummaryStore(SUMMARY_DB)
+    STRUCTURES = StructureStore(STRUCTURE_DIR)
+
+    GITHUB_DOWNLOADER = GitHubDownloader(
+        max_workers=GITHUB_MAX_WORKERS,
+        blob_cache=BlobCache(BLOB_CACHE_DIR, BLOB_CACHE_MAX_BYTES),
+    )
+
+    SUMMARIES = SummaryManager(
+        SummaryBuilder(
+            SUMMARY_STORE,
+            summarize_text,
+            CONTEXT_PACKER.counter,
+            Settings.llm.model,
+            max_input_tokens=SUMMARY_INPUT_TOKENS,
+            concurrency=SUMMARY_CONCURRENCY,
+        ),
+        # Answers cached before the tree existed were built from retrieved chunks only
+        on_done=ANSWER_CACHE.invalidate_index,
+    )
+    REAPER = SessionReaper(
+        SESSIONS,
+        discover_sessions,
+        reclaim_session,
+        is_busy=session_busy,
+        ttl_s=SESSION_TTL_S,
+        max_disk_bytes=SESSION_MAX_DISK_BYTES,
+        max_indices=SESSION_MAX_INDICES,
+        interval_s=SESSION_REAP_INTERVAL_S,
+    )
+
+def ingest_config() -> dict:
+    """
+    Settings that change the chunks and vectors an ingest produces; part of a snapshot's identity.
+    """
+    return {
+        "embed_model": EMBED_MODEL_NAME,
+        "embed_dims": EMBED_DIMS,
+        "embed_backend": EMBED_BACKEND,
+        "code_aware_chunking": CODE_AWARE_CHUNKING,
+        "chunk_max_chars": CODE_CHUNK_MAX_CHARS if CODE_AWARE_CHUNKING else None,
+        "chunk_size": None if CODE_AWARE_CHUNKING else (Settings.chunk_size, Settings.chunk_overlap),
+        "required_exts": sorted(REQUIRED_EXTS),
+        "analysis": CODE_ANALYSIS,
+        "vector_index": (ES_VECTOR_INDEX_TYPE, ES_HNSW_M, ES_HNSW_EF_CONSTRUCTION),
+        "index_layout": INDEX_LAYOUT_MODE,
+    }
+
+def download_snapshot(owner: str, repo: str, session_id: str, headers: dict, url: str) -> tuple[str, dict]:
+    """
+    Downloads owner/repo at its current commit into the snapshot folder, or
+    reuses the folder when that snapshot was downloaded already. Concurrent
+    downloads of the same snapshot run once.
+    """
+    commit_sha = GITHUB_DOWNLOADER.resolve_commit(headers, url, DownloadReport(GITHUB_MAX_WORKERS))
+    snapshot = SNAPSHOTS.get_or_create(owner, repo, commit_sha, config_hash(ingest_config()))
+
+    def download():
+        if snapshot.downloaded:
+            return {"commit_sha": commit_sha, "reused": True}
+        report = GITHUB_DOWNLOADER.download_repo(
+            headers, url, snapshot.repo_path, mode=GITHUB_DOWNLOAD_MODE, ref=commit_sha
+        )
+        SNAPSHOTS.mark_downloaded(snapshot)
+        print(report)
+        return dict(report.summary(), reused=False)
+
+    summary, coalesced = SNAPSHOT_DOWNLOADS.do(snapshot.id, download)
+    SNAPSHOTS.attach(snapshot, session_id)
+    SESSIONS.touch(session_id)
+    SESSIONS.touch(snapshot.session_key, index_name=snapshot.index_name, repo_path=snapshot.repo_path)
+    return snapshot.repo_path, dict(summary, coalesced=coalesced, snapshot=snapshot.summary())
+
+def download_github_repo(owner: str, repo: str, temp_dir: str) -> tuple[str, dict]:
     print(f"Downloading GitHub repository: {owner}/{repo} into {temp_dir}")
     
     try:
-        repo_path = os.path.join("/tmp/CodeMap", temp_dir['sessionId'])
+        headers, url = set_up_github_connection(owner, repo)
+        if SNAPSHOT_SHARING:
+            repo_path, summary = download_snapshot(owner, repo, temp_dir['sessionId'], headers, url)
+            print(f"Repository snapshot ready at {repo_path}")
+            return repo_path, summary
+
+        repo_path = os.path.join(SESSION_ROOT, temp_dir['sessionId'])
         os.makedirs(repo_path, exist_ok=True)
+        SESSIONS.touch(temp_dir['sessionId'], repo_path=repo_path)
         # repo_path = os.path.join(os.getcwd(), "temp_repos/"+temp_dir['sessionId'])
         # os.makedirs(repo_path, exist_ok=True)
+        report = GITHUB_DOWNLOADER.download_repo(headers, url, repo_path, mode=GITHUB_DOWNLOAD_MODE)
         print(f"Repository downloaded successfully to {repo_path}")
-        headers, url = set_up_github_connection(owner, repo)
-        get_repo_contents(headers, url, save_path=repo_path) 
-        get_commit_history(headers, url, save_path=repo_path)
-        get_issue_history(headers, url, save_path=repo_path)
+        print(report)
 
-        return repo_path
+        return repo_path, report.summary()
         
     except Exception as e:
         print(f"Error downloading repository: {e}")
         raise
 
-def setup_fresh_index(index_name: str):
-    sync_es = Elasticsearch(ES_URL)
+def estimate_chunk_count(file_paths) -> int:
+    chars_per_chunk = CODE_CHUNK_MAX_CHARS if CODE_AWARE_CHUNKING else Settings.chunk_size * 4
+    total_bytes = sum(os.path.getsize(path) for path in file_paths)
+    return math.ceil(total_bytes / chars_per_chunk)
+
+def chunk_index_body(index_options: dict, settings: dict) -> dict:
+    return {
+        "settings": {**settings, "analysis": CODE_ANALYSIS},
+        "mappings": {
+            # This template ensures metadata strings are aggregatable
+            "dynamic_templates": [
+                {
+                    "metadata_as_keywords": {
+                        "path_match": "metadata.*",
+                        "match_mapping_type": "string",
+                        "mapping": {"type": "keyword"}
+                    }
+                }
+            ],
+            "properties": {
+                "content": {"type": "text", "analyzer": "code"},
+                "embedding": {
+                    "type": "dense_vector", 
+                    "dims": EMBED_DIMS, 
+                    "index": True, 
+                    "similarity": "cosine",
+                    "index_options": index_options,
+                }
+            }
+        }
+    }
+
+def setup_fresh_index(index_name: str, estimated_chunks: int = 0) -> dict:
+    """
+    (Re)creates index_name, picking the vector index type for estimated_chunks.
+    In the shared layout the session's documents are cleared from its shared
+    index instead, creating that index on first use.
+    Returns the dense_vector index_options used.
+    """
+    sync_es = ES_POOL.sync
+    location = LAYOUT.resolve(index_name)
+    if LAYOUT.shared:
+        if not sync_es.indices.exists(index=location.index):
+            print(f"Creating shared index: {location.index}...")
+            index_options = choose_index_options(
+                ES_SHARED_EXPECTED_CHUNKS, m=ES_HNSW_M, ef_construction=ES_HNSW_EF_CONSTRUCTION, override=ES_VECTOR_INDEX_TYPE
+            )
+            # Another session may create it at the same moment
+            sync_es.options(ignore_status=400).indices.create(index=location.index, body=chunk_index_body(index_options, {}))
+        print(f"Cleaning up old documents of {index_name} in {location.index}...")
+        sync_es.delete_by_query(
+            index=location.index, query=location.query(), routing=location.routing, refresh=True, conflicts="proceed"
+        )
+        mapping = sync_es.indices.get_mapping(index=location.index)
+        return mapping[location.index]["mappings"]["properties"]["embedding"].get("index_options", {})
+
+    index_options = choose_index_options(
+        estimated_chunks, m=ES_HNSW_M, ef_construction=ES_HNSW_EF_CONSTRUCTION, override=ES_VECTOR_INDEX_TYPE
+    )
     
     if sync_es.indices.exists(index=index_name):
         print(f"Cleaning up old index: {index_name}...")
         sync_es.indices.delete(index=index_name)
     
     print(f"Creating fresh index: {index_name}...")
-    sync_es.indices.create(
-        index=index_name,
-        body={
-            "mappings": {
-                # This template ensures metadata strings are aggregatable
-                "dynamic_templates": [
-                    {
-                        "metadata_as_keywords": {
-                            "path_match": "metadata.*",
-                            "match_mapping_type": "string",
-                            "mapping": {"type": "keyword"}
-                        }
-                    }
-                ],
-                "properties": {
-                    "embedding": {
-                        "type": "dense_vector", 
-                        "dims": 384, 
-                        "index": True, 
-                        "similarity": "cosine"
-                    }
-                }
-            }
-        }
-    )
-
-def index_exists(index_name: str) -> bool:
-    sync_es = Elasticsearch(ES_URL)
-    return sync_es.indices.exists(index=index_name)
+    # Created with its serving settings: the bulk-load profile in set_up_pipeline switches
+    # them for the load and puts back whatever it found here
+    sync_es.indices.create(index=index_name, body=chunk_index_body(index_options, {}))
+    return index_options
+
+async def index_exists(async_es_client, index_name: str) -> bool:
+    location = LAYOUT.resolve(index_name)
+    if not await async_es_client.indices.exists(index=location.index):
+        return False
+    if not LAYOUT.shared:
+        return True
+    response = await async_es_client.count(index=location.index, query=location.query(), routing=location.routing)
+    return response["count"] > 0
 
 async def get_indexed_files(async_es_client, index_name: str):
-    query = {
-        "size": 1000,
-        "_source": ["metadata.file_name", "metadata.file_path"]
-    }
-    response = await async_es_client.search(index=index_name, body=query)
-
-    seen = set()
-    files = []
-    for hit in response["hits"]["hits"]:
-        md = hit["_source"].get("metadata", {})
-        file_name = md.get("file_name")
-        file_path = md.get("file_path")
-        if file_name and file_path and file_path not in seen:
-            seen.add(file_path)
-            files.append({"value": file_name, "path": file_path})
-
-    files.sort(key=lambda x: x["value"].lower())
-    return files
+    """
+    Files in the index, sorted by name, from the cached ingest-time manifest.
+    """
+    manifest = await MANIFESTS.get(async_es_client, index_name)
+    return manifest["files"]
 
 def load_file_text(file_path: str, max_chars: int = 12000) -> str:
     try:
@@ -127,7 +424,7 @@ def load_file_text(file_path: str, max_chars: int = 12000) -> str:
 async def maybe_select_file(async_es_client, index_name, selected_template, current_prompt):
     selected_file = None
 
-    if selected_template['id'] in ["C1", "C2", "C3", "D2"]:
+    if selected_template['id'] in FILE_TEMPLATE_IDS:
         files = await get_indexed_files(async_es_client, index_name)
 
         if not files:
@@ -164,7 +461,7 @@ async def maybe_select_file(async_es_client, index_name, selected_template, curr
 async def apply_file_to_prompt(async_es_client, index_name, selected_template, current_prompt, file_index=None):
     selected_file = None
 
-    if selected_template["id"] in ["C1", "C2", "C3", "D2"]:
+    if selected_template["id"] in FILE_TEMPLATE_IDS:
         files = await get_indexed_files(async_es_client, index_name)
         if not files:
             raise RuntimeError("No files found in index.")
@@ -190,7 +487,7 @@ async def apply_file_to_prompt(async_es_client, index_name, selected_template, c
             {current_prompt}
             """.strip()
 
-        return current_prompt, selected_file
+    return current_prompt, selected_file
 
 def load_prompt_templates():
     if not os.path.exists(PROMPTS_FILE):
@@ -199,43 +496,315 @@ def load_prompt_templates():
     with open(PROMPTS_FILE, "r") as f:
         return json.load(f)
 
-async def set_up_pipeline(repo_path: str, index_name: str):
-    # 1. Start Fresh with the unique index name
-    setup_fresh_index(index_name)
+def warmup_template_keys(templates: dict) -> list:
+    return [key for key, template in templates.items() if template["id"] in WARMUP_TEMPLATE_IDS]
 
-    # 2. Load Repository
+def file_content_hash(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def tag_documents(documents, file_hashes: dict, repo_path: str, tenant: str | None = None):
+    """
+    Stamps each document with the hash of its source file and, in the shared
+    layout, its tenant. Both are kept out of the embedding and LLM text so
+    they do not change the vectors. The embedded text names the file by its
+    path inside the repository rather than its absolute path, which includes
+    the session or snapshot folder, so the same chunk hits the embedding
+    cache from any session, fork or commit.
+    """
+    for doc in documents:
+        file_path = doc.metadata.get("file_path")
+        doc.metadata["content_hash"] = file_hashes.get(file_path)
+        doc.excluded_embed_metadata_keys.append("content_hash")
+        doc.excluded_llm_metadata_keys.append("content_hash")
+        if file_path:
+            doc.metadata["relative_path"] = os.path.relpath(file_path, repo_path).replace(os.sep, "/")
+            doc.excluded_embed_metadata_keys.append("file_path")
+            doc.excluded_llm_metadata_keys.append("relative_path")
+        if tenant:
+            doc.metadata["tenant"] = tenant
+            doc.excluded_embed_metadata_keys.append("tenant")
+            doc.excluded_llm_metadata_keys.append("tenant")
+    return documents
+
+async def get_indexed_file_hashes(async_es_client, index_name: str) -> dict:
+    """
+    Returns {file_path: (content_hash, chunk_count)} for every file in the index.
+    """
+    indexed = {}
+    sources = [
+        {"file_path": {"terms": {"field": "metadata.file_path"}}},
+        {"content_hash": {"terms": {"field": "metadata.content_hash", "missing_bucket": True}}},
+    ]
+    location = LAYOUT.resolve(index_name)
+    async for bucket in iter_composite_buckets(
+        async_es_client, location.index, sources, query=location.query(), routing=location.routing
+    ):
+        key = bucket["key"]
+        indexed[key["file_path"]] = (key["content_hash"], bucket["doc_count"])
+    return indexed
+
+async def delete_file_nodes(async_es_client, index_name: str, file_paths: list, batch_size: int = 500) -> int:
+    """
+    Deletes every chunk of the given files, returns the number of chunks removed.
+    """
+    deleted = 0
+    location = LAYOUT.resolve(index_name)
+    for start in range(0, len(file_paths), batch_size):
+        response = await async_es_client.delete_by_query(
+            index=location.index,
+            body={"query": location.query({"terms": {"metadata.file_path": file_paths[start:start + batch_size]}})},
+            routing=location.routing,
+            refresh=True,
+            conflicts="proceed",
+        )
+        deleted += response.get("deleted", 0)
+    return deleted
+
+def read_documents(file_paths: list, progress: JobProgress) -> list:
+    documents = []
+    for file_documents in SimpleDirectoryReader(input_files=file_paths).iter_data():
+        progress.check_cancelled()
+        documents.extend(file_documents)
+        progress.add("files_read")
+    # Empty files yield no documents but still count as read
+    progress.set("files_read", len(file_paths))
+    return documents
+
+async def set_up_pipeline(
+    repo_path: str,
+    index_name: str,
+    incremental: bool = False,
+    progress: JobProgress | None = None,
+    ingest_mode: str = INGEST_MODE,
+):
+    """
+    Indexes repo_path into index_name. A full ingest drops and rebuilds the index;
+    an incremental one diffs per-file content hashes against the index and only
+    re-chunks and re-embeds added or modified files, deleting removed ones.
+    ingest_mode picks streaming or batch ingestion (see INGEST_MODES).
+    Stage and counters are reported on progress, which also carries cancellation.
+    Returns the vector store, the ES client and a dict of ingest stats.
+    Must run on the ES pool loop (ES_POOL.run) since it uses the shared client.
+    """
+    progress = progress or JobProgress()
+
+    # 1. List the repository and hash every file
+    progress.set_stage("listing")
     reader = SimpleDirectoryReader(
         input_dir=repo_path, 
         recursive=True,
-        required_exts=[".py", ".md", ".txt", ".js", ".json", ".ts", ".go", ".c", ".cpp", ".h", ".hpp", ".java"] 
+        required_exts=REQUIRED_EXTS
+    )
+    file_hashes = await asyncio.to_thread(
+        lambda: {str(path): file_content_hash(str(path)) for path in reader.input_files}
     )
-    documents = reader.load_data()
+
+    async_es_client = ES_POOL.client
+    location = LAYOUT.resolve(index_name)
+    # Until the new manifest is built at the end, the index is not a complete one
+    await MANIFESTS.delete(async_es_client, index_name)
+    ANSWER_CACHE.invalidate_index(index_name)
+    WARMUPS.cancel(index_name)
+    SUMMARIES.cancel(index_name)
+    SUMMARY_STORE.forget(index_name)
+    stats = {
+        "mode": "full",
+        "files": {"skipped": 0, "updated": 0, "added": 0, "deleted": 0},
+        "chunks": {"skipped": 0, "updated": 0, "deleted": 0},
+    }
+
+    # 2. Work out which files need (re-)ingesting
+    progress.set_stage("diffing")
+    if incremental and await index_exists(async_es_client, index_name):
+        stats["mode"] = "incremental"
+        indexed = await get_indexed_file_hashes(async_es_client, index_name)
+
+        to_ingest = []
+        for path, content_hash in file_hashes.items():
+            if path not in indexed:
+                stats["files"]["added"] += 1
+                to_ingest.append(path)
+            elif indexed[path][0] != content_hash:
+                stats["files"]["updated"] += 1
+                to_ingest.append(path)
+            else:
+                stats["files"]["skipped"] += 1
+                stats["chunks"]["skipped"] += indexed[path][1]
+
+        removed = [path for path in indexed if path not in file_hashes]
+        stats["files"]["deleted"] = len(removed)
+        stale = removed + [path for path in to_ingest if path in indexed]
+        stats["chunks"]["deleted"] = await delete_file_nodes(async_es_client, index_name, stale)
+    else:
+        # Start Fresh with the unique index name
+        estimated_chunks = await asyncio.to_thread(estimate_chunk_count, file_hashes)
+        # setup_fresh_index uses the sync client, keep it off the shared pool loop
+        index_options = await asyncio.to_thread(setup_fresh_index, index_name, estimated_chunks)
+        stats["vector_index"] = dict(index_options, estimated_chunks=estimated_chunks)
+        to_ingest = list(file_hashes)
+        stats["files"]["added"] = len(to_ingest)
 
     # 3. Setup Vector Store with the unique index name
-    async_es_client = AsyncElasticsearch(ES_URL)
     vector_store = ElasticsearchStore(
         index_name=index_name, 
         es_client=async_es_client,
     )
 
-    # 4. Ingestion
-    pipeline = IngestionPipeline(
-        transformations=[Settings.node_parser, Settings.embed_model],
-        vector_store = ElasticsearchStore(
-            index_name=index_name,
-            es_client=async_es_client
-        ),
+    # 4. Ingestion of the new and changed files only
+    progress.set("files_total", len(to_ingest))
+    bulk_stats = {}
+    # Writes go to the physical index; the returned store keeps the session's name
+    writer = BulkWriter(
+        ElasticsearchStore(index_name=location.index, es_client=async_es_client),
+        chunk_size=ES_BULK_CHUNK_SIZE,
+        parallel=ES_BULK_PARALLEL,
+        routing=location.routing,
     )
-    await pipeline.arun(documents=documents, show_progress=True)
-
-    return vector_store, async_es_client
-
-async def run_query(vector_store, async_es_client, user_prompt: str):
-    index = VectorStoreIndex.from_vector_store(vector_store)
-    query_engine = index.as_query_engine()
+    # Only a fresh dedicated index is loaded with the bulk profile: shared indices serve other
+    # sessions and an incremental ingest updates an index that is already serving queries
+    async with bulk_load_profile(
+        async_es_client,
+        location.index,
+        force_merge_segments=ES_FORCE_MERGE_SEGMENTS,
+        stats=bulk_stats,
+        apply_settings=not LAYOUT.shared and stats["mode"] == "full",
+    ):
+        if to_ingest:
+            cache_before = INGEST_EMBED_MODEL.counters()
+            engine_before = EMBED_ENGINE.snapshot()
+            async with RssSampler() as sampler:
+                if ingest_mode == "streaming":
+                    progress.set_stage("streaming")
+                    stats["chunks"]["updated"] = await stream_ingest(
+                        to_ingest,
+                        Settings.node_parser,
+                        INGEST_EMBED_MODEL,
+                        writer,
+                        progress,
+                        prepare_documents=lambda documents: tag_documents(documents, file_hashes, repo_path, location.tenant),
+                        batch_docs=INGEST_BATCH_DOCS,
+                        queue_depth=INGEST_QUEUE_DEPTH,
+                        max_inflight_bytes=INGEST_MEMORY_CEILING_MB * 1024**2,
+                    )
+                else:
+                    progress.set_stage("reading")
+                    documents = tag_documents(
+                        await asyncio.to_thread(read_documents, to_ingest, progress), file_hashes, repo_path, location.tenant
+                    )
+
+                    progress.set_stage("ingesting")
+                    pipeline = IngestionPipeline(
+                        transformations=[
+                            Settings.node_parser,
+                            CountNodes(progress, "chunks_produced"),
+                            INGEST_EMBED_MODEL,
+                            CountNodes(progress, "chunks_embedded"),
+                        ],
+                    )
+                    for start in range(0, len(documents), INGEST_BATCH_DOCS):
+                        progress.check_cancelled()
+                        nodes = await pipeline.arun(documents=documents[start:start + INGEST_BATCH_DOCS])
+                        nodes = [node for node in nodes if node.embedding is not None]
+                        if nodes:
+                            await writer.async_add(nodes)
+                        progress.add("docs_written", len(nodes))
+                        stats["chunks"]["updated"] += len(nodes)
+            stats["performance"] = dict(sampler.report(), ingest_mode=ingest_mode)
+
+            INGEST_EMBED_MODEL.flush()
+            cache_after = INGEST_EMBED_MODEL.counters()
+            hits = cache_after["hits"] - cache_before["hits"]
+            misses = cache_after["misses"] - cache_before["misses"]
+            stats["embedding_cache"] = {
+                "hits": hits,
+                "misses": misses,
+                "hit_rate": round(hits / (hits + misses), 3) if hits + misses else None,
+                "entries": cache_after["entries"],
+            }
+            stats["embedding_workers"] = EMBED_ENGINE.worker_stats(since=engine_before)
+
+    stats["bulk"] = dict(writer.stats(), **bulk_stats)
+
+    progress.set_stage("manifest")
+    manifest = await MANIFESTS.build(async_es_client, index_name)
+    stats["files"]["indexed"] = len(manifest["files"])
+    stats["index_version"] = manifest["version"]
+
+    progress.set_stage("structure")
+    # Entries of unchanged files carry over from the previous build
+    previous = await asyncio.to_thread(STRUCTURES.load, index_name) if stats["mode"] == "incremental" else None
+    structure = await asyncio.to_thread(build_structure, repo_path, file_hashes, previous)
+    await asyncio.to_thread(STRUCTURES.save, index_name, structure)
+    stats["structure"] = structure["stats"]
+
+    if SUMMARY_TREE_ENABLED:
+        # Runs on after the ingest, poll /api/summary_status for progress
+        stats["summaries"] = await SUMMARIES.start(index_name, repo_path, file_hashes)
+
+    print(f"Ingest stats for {index_name}: {stats}")
+    return vector_store, async_es_client, stats
+
+def context_budget(template_id: str | None, overhead_tokens: int) -> int:
+    budget = CONTEXT_TOKEN_BUDGETS.get(template_id, CONTEXT_TOKEN_BUDGETS["default"])
+    # Whatever the template allows, question and context must leave room for the answer
+    return max(0, min(budget, LLM_CONTEXT_WINDOW - LLM_ANSWER_TOKENS - overhead_tokens))
+
+async def run_query(
+    vector_store,
+    async_es_client,
+    user_prompt: str,
+    streaming: bool = False,
+    template_id: str | None = None,
+    sections: list | None = None,
+    retrieval_query: str | None = None,
+    filters: list | None = None,
+    file_share: float = CONTEXT_FILE_SHARE,
+):
+    """
+    Retrieves chunks for retrieval_query (default user_prompt), restricted by
+    the filter clauses in filters, packs them and the given file sections into
+    the template's token budget and answers user_prompt from that context.
+    response.metadata["context"] reports what was packed and the prompt's
+    token count.
+    With streaming=True the response is an AsyncStreamingResponse; iterate
+    response.async_response_gen() for the tokens.
+    """
+    location = LAYOUT.resolve(vector_store.index_name)
+    retriever = HybridRetriever(
+        async_es_client,
+        location.index,
+        Settings.embed_model,
+        mode=RETRIEVAL_MODE,
+        top_k=RETRIEVAL_TOP_K,
+        num_candidates=RETRIEVAL_NUM_CANDIDATES,
+        window=RETRIEVAL_WINDOW,
+        rrf_k=RETRIEVAL_RRF_K,
+        filters=location.filters() + (filters or []),
+        routing=location.routing,
+        loop=ES_POOL.loop,
+    )
+    started = time.perf_counter()
+    retrieved = await retriever.aretrieve(retrieval_query or user_prompt)
+    retrieval_s = round(time.perf_counter() - started, 3)
+
+    synthesizer = get_response_synthesizer(streaming=streaming)
+    template = synthesizer.get_prompts()["text_qa_template"]
+    overhead = CONTEXT_PACKER.prompt_tokens(template, user_prompt, [], llm=Settings.llm)
+    nodes, report = CONTEXT_PACKER.pack(
+        user_prompt, retrieved, sections, context_budget(template_id, overhead), file_share
+    )
+    report["retrieval_s"] = retrieval_s
+    report["prompt_tokens"] = CONTEXT_PACKER.prompt_tokens(template, user_prompt, nodes, llm=Settings.llm)
+    report["tokenizer"] = CONTEXT_PACKER.counter.name
+    print(f"[SERVER] Context for {template_id}: {report}")
 
     print("\n--- Generating Response via Ollama ---")
-    response = await query_engine.aquery(user_prompt)
+    response = await synthesizer.asynthesize(user_prompt, nodes)
+    response.metadata = dict(response.metadata or {}, context=report)
     return response
 
 async def query_session(session: dict, template_key: str, file_index: int | None = None) -> dict:
@@ -270,53 +839,459 @@ async def query_session(session: dict, template_key: str, file_index: int | None
         "selected_file": selected_file,
     }
 
+async def discard_index(index_name: str):
+    """
+    Drops a session's index (in the shared layout, its documents), its
+    manifest, summary tree and structural index, e.g. after a full ingest was
+    cancelled part-way.
+    Must run on the ES pool loop.
+    """
+    location = LAYOUT.resolve(index_name)
+    if LAYOUT.shared:
+        await ES_POOL.client.options(ignore_status=404).delete_by_query(
+            index=location.index, query=location.query(), routing=location.routing, refresh=True, conflicts="proceed"
+        )
+    else:
+        await ES_POOL.client.options(ignore_status=404).indices.delete(index=index_name)
+    await MANIFESTS.delete(ES_POOL.client, index_name)
+    SUMMARIES.cancel(index_name)
+    SUMMARY_STORE.forget(index_name)
+    STRUCTURES.delete(index_name)
+
+def session_id_of(index_name: str | None) -> str | None:
+    prefix = f"{INDEX_PREFIX}_"
+    if index_name and index_name.startswith(prefix):
+        return index_name[len(prefix):]
+    return None
+
+def touch_index(index_name: str | None):
+    session_id = session_id_of(index_name)
+    if session_id:
+        SESSIONS.touch(session_id, index_name=index_name)
+
+def is_reapable_dir(path: str) -> bool:
+    """
+    Only folders directly under SESSION_ROOT are ever deleted, and never a
+    protected cache folder or one containing it.
+    """
+    path = os.path.realpath(path)
+    if os.path.dirname(path) != os.path.realpath(SESSION_ROOT):
+        return False
+    for protected in REAPER_PROTECTED_DIRS:
+        protected = os.path.realpath(protected)
+        if protected == path or protected.startswith(path + os.sep):
+            return False
+    return True
+
+async def discover_sessions() -> list:
+    """
+    Session folders under SESSION_ROOT and session indices (tenants in the
+    shared layout) that exist right now. Must run on the ES pool loop.
+    """
+    found = []
+    if os.path.isdir(SESSION_ROOT):
+        for entry in os.scandir(SESSION_ROOT):
+            if entry.is_dir(follow_symlinks=False) and is_reapable_dir(entry.path):
+                found.append({"session_id": entry.name, "last_access": entry.stat().st_mtime, "repo_path": entry.path})
+
+    async_es_client = ES_POOL.client
+    if LAYOUT.shared:
+        sources = [{"tenant": {"terms": {"field": "metadata.tenant"}}}]
+        for index in LAYOUT.physical_indices():
+            if not await async_es_client.indices.exists(index=index):
+                continue
+            async for bucket in iter_composite_buckets(async_es_client, index, sources):
+                index_name = bucket["key"]["tenant"]
+                if session_id_of(index_name):
+                    # No creation date per tenant, so a tenant first seen now gets a full TTL
+                    found.append({"session_id": session_id_of(index_name), "last_access": time.time(), "index_name": index_name})
+    else:
+        indices = await async_es_client.cat.indices(index=f"{INDEX_PREFIX}_*", h="index,creation.date", format="json")
+        for row in indices:
+            found.append({
+                "session_id": session_id_of(row["index"]),
+                "last_access": int(row["creation.date"]) / 1000,
+                "index_name": row["index"],
+            })
+    return found
+
+async def reclaim_session(record) -> dict:
+    """
+    Deletes everything a session left behind: its index (or tenant documents),
+    manifest, cached answers and download folder. Must run on the ES pool loop.
+    """
+    freed = {"bytes": 0, "indices": 0}
+    SNAPSHOTS.release(record.session_id)
+    if record.index_name:
+        WARMUPS.cancel(record.index_name)
+        if not LAYOUT.shared and await ES_POOL.client.indices.exists(index=record.index_name):
+            freed["indices"] = 1
+        await discard_index(record.index_name)
+        ANSWER_CACHE.invalidate_index(record.index_name)
+    if record.repo_path and os.path.isdir(record.repo_path) and is_reapable_dir(record.repo_path):
+        freed["bytes"] = record.disk_bytes or await asyncio.to_thread(dir_size, record.repo_path)
+        await asyncio.to_thread(shutil.rmtree, record.repo_path, True)
+    snapshot = SNAPSHOTS.by_index(record.index_name)
+    if snapshot is not None:
+        SNAPSHOTS.forget(snapshot)
+    return freed
+
+def session_busy(record) -> bool:
+    if not record.index_name:
+        return False
+    # Snapshots stay while any session still references them
+    return INGEST_JOBS.active(record.index_name) is not None or SNAPSHOTS.refs(record.index_name) > 0
+
+async def snapshot_ready(snapshot) -> bool:
+    """
+    Whether the snapshot's index was fully built, possibly before a restart.
+    Must run on the ES pool loop.
+    """
+    if INGEST_JOBS.active(snapshot.index_name) is not None:
+        return False
+    return await MANIFESTS.exists(ES_POOL.client, snapshot.index_name)
+
 @app.route('/api/initialize_index', methods=['POST'])
 async def handle_initialize():
+    """
+    Starts an ingestion job and returns its id straight away (202).
+    Poll /api/ingest_status for progress and the ingest stats.
+    """
     data = request.get_json()
     repo_path = data.get("repo_path")
     session_id = data.get("session_id")
+    incremental = bool(data.get("incremental", False))
+    warm_up = bool(data.get("warm_up", WARMUP_ENABLED))
+    ingest_mode = data.get("ingest_mode", INGEST_MODE)
     index_name = f"{INDEX_PREFIX}_{session_id}"
-    
-    try:
+    if ingest_mode not in INGEST_MODES:
+        return jsonify({"error": f"ingest_mode must be one of {list(INGEST_MODES)}"}), 400
+
+    snapshot = SNAPSHOTS.by_path(repo_path) if SNAPSHOT_SHARING else None
+    if snapshot is not None:
+        # The session attaches to the snapshot's index, built once for every session sharing it
+        SNAPSHOTS.attach(snapshot, session_id)
+        SESSIONS.touch(session_id)
+        SESSIONS.touch(snapshot.session_key, index_name=snapshot.index_name, repo_path=snapshot.repo_path)
+        index_name = snapshot.index_name
+        # A snapshot never changes, so there is nothing to ingest incrementally
+        incremental = False
+        if snapshot.indexed or await ES_POOL.run(snapshot_ready(snapshot)):
+            snapshot.indexed = True
+            return jsonify({"status": "done", "job_id": None, "index_name": index_name, "snapshot": snapshot.summary()}), 200
+    else:
+        SESSIONS.touch(session_id, index_name=index_name, repo_path=repo_path)
+
+    async def ingest(progress):
         # This runs the LlamaIndex ingestion
-        await set_up_pipeline(repo_path, index_name)
-        return jsonify({"status": "indexed", "index_name": index_name}), 200
+        _, _, ingest_stats = await set_up_pipeline(
+            repo_path, index_name, incremental=incremental, progress=progress, ingest_mode=ingest_mode
+        )
+        if snapshot is not None:
+            snapshot.indexed = True
+        warmup = None
+        if warm_up:
+            # Runs on after the job, poll /api/warmup_status for progress. It waits for the
+            # summary tree so repository templates are warmed from the summaries
+            warmup = await WARMUPS.start(
+                index_name,
+                warmup_template_keys(load_prompt_templates()),
+                after=SUMMARIES.wait(index_name) if SUMMARY_TREE_ENABLED else None,
+            )
+        return {"index_name": index_name, "ingest": ingest_stats, "warmup": warmup}
+
+    # A cancelled incremental ingest leaves a usable index behind, a cancelled full one does not
+    on_cancel = None if incremental else (lambda: discard_index(index_name))
+
+    try:
+        # A second session for a snapshot being ingested gets the running job back
+        job = await ES_POOL.run(INGEST_JOBS.submit(index_name, ingest, on_cancel=on_cancel))
+        response = {"status": job.status, "job_id": job.id, "index_name": index_name}
+        if snapshot is not None:
+            response["snapshot"] = snapshot.summary()
+        return jsonify(response), 202
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/ingest_status', methods=['POST'])
+async def handle_ingest_status():
+    data = request.get_json()
+    job = INGEST_JOBS.get(data.get("job_id"))
+    if job is None:
+        return jsonify({"error": f"Unknown job '{data.get('job_id')}'"}), 404
+    return jsonify(job.summary()), 200
+
+@app.route('/api/cancel_ingest', methods=['POST'])
+async def handle_cancel_ingest():
+    data = request.get_json()
+    job = await ES_POOL.run(INGEST_JOBS.cancel(data.get("job_id")))
+    if job is None:
+        return jsonify({"error": f"Unknown job '{data.get('job_id')}'"}), 404
+    return jsonify(job.summary()), 200
+
 @app.route('/api/get_files', methods=['POST'])
 async def handle_get_files():
     data = request.get_json()
     index_name = data.get("index_name")
+    touch_index(index_name)
     
-    async_es_client = AsyncElasticsearch(ES_URL)
-    try:
-        files = await get_indexed_files(async_es_client, index_name)
-        return jsonify({"files": files}), 200
-    finally:
-        await async_es_client.close()
+    files = await ES_POOL.run(get_indexed_files(ES_POOL.client, index_name))
+    return jsonify({"files": files}), 200
 
-async def query_session_v2(index_name: str, template_key: str, file_index: int | None = None):
+async def resolve_template_query(index_name: str, template_key: str, file_index: int | None = None, scope: str | None = None):
+    """
+    Looks up a template and its answer cache key for index_name.
+    Returns (selected_template, cache_key). Must run on the ES pool loop.
+    """
     templates = load_prompt_templates()
     selected = templates[template_key]
-    current_prompt = selected["prompt"]
 
-    async_es_client = AsyncElasticsearch(ES_URL)
+    # Answers are cached per index version, so a re-ingest never serves a stale one
+    manifest = await MANIFESTS.get(ES_POOL.client, index_name)
+    file_path = None
+    if file_index is not None and selected["id"] in FILE_TEMPLATE_IDS:
+        file_path = manifest["files"][file_index]["path"]
+    else:
+        scope = None
+    cache_key = AnswerCache.make_key(
+        index_name, manifest["version"], selected["id"], file_path, Settings.llm.model, scope
+    )
+    return selected, cache_key
+
+def cached_result(cached: dict) -> dict:
+    return {
+        "description": cached["description"],
+        "answer": cached["answer"],
+        "cache": {"hit": True, "age_s": round(time.time() - cached["stored_at"], 1)},
+    }
+
+async def build_template_context(index_name: str, selected: dict, file_index: int | None = None, scope: str = FILE_TEMPLATE_SCOPE) -> dict:
+    """
+    run_query arguments for a template query. Repository templates get the
+    summary tree's root and directory summaries once it is built. File
+    templates get the selected file's chunks, read back from the index in line
+    order, which run_query packs into the budget, and a search restricted to
+    scope around the file.
+    """
+    question = selected["prompt"]
+    if selected["id"] in SUMMARY_TEMPLATE_IDS:
+        tree = SUMMARY_STORE.load_tree(index_name)
+        if tree is not None:
+            return {
+                "user_prompt": question,
+                "sections": summary_nodes(tree, SUMMARY_CONTEXT_DEPTH),
+                "file_share": SUMMARY_CONTEXT_SHARE,
+            }
+    if file_index is None or selected["id"] not in FILE_TEMPLATE_IDS:
+        return {"user_prompt": question}
+
+    files = await get_indexed_files(ES_POOL.client, index_name)
+    chosen = files[file_index]
+    location = LAYOUT.resolve(index_name)
+    sections = await fetch_file_chunks(
+        ES_POOL.client, location.index, chosen["path"], filters=location.filters(), routing=location.routing
+    )
+    question = f"{question}\n\nFILE: {chosen['value']}"
+    return {
+        "user_prompt": question,
+        "sections": sections,
+        "retrieval_query": question,
+        "filters": scope_filters(scope, chosen["path"]),
+        # Scoped to the file, retrieval only ranks the same chunks, so the file may fill the budget
+        "file_share": 1.0 if scope == "file" else CONTEXT_FILE_SHARE,
+    }
+
+def structural_answer(template_id: str, structure: dict) -> str:
+    if template_id == "E1":
+        return json.dumps(file_tree(structure), indent=2)
+    if template_id == "E2":
+        return json.dumps(functions_by_file(structure), indent=2)
+    return render_tree(structure)
+
+def narration_prompt(selected: dict, listing: str) -> str:
+    return (
+        f"{selected['description']}. The listing below was computed exactly from the repository's files. "
+        "In a few short paragraphs, explain to a first-time reader how the repository is organised and "
+        "what the main parts appear to be for. Do not repeat the listing.\n\n"
+        f"{listing}"
+    )
+
+async def structural_query(index_name: str, selected: dict) -> dict | None:
+    """
+    The answer of a listing template computed from the structural index, or
+    None when the index has none (built before it existed). Must run on the
+    ES pool loop.
+    """
+    if selected["id"] not in STRUCTURE_TEMPLATE_IDS:
+        return None
+    started = time.perf_counter()
+    structure = await asyncio.to_thread(STRUCTURES.load, index_name)
+    if structure is None:
+        return None
+    answer = structural_answer(selected["id"], structure)
+    return {
+        "description": selected["description"],
+        "answer": answer,
+        "cache": {"hit": False},
+        "structure": dict(structure["stats"], answered_ms=round((time.perf_counter() - started) * 1000, 1)),
+    }
+
+def query_stats(response, usage: dict) -> dict:
+    """
+    Packed context and Ollama's own prompt token count and evaluation time for one query.
+    """
+    return {"context": (response.metadata or {}).get("context"), "llm": dict(usage)}
+
+async def query_session_v2(
+    index_name: str,
+    template_key: str,
+    file_index: int | None = None,
+    priority: int = LIVE_PRIORITY,
+    scope: str = FILE_TEMPLATE_SCOPE,
+    narrate: bool = STRUCTURE_NARRATION,
+):
+    """
+    Runs a template query against index_name using the shared ES client.
+    File templates search within scope (see RETRIEVAL_SCOPES) of the selected file.
+    Listing templates are answered from the structural index, followed by an
+    LLM narration if narrate is set.
+    The LLM call waits for an LLM_SCHEDULER slot at the given priority.
+    Must run on the ES pool loop (ES_POOL.run).
+    """
+    selected, cache_key = await resolve_template_query(index_name, template_key, file_index, scope)
+
+    result = await structural_query(index_name, selected)
+    if result is not None:
+        if narrate:
+            async with LLM_SCHEDULER.slot(priority):
+                usage = track_llm_usage()
+                narration = await Settings.llm.acomplete(narration_prompt(selected, result["answer"]))
+            result["answer"] = f"{result['answer']}\n\n{narration.text}"
+            result["llm"] = dict(usage)
+        print(f"[SERVER] Answered {selected['id']} from the structural index: {result['structure']}")
+        return result
+
+    cached = ANSWER_CACHE.get(cache_key)
+    if cached is not None:
+        print(f"[SERVER] Serving cached answer for {selected['id']}")
+        return cached_result(cached)
+
+    context = await build_template_context(index_name, selected, file_index, scope)
+    async_es_client = ES_POOL.client
     vector_store = ElasticsearchStore(index_name=index_name, es_client=async_es_client)
-    
-    try:
-        if file_index is not None:
-            current_prompt, _ = await apply_file_to_prompt(
-                async_es_client, index_name, selected, current_prompt, file_index
-            )
 
-        answer = await run_query(vector_store, async_es_client, current_prompt)
-        return {
-            "description": selected["description"],
-            "answer": str(answer),
-        }
-    finally:
-        await async_es_client.close()
+    async with LLM_SCHEDULER.slot(priority):
+        # A warm-up job may have answered it while we waited for the slot
+        cached = ANSWER_CACHE.get(cache_key)
+        if cached is None:
+            usage = track_llm_usage()
+            response = await run_query(vector_store, async_es_client, template_id=selected["id"], **context)
+            answer = str(response)
+    if cached is not None:
+        return cached_result(cached)
+    ANSWER_CACHE.put(cache_key, {"description": selected["description"], "answer": answer})
+    stats = query_stats(response, usage)
+    print(f"[SERVER] Answered {selected['id']}: {stats}")
+    return {
+        "description": selected["description"],
+        "answer": answer,
+        "cache": {"hit": False},
+        **stats,
+    }
+
+async def stream_query_session(
+    index_name: str,
+    template_key: str,
+    file_index: int | None,
+    emit,
+    scope: str = FILE_TEMPLATE_SCOPE,
+    narrate: bool = STRUCTURE_NARRATION,
+):
+    """
+    Streaming variant of query_session_v2. Calls emit(event, data) with a
+    "meta" event, one "token" event per generated chunk and a final "done"
+    event carrying the timings. Cached and structural answers are sent as a
+    single token, a narration streams after the latter.
+    Cancelling the task stops the Ollama generation. Must run on the ES pool loop.
+    """
+    started = time.perf_counter()
+    selected, cache_key = await resolve_template_query(index_name, template_key, file_index, scope)
+
+    result = await structural_query(index_name, selected)
+    if result is not None:
+        emit("meta", {"description": result["description"], "cache": result["cache"]})
+        emit("token", {"text": result["answer"]})
+        first_token = time.perf_counter()
+        done = {"structure": result["structure"]}
+        if narrate:
+            async with LLM_SCHEDULER.slot(LIVE_PRIORITY):
+                usage = track_llm_usage()
+                emit("token", {"text": "\n\n"})
+                async for chunk in await Settings.llm.astream_complete(narration_prompt(selected, result["answer"])):
+                    emit("token", {"text": chunk.delta})
+            done["llm"] = dict(usage)
+        finished = time.perf_counter()
+        emit("done", dict(
+            done,
+            ttft_s=round(first_token - started, 3),
+            generation_s=round(finished - first_token, 3),
+            total_s=round(finished - started, 3),
+            cache=result["cache"],
+        ))
+        return
+
+    def emit_cached(cached):
+        result = cached_result(cached)
+        emit("meta", {"description": result["description"], "cache": result["cache"]})
+        emit("token", {"text": result["answer"]})
+        elapsed = round(time.perf_counter() - started, 3)
+        emit("done", {"ttft_s": elapsed, "generation_s": 0.0, "total_s": elapsed, "cache": result["cache"]})
+
+    cached = ANSWER_CACHE.get(cache_key)
+    if cached is not None:
+        print(f"[SERVER] Serving cached answer for {selected['id']}")
+        return emit_cached(cached)
+
+    context = await build_template_context(index_name, selected, file_index, scope)
+    async_es_client = ES_POOL.client
+    vector_store = ElasticsearchStore(index_name=index_name, es_client=async_es_client)
+
+    async with LLM_SCHEDULER.slot(LIVE_PRIORITY):
+        cached = ANSWER_CACHE.get(cache_key)
+        if cached is not None:
+            return emit_cached(cached)
+
+        emit("meta", {"description": selected["description"], "cache": {"hit": False}})
+        usage = track_llm_usage()
+        response = await run_query(
+            vector_store, async_es_client, streaming=True, template_id=selected["id"], **context
+        )
+        chunks = []
+        first_token = None
+        async for text in response.async_response_gen():
+            if first_token is None:
+                first_token = time.perf_counter()
+            chunks.append(text)
+            emit("token", {"text": text})
+
+    finished = time.perf_counter()
+    first_token = first_token or finished
+    ANSWER_CACHE.put(cache_key, {"description": selected["description"], "answer": "".join(chunks)})
+    timings = {
+        "ttft_s": round(first_token - started, 3),
+        "generation_s": round(finished - first_token, 3),
+        "total_s": round(finished - started, 3),
+    }
+    timings.update(query_stats(response, usage))
+    print(f"[SERVER] Streamed {selected['id']}: {timings}")
+    emit("done", dict(timings, cache={"hit": False}))
+
+async def summarize_text(prompt: str) -> str:
+    async with LLM_SCHEDULER.slot(BACKGROUND_PRIORITY):
+        response = await Settings.llm.acomplete(prompt)
+    return response.text
+
+WARMUPS = WarmupManager(query_session_v2, concurrency=WARMUP_CONCURRENCY)
 
 @app.route('/api/query_session', methods=['POST'])
 async def handle_query_session():
@@ -324,38 +1299,178 @@ async def handle_query_session():
     index_name = data.get("index_name")
     template_key = data.get("template_key")
     file_index = data.get("file_index")
+    scope = data.get("scope", FILE_TEMPLATE_SCOPE)
+    narrate = bool(data.get("narrate", STRUCTURE_NARRATION))
+    if scope not in RETRIEVAL_SCOPES:
+        return jsonify({"error": f"scope must be one of {', '.join(RETRIEVAL_SCOPES)}"}), 400
 
     # --- ADD THIS LOGGING ---
+    touch_index(index_name)
     print(f"\n[SERVER] Received query request for index: {index_name}")
     print(f"[SERVER] Template: {template_key} | File Index: {file_index}")
 
-    async_es_client = AsyncElasticsearch(ES_URL)
-    vector_store = ElasticsearchStore(index_name=index_name, es_client=async_es_client)
-    
     try:
-        templates = load_prompt_templates()
-        selected = templates[template_key]
-        current_prompt = selected["prompt"]
-
-        if file_index is not None:
-            print(f"[SERVER] Fetching file content for indexing...")
-            current_prompt, _ = await apply_file_to_prompt(
-                async_es_client, index_name, selected, current_prompt, file_index
-            )
-
         print("[SERVER] Starting Llama 3 generation via Ollama... (this may take time)")
-        answer = await run_query(vector_store, async_es_client, current_prompt)
+        result = await ES_POOL.run(query_session_v2(index_name, template_key, file_index, scope=scope, narrate=narrate))
         
         print("[SERVER] Query complete! Sending response to frontend.")
         return jsonify({
-            "answer": str(answer),
-            "description": selected["description"]
+            "answer": result["answer"],
+            "description": result["description"],
+            "cache": result["cache"],
+            "context": result.get("context"),
+            "llm": result.get("llm"),
+            "structure": result.get("structure"),
         }), 200
     except Exception as e:
         print(f"[SERVER] ERROR occurred: {str(e)}")
         return jsonify({"error": str(e)}), 500
-    finally:
-        await async_es_client.close()
+
+@app.route('/api/query_session_stream', methods=['POST'])
+def handle_query_session_stream():
+    """
+    Server-Sent Events version of /api/query_session: meta, token..., done
+    (or error). Closing the connection cancels the generation.
+    """
+    data = request.get_json()
+    index_name = data.get("index_name")
+    template_key = data.get("template_key")
+    file_index = data.get("file_index")
+    scope = data.get("scope", FILE_TEMPLATE_SCOPE)
+    narrate = bool(data.get("narrate", STRUCTURE_NARRATION))
+    if scope not in RETRIEVAL_SCOPES:
+        return jsonify({"error": f"scope must be one of {', '.join(RETRIEVAL_SCOPES)}"}), 400
+    touch_index(index_name)
+    print(f"\n[SERVER] Received streaming query for index: {index_name}")
+    print(f"[SERVER] Template: {template_key} | File Index: {file_index}")
+
+    # The pool loop produces events, the response generator below drains them
+    events = queue.Queue()
+
+    def emit(event, payload):
+        events.put((event, payload))
+
+    async def produce():
+        try:
+            await stream_query_session(index_name, template_key, file_index, emit, scope=scope, narrate=narrate)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"[SERVER] ERROR occurred: {str(e)}")
+            emit("error", {"error": str(e)})
+        finally:
+            events.put(None)
+
+    future = ES_POOL.submit(produce())
+
+    def generate():
+        try:
+            while True:
+                try:
+                    item = events.get(timeout=SSE_KEEPALIVE_S)
+                except queue.Empty:
+                    # Comment line; also lets a disconnect surface while waiting
+                    yield ": keep-alive\n\n"
+                    continue
+                if item is None:
+                    break
+                event, payload = item
+                yield f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+        finally:
+            if not future.done():
+                print("[SERVER] Client disconnected, cancelling generation")
+                future.cancel()
+
+    return Response(
+        generate(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.route('/api/warmup_status', methods=['POST'])
+async def handle_warmup_status():
+    data = request.get_json()
+    index_name = data.get("index_name")
+
+    status = WARMUPS.status(index_name)
+    if status is None:
+        return jsonify({"error": f"No warm-up job for '{index_name}'"}), 404
+    return jsonify(status), 200
+
+@app.route('/api/structure', methods=['POST'])
+async def handle_structure():
+    """
+    The structural index of a session: file tree, and per file its line
+    count, classes, functions and imports.
+    """
+    data = request.get_json()
+    index_name = data.get("index_name")
+    touch_index(index_name)
+
+    structure = await asyncio.to_thread(STRUCTURES.load, index_name)
+    if structure is None:
+        return jsonify({"error": f"No structural index for '{index_name}'"}), 404
+    return jsonify({"tree": file_tree(structure), "files": structure["files"], "stats": structure["stats"]}), 200
+
+@app.route('/api/summary_status', methods=['POST'])
+async def handle_summary_status():
+    data = request.get_json()
+    index_name = data.get("index_name")
+
+    status = SUMMARIES.status(index_name)
+    if status is None:
+        return jsonify({"error": f"No summary job for '{index_name}'"}), 404
+    return jsonify(status), 200
+
+async def session_footprint(index_name: str, detailed: bool = False) -> dict:
+    """
+    index_footprint of the index holding index_name. In the shared layout the
+    figures cover the whole shared index and tenant_docs counts this session's
+    chunks. Must run on the ES pool loop.
+    """
+    location = LAYOUT.resolve(index_name)
+    report = await index_footprint(ES_POOL.client, location.index, detailed=detailed)
+    if location.tenant:
+        count = await ES_POOL.client.count(index=location.index, query=location.query(), routing=location.routing)
+        report["tenant"] = location.tenant
+        report["tenant_docs"] = count["count"]
+    return report
+
+@app.route('/api/index_footprint', methods=['POST'])
+async def handle_index_footprint():
+    """
+    On-disk size and estimated vector memory of a session index;
+    "detailed": true adds per-field disk usage (slow on big indices).
+    """
+    data = request.get_json()
+    index_name = data.get("index_name")
+    try:
+        report = await ES_POOL.run(session_footprint(index_name, detailed=bool(data.get("detailed", False))))
+        return jsonify(report), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/health', methods=['GET'])
+async def handle_health():
+    health = await ES_POOL.health()
+    health["llm"] = LLM_SCHEDULER.stats()
+    health["ingest_jobs"] = INGEST_JOBS.stats()
+    health["sessions"] = REAPER.stats()
+    health["snapshots"] = dict(SNAPSHOTS.stats(), coalesced_downloads=SNAPSHOT_DOWNLOADS.coalesced)
+    health["summaries"] = SUMMARY_STORE.stats()
+    status = 200 if health["elasticsearch"]["status"] in ("green", "yellow") else 503
+    return jsonify(health), status
+
+@app.route('/api/reap_sessions', methods=['POST'])
+async def handle_reap_sessions():
+    """
+    Runs a reaper sweep now instead of waiting for the next interval.
+    """
+    try:
+        sweep = await ES_POOL.run(REAPER.sweep())
+        return jsonify(sweep), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
 @app.route('/api/download_github_repo', methods=['POST'])
 def handle_download_github_repo():
@@ -373,9 +1488,9 @@ def handle_download_github_repo():
         return jsonify({"error": "Missing save location"})
 
     try:
-        result = download_github_repo(repo_owner, repo_name, temp_dir)
+        result, download_stats = download_github_repo(repo_owner, repo_name, temp_dir)
 
-        return jsonify({"path": result}), 200
+        return jsonify({"path": result, "download_stats": download_stats}), 200
     
     except KeyError as e:
         return jsonify({"error": str(e)}), 404
@@ -402,7 +1517,7 @@ async def check_repo_exists():
         "X-GitHub-Api-Version": "2022-11-28",
     }
 
-    response = requests.get(github_url, headers=headers)
+    response = GITHUB_DOWNLOADER.session.get(github_url, headers=headers)
 
     if response.status_code == 200:
         return jsonify({"exists": True}), 200
@@ -426,11 +1541,14 @@ async def main():
     unique_index_name = f"{INDEX_PREFIX}_{session_id}"
     
     if choice == "3":
-        async_es_client = AsyncElasticsearch(ES_URL)
+        async_es_client = ES_POOL.client
         vector_store = ElasticsearchStore(index_name=unique_index_name, es_client=async_es_client)
     else:
-        repo_path = input("Path: ") if choice == "1" else download_github_repo(input("Owner: "), input("Repo: "), os.path.join(os.getcwd(), f"repo_{session_id}"))
-        vector_store, async_es_client = await set_up_pipeline(repo_path, unique_index_name)
+        if choice == "1":
+            repo_path = input("Path: ")
+        else:
+            repo_path, _ = download_github_repo(input("Owner: "), input("Repo: "), os.path.join(os.getcwd(), f"repo_{session_id}"))
+        vector_store, async_es_client, _ = await ES_POOL.run(set_up_pipeline(repo_path, unique_index_name))
 
     try:
         templates = json.load(open(PROMPTS_FILE))
@@ -448,27 +1566,31 @@ async def main():
                 selected = templates[template_keys[int(user_input) - 1]]
                 current_prompt = selected["prompt"]
 
-                current_prompt, selected_file = await maybe_select_file(
+                current_prompt, selected_file = await ES_POOL.run(maybe_select_file(
                     async_es_client,
                     unique_index_name,
                     selected,
                     current_prompt
-                )
+                ))
 
                 if current_prompt is None:
                     continue
 
-                answer = await run_query(vector_store, async_es_client, current_prompt)
+                answer = await ES_POOL.run(run_query(vector_store, async_es_client, current_prompt))
                 print(f"\n{'='*20} RESPONSE {'='*20}\n{answer}\n{'='*50}")
 
             except (ValueError, IndexError):
                 print("Invalid selection.")
 
     finally:    
-        await async_es_client.close() 
         print(f"Session {session_id} closed.")
 
 if __name__ == "__main__":
+    set_up_app()
+    # Only the serving process reaps: it alone knows which sessions are still ingesting or
+    # attached to a shared snapshot, anything else importing RAGES would see them all idle
+    if SESSION_REAPER_ENABLED:
+        ES_POOL.loop.call_soon_threadsafe(REAPER.start)
     # try:  
     app.run(debug=True, port=5000, use_reloader=False) 
     #     loop = asyncio.new_event_loop()
@@ -145,6 +145,29 @@ function getSessionPath(choice = "", userInputSessionId = "") {
 
   return { sessionId, fullPath };
 }
+// Polls an ingestion job until it finishes, showing per-stage progress
+async function waitForIngestJob(jobId, statusEl) {
+    while (true) {
+        const res = await fetch('http://127.0.0.1:5000/api/ingest_status', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ job_id: jobId })
+        });
+        const job = await res.json();
+        if (!res.ok) throw new Error(job.error || `HTTP Error: ${res.status}`);
+
+        const p = job.progress;
+        if (job.status === "done") return job.result;
+        if (job.status === "failed") throw new Error(job.error);
+        if (job.status === "cancelled") throw new Error("Indexing was cancelled");
+
+        statusEl.textContent = job.status === "queued"
+            ? "Waiting for another indexing job to finish..."
+            : `Indexing (${p.stage}): ${p.files_read}/${p.files_total} files read, ` +
+              `${p.chunks_produced} chunks, ${p.chunks_embedded} embedded, ${p.docs_written} written`;
+        await new Promise(resolve => setTimeout(resolve, 1000));
+    }
+}
 //
 document.getElementById("backButton2").addEventListener("click", () => showPage('homepage'));
 document.getElementById("loadRepoButton").addEventListener("click", async (event) => {
@@ -176,7 +199,10 @@ document.getElementById("loadRepoButton").addEventListener("click", async (event
                 body: JSON.stringify({ repo_path: repoPathOnServer, session_id: currentSessionId })
             });
             const initData = await initRes.json();
+            if (!initRes.ok) throw new Error(initData.error || `HTTP Error: ${initRes.status}`);
             currentIndexName = initData.index_name;
+            // No job when the repository snapshot was already indexed for another session
+            if (initData.job_id) await waitForIngestJob(initData.job_id, status);
 
             document.getElementById("repo-name-display").textContent = `${owner} / ${repo}`;
             buildPromptList('prompt-select-repo', 'run-btn-repo');
@@ -188,7 +214,13 @@ document.getElementById("loadRepoButton").addEventListener("click", async (event
     }
 });
 
+// Aborting the fetch closes the stream, which cancels generation on the server
+let queryAbort = null;
+
 async function runAnalysis() {
+    if (queryAbort) queryAbort.abort();
+    queryAbort = new AbortController();
+
     const resultsContainer = document.getElementById("results-content");
     const fileSelect = document.getElementById("file-select");
     
@@ -218,26 +250,65 @@ async function runAnalysis() {
             file_index: fileSelect.value !== "" ? parseInt(fileSelect.value) : null
         };
 
-        const response = await fetch('http://127.0.0.1:5000/api/query_session', {
+        const response = await fetch('http://127.0.0.1:5000/api/query_session_stream', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify(payload)
+            body: JSON.stringify(payload),
+            signal: queryAbort.signal
         });
 
         if (!response.ok) throw new Error(`HTTP Error: ${response.status}`);
 
-        const data = await response.json();
-        
-        // 3. Stop timer and show result
+        // 3. Read Server-Sent Events off the body as they arrive
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = "";
+        let answerEl = null;
+
+        const handleEvent = (event, data) => {
+            if (event === "token") {
+                if (!answerEl) {
+                    clearInterval(timerInterval);
+                    resultsContainer.innerHTML = `<div class="answer-box"><pre style="white-space: pre-wrap;"></pre></div>`;
+                    answerEl = resultsContainer.querySelector("pre");
+                }
+                answerEl.textContent += data.text;
+            } else if (event === "done") {
+                console.log(`%c[SUCCESS] First token after ${data.ttft_s}s, finished in ${data.total_s}s.`, "color: green; font-weight: bold;");
+                // Ollama's own count when it reported one, otherwise the server's estimate
+                const promptTokens = data.llm?.prompt_eval_count || data.context?.prompt_tokens;
+                const promptInfo = promptTokens ? ` | Prompt: ${promptTokens} tokens` +
+                    (data.llm?.prompt_eval_s ? ` in ${data.llm.prompt_eval_s}s` : "") : "";
+                resultsContainer.insertAdjacentHTML("beforeend",
+                    `<p style="font-size: 0.8rem; color: #666;">First token: ${data.ttft_s}s | Total: ${data.total_s}s${promptInfo}${data.cache.hit ? " (cached)" : ""}</p>`);
+            } else if (event === "error") {
+                throw new Error(data.error);
+            }
+        };
+
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+
+            let boundary;
+            while ((boundary = buffer.indexOf("\n\n")) !== -1) {
+                const block = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+                let event = "message";
+                let data = "";
+                for (const line of block.split("\n")) {
+                    if (line.startsWith("event: ")) event = line.slice(7);
+                    else if (line.startsWith("data: ")) data += line.slice(6);
+                }
+                if (data) handleEvent(event, JSON.parse(data));
+            }
+        }
         clearInterval(timerInterval);
-        console.log("%c[SUCCESS] Response received from Llama 3.", "color: green; font-weight: bold;");
-        
-        resultsContainer.innerHTML = data.answer 
-            ? `<div class="answer-box"><pre style="white-space: pre-wrap;">${data.answer}</pre></div>` 
-            : `<p class="error">Error: ${data.error}</p>`;
 
     } catch (error) {
         clearInterval(timerInterval);
+        if (error.name === "AbortError") return;
         console.error("[ERROR] Query failed:", error);
         resultsContainer.innerHTML = `<p class="error"><strong>Analysis Failed:</strong> ${error.message}</p>`;
     }
@@ -0,0 +1,110 @@
+'''
+Template answer cache
+
+Answers to template queries are cached by (index name, index version, template
+id, file path, model, retrieval scope). The index version changes on every ingest, so a rebuilt
+index never serves stale answers; invalidate_index() also frees the old entries
+straight away. Entries live in an in-memory LRU and, optionally, a SQLite file
+that survives restarts.
+'''
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class AnswerCache:
+    """
+    LRU cache of template answers with an optional on-disk store.
+    """
+    def __init__(self, max_entries: int = 256, db_path: str | None = None, max_disk_entries: int = 5000):
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._db = None
+        if db_path:
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS answers ("
+                " key TEXT PRIMARY KEY, index_name TEXT, entry TEXT, last_used REAL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS answers_index_name ON answers (index_name)")
+            self._db.commit()
+
+    @staticmethod
+    def make_key(index_name: str, index_version: str, template_id: str, file_path: str | None, model: str, scope: str | None = None) -> str:
+        return json.dumps([index_name, index_version, template_id, file_path, model, scope])
+
+    def get(self, key: str) -> dict | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            elif self._db is not None:
+                row = self._db.execute("SELECT entry FROM answers WHERE key = ?", (key,)).fetchone()
+                if row:
+                    entry = json.loads(row[0])
+                    self._remember(key, entry)
+                    self._db.execute("UPDATE answers SET last_used = ? WHERE key = ?", (time.time(), key))
+                    self._db.commit()
+
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry
+
+    def _remember(self, key: str, entry: dict):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def put(self, key: str, entry: dict):
+        """
+        Stores entry (a JSON-serialisable dict), stamping it with stored_at.
+        """
+        entry = dict(entry, stored_at=time.time())
+        index_name = json.loads(key)[0]
+        with self._lock:
+            self._remember(key, entry)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO answers (key, index_name, entry, last_used) VALUES (?, ?, ?, ?)",
+                    (key, index_name, json.dumps(entry), time.time()),
+                )
+                self._db.execute(
+                    "DELETE FROM answers WHERE key IN ("
+                    " SELECT key FROM answers ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                    (self.max_disk_entries,),
+                )
+                self._db.commit()
+
+    def invalidate_index(self, index_name: str):
+        """
+        Drops every cached answer for index_name, whatever its version.
+        """
+        with self._lock:
+            for key in [k for k in self._entries if json.loads(k)[0] == index_name]:
+                del self._entries[key]
+            if self._db is not None:
+                self._db.execute("DELETE FROM answers WHERE index_name = ?", (index_name,))
+                self._db.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            disk_entries = None
+            if self._db is not None:
+                disk_entries = self._db.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+            return {
+                "entries": len(self._entries),
+                "disk_entries": disk_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
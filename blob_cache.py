@@ -0,0 +1,166 @@
+'''
+Content-addressed blob cache
+
+Stores file contents on disk under their Git blob SHA so repeat downloads of a
+repository only fetch blobs that changed. Cached blobs are hardlinked into
+session folders and evicted least-recently-used once the size budget is hit.
+'''
+import hashlib
+import os
+import shutil
+import threading
+import uuid
+from collections import OrderedDict
+
+
+def git_blob_sha(data):
+    """
+    Computes the SHA git assigns to a blob with this content.
+    """
+    header = f"blob {len(data)}\0".encode()
+    return hashlib.sha1(header + data).hexdigest()
+
+def git_blob_sha_of_file(file_path):
+    size = os.path.getsize(file_path)
+    digest = hashlib.sha1(f"blob {size}\0".encode())
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class BlobCache:
+    """
+    Disk-backed blob store laid out as <root>/<sha[:2]>/<sha[2:]>.
+    Recency is kept in the file mtimes, so LRU order survives restarts.
+    """
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+        os.makedirs(root, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        found = []
+        for prefix in os.listdir(self.root):
+            prefix_dir = os.path.join(self.root, prefix)
+            if len(prefix) != 2 or not os.path.isdir(prefix_dir):
+                continue
+            for rest in os.listdir(prefix_dir):
+                if "." in rest:
+                    continue
+                stat = os.stat(os.path.join(prefix_dir, rest))
+                found.append((stat.st_mtime, prefix + rest, stat.st_size))
+        for _, sha, size in sorted(found):
+            self._entries[sha] = size
+            self._total_bytes += size
+        self._evict()
+
+    def path(self, sha):
+        return os.path.join(self.root, sha[:2], sha[2:])
+
+    def __contains__(self, sha):
+        with self._lock:
+            return sha in self._entries
+
+    def _touch(self, sha):
+        self._entries.move_to_end(sha)
+        try:
+            os.utime(self.path(sha))
+        except FileNotFoundError:
+            pass
+
+    def _add(self, sha, size):
+        self._entries[sha] = size
+        self._total_bytes += size
+        self._evict()
+
+    def _evict(self):
+        while self._total_bytes > self.max_bytes and self._entries:
+            sha, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            self.evicted += 1
+            try:
+                os.remove(self.path(sha))
+            except FileNotFoundError:
+                pass
+
+    def put(self, sha, data):
+        """
+        Stores data under sha, rejecting content that does not hash to it.
+        """
+        if git_blob_sha(data) != sha:
+            raise ValueError(f"Blob content does not match sha {sha}")
+        target = self.path(sha)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        tmp_path = f"{target}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, target)
+        with self._lock:
+            if sha not in self._entries:
+                self._add(sha, len(data))
+
+    def put_file(self, sha, file_path):
+        """
+        Adopts an already written file into the cache by hardlinking it.
+        Returns False when its content does not hash to sha.
+        """
+        if git_blob_sha_of_file(file_path) != sha:
+            return False
+        target = self.path(sha)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        tmp_path = f"{target}.{uuid.uuid4().hex}.tmp"
+        try:
+            os.link(file_path, tmp_path)
+        except OSError:
+            shutil.copyfile(file_path, tmp_path)
+        os.replace(tmp_path, target)
+        with self._lock:
+            if sha not in self._entries:
+                self._add(sha, os.path.getsize(target))
+        return True
+
+    def link_into(self, sha, dest_path, count=True):
+        """
+        Hardlinks the cached blob to dest_path (copying across filesystems).
+        Returns False on a cache miss. count=False keeps the lookup out of the
+        hit/miss counters, for linking blobs that were just stored.
+        """
+        with self._lock:
+            if sha not in self._entries:
+                self.misses += count
+                return False
+            self.hits += count
+            self._touch(sha)
+        os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+        if os.path.lexists(dest_path):
+            os.remove(dest_path)
+        try:
+            os.link(self.path(sha), dest_path)
+        except FileNotFoundError:
+            with self._lock:
+                self._total_bytes -= self._entries.pop(sha, 0)
+                self.hits -= count
+                self.misses += count
+            return False
+        except OSError:
+            shutil.copyfile(self.path(sha), dest_path)
+        return True
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evicted": self.evicted,
+            }
@@ -0,0 +1,293 @@
+'''
+Syntax-aware chunking
+
+Splits source files at symbol boundaries instead of every N tokens: Python with
+the ast module, brace languages (JS/TS, Java, C/C++, Go) by tracking top-level
+and class-level declarations, Markdown by heading. Adjacent small pieces are
+packed together up to max_chars, pieces that are still too big are cut at line
+boundaries, and there is no overlap. Every chunk carries the symbols it covers
+and its 1-based line range.
+'''
+import ast
+import os
+import re
+from typing import Any, List, Sequence
+
+from llama_index.core.node_parser import NodeParser
+from llama_index.core.node_parser.node_utils import build_nodes_from_splits
+from llama_index.core.schema import BaseNode, MetadataMode
+from llama_index.core.utils import get_tqdm_iterable
+from pydantic import Field
+
+BRACE_EXTS = {".js", ".ts", ".java", ".c", ".cpp", ".h", ".hpp", ".go"}
+MARKDOWN_EXTS = {".md"}
+# Line numbers move whenever code above them changes; keep them out of the vectors
+LINE_METADATA_KEYS = ["start_line", "end_line"]
+
+_CONTROL_WORDS = {"if", "for", "while", "switch", "return", "else", "do", "catch", "new", "delete", "case", "sizeof", "throw"}
+
+# Declarations that open a container whose members may start chunks of their own
+_CONTAINER = re.compile(
+    r"^\s*(?:export\s+(?:default\s+)?)?(?:(?:public|private|protected|abstract|final|static|declare)\s+)*"
+    r"(?:class|interface|enum|namespace|struct|union|trait|impl|object)\s+([A-Za-z_$][\w$]*)"
+)
+_DECLARATIONS = [
+    # function foo(...) / export async function foo(...)
+    re.compile(r"^\s*(?:export\s+(?:default\s+)?)?(?:async\s+)?function\s*\*?\s*([A-Za-z_$][\w$]*)"),
+    # const foo = (...) => / const foo = function
+    re.compile(r"^\s*(?:export\s+)?(?:const|let|var)\s+([A-Za-z_$][\w$]*)\s*(?::[^=]+)?=\s*(?:async\s*)?(?:function\b|\([^)]*\)\s*(?::[^=]+)?=>|[A-Za-z_$][\w$]*\s*=>)"),
+    # type Foo = ...
+    re.compile(r"^\s*(?:export\s+)?type\s+([A-Za-z_$][\w$]*)\s*(?:<[^>]*>)?\s*="),
+    # Go: func foo(...) / func (r *T) foo(...)
+    re.compile(r"^func\s+(?:\([^)]*\)\s*)?([A-Za-z_]\w*)"),
+    # C/C++/Java: int foo(...) / static void Bar::baz(...) { -- but not a prototype ending in ;
+    re.compile(r"^\s*(?:template\s*<[^>]*>\s*)?(?:[\w:<>,\*&\[\]]+\s+)+[\*&]*([A-Za-z_~][\w:~]*)\s*\([^;]*$"),
+]
+# Class members without a return type: constructor(...) {, public init() {
+_MEMBER = re.compile(
+    r"^\s*(?:(?:public|private|protected|static|async|get|set|override|readonly|abstract)\s+)*"
+    r"([A-Za-z_$][\w$]*)\s*\([^;]*\)\s*(?::\s*[^{;]+)?\{?\s*$"
+)
+_STRINGS = re.compile(r'"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\'|`(?:\\.|[^`\\])*`')
+_HEADING = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+
+
+def _attach_comments(lines: list, start: int, floor: int, comment_prefixes: tuple) -> int:
+    """
+    Moves a 1-based start line up over the comment/decorator lines directly above it.
+    """
+    while start - 1 > floor and lines[start - 2].lstrip().startswith(comment_prefixes):
+        start -= 1
+    return start
+
+
+def python_boundaries(text: str, max_chars: int) -> list:
+    """
+    (start_line, symbol) for every top-level statement group in a Python file;
+    classes larger than max_chars are opened up into their methods.
+    Raises SyntaxError for files ast cannot parse.
+    """
+    tree = ast.parse(text)
+    lines = text.splitlines()
+    boundaries = []
+
+    def start_of(node):
+        decorators = [d.lineno for d in getattr(node, "decorator_list", [])]
+        return min([node.lineno] + decorators)
+
+    for node in tree.body:
+        start = start_of(node)
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            start = _attach_comments(lines, start, boundaries[-1][0] if boundaries else 0, ("#",))
+            boundaries.append((start, node.name))
+            if isinstance(node, ast.ClassDef):
+                end = node.end_lineno
+                if len("\n".join(lines[start - 1:end])) > max_chars:
+                    for member in node.body:
+                        if isinstance(member, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                            member_start = _attach_comments(lines, start_of(member), boundaries[-1][0], ("#",))
+                            boundaries.append((member_start, f"{node.name}.{member.name}"))
+        elif not boundaries or boundaries[-1][1] is not None:
+            # Consecutive module-level statements (imports, constants) stay together
+            boundaries.append((start, None))
+    return boundaries
+
+
+def _strip_code(line: str, in_block_comment: bool) -> tuple:
+    """
+    Drops string literals and comments from a line so braces can be counted.
+    Returns (code, still_in_block_comment).
+    """
+    code = ""
+    rest = line
+    while rest:
+        if in_block_comment:
+            end = rest.find("*/")
+            if end < 0:
+                return code, True
+            rest = rest[end + 2:]
+            in_block_comment = False
+            continue
+        rest = _STRINGS.sub('""', rest)
+        line_comment = rest.find("//")
+        block_comment = rest.find("/*")
+        if block_comment >= 0 and (line_comment < 0 or block_comment < line_comment):
+            code += rest[:block_comment]
+            rest = rest[block_comment + 2:]
+            in_block_comment = True
+            continue
+        code += rest if line_comment < 0 else rest[:line_comment]
+        break
+    return code, in_block_comment
+
+
+def brace_boundaries(text: str) -> list:
+    """
+    (start_line, symbol) for declarations at the top level or directly inside a
+    class/struct/namespace-like container, found by tracking brace depth.
+    """
+    lines = text.splitlines()
+    boundaries = []
+    # One entry per open brace: the container name, or None for any other block
+    stack = []
+    pending_container = None
+    in_block_comment = False
+
+    for lineno, line in enumerate(lines, start=1):
+        code, in_block_comment = _strip_code(line, in_block_comment)
+        if not code.strip():
+            continue
+
+        if all(name is not None for name in stack):
+            prefix = ".".join(stack)
+            container = _CONTAINER.match(code)
+            symbol = None
+            if container:
+                symbol = container.group(1)
+                pending_container = symbol
+            else:
+                patterns = _DECLARATIONS + ([_MEMBER] if stack else [])
+                for pattern in patterns:
+                    match = pattern.match(code)
+                    if match and match.group(1) not in _CONTROL_WORDS:
+                        symbol = match.group(1)
+                        break
+            if symbol:
+                start = _attach_comments(lines, lineno, boundaries[-1][0] if boundaries else 0, ("//", "/*", "*", "@"))
+                boundaries.append((start, f"{prefix}.{symbol}" if prefix else symbol))
+
+        for char in code:
+            if char == "{":
+                stack.append(pending_container)
+                pending_container = None
+            elif char == "}":
+                if stack:
+                    stack.pop()
+            elif char == ";" and pending_container is not None:
+                # Forward declaration, no body follows
+                pending_container = None
+    return boundaries
+
+
+def markdown_boundaries(text: str) -> list:
+    boundaries = []
+    in_fence = False
+    for lineno, line in enumerate(text.splitlines(), start=1):
+        if line.lstrip().startswith(("```", "~~~")):
+            in_fence = not in_fence
+            continue
+        match = None if in_fence else _HEADING.match(line)
+        if match:
+            boundaries.append((lineno, match.group(2)))
+    return boundaries
+
+
+def split_source(text: str, ext: str, max_chars: int) -> list:
+    """
+    Splits a file into chunks of at most max_chars.
+    Returns a list of (text, start_line, end_line, symbols).
+    """
+    lines = text.splitlines()
+    if not lines:
+        return []
+
+    boundaries = []
+    if ext == ".py":
+        try:
+            boundaries = python_boundaries(text, max_chars)
+        except (SyntaxError, ValueError):
+            boundaries = []
+    elif ext in BRACE_EXTS:
+        boundaries = brace_boundaries(text)
+    elif ext in MARKDOWN_EXTS:
+        boundaries = markdown_boundaries(text)
+
+    # Anything before the first boundary is a preamble segment of its own
+    if not boundaries or boundaries[0][0] > 1:
+        boundaries.insert(0, (1, None))
+
+    segments = []
+    for i, (start, symbol) in enumerate(boundaries):
+        end = boundaries[i + 1][0] - 1 if i + 1 < len(boundaries) else len(lines)
+        if end >= start:
+            segments.extend(_cut_lines(lines, start, end, symbol, max_chars))
+    return _pack(lines, segments, max_chars)
+
+
+def _cut_lines(lines: list, start: int, end: int, symbol, max_chars: int) -> list:
+    """
+    Cuts an oversized segment at line boundaries; single lines longer than
+    max_chars become pieces of their own (and are split by _pack).
+    """
+    segments = []
+    piece_start, size = start, 0
+    for lineno in range(start, end + 1):
+        line_size = len(lines[lineno - 1]) + 1
+        if size and size + line_size > max_chars:
+            segments.append((piece_start, lineno - 1, symbol))
+            piece_start, size = lineno, 0
+        size += line_size
+    segments.append((piece_start, end, symbol))
+    return segments
+
+
+def _pack(lines: list, segments: list, max_chars: int) -> list:
+    """
+    Merges adjacent segments while they fit in max_chars.
+    """
+    chunks = []
+    current = None
+    for start, end, symbol in segments:
+        text = "\n".join(lines[start - 1:end])
+        if current and len(current[0]) + 1 + len(text) <= max_chars:
+            symbols = current[3] + ([symbol] if symbol and symbol not in current[3] else [])
+            current = (current[0] + "\n" + text, current[1], end, symbols)
+            continue
+        if current:
+            chunks.append(current)
+        current = (text, start, end, [symbol] if symbol else [])
+    if current:
+        chunks.append(current)
+
+    result = []
+    for text, start, end, symbols in chunks:
+        if not text.strip():
+            continue
+        # A single line longer than max_chars (minified code, data) is split by characters
+        for offset in range(0, len(text), max_chars):
+            result.append((text[offset:offset + max_chars], start, end, symbols))
+    return result
+
+
+class CodeNodeParser(NodeParser):
+    """
+    Node parser that chunks source files along syntax boundaries, see
+    split_source. Adds "symbols", "start_line" and "end_line" metadata.
+    """
+    max_chars: int = Field(default=2000, description="Maximum characters per chunk.", gt=0)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CodeNodeParser"
+
+    def _parse_nodes(self, nodes: Sequence[BaseNode], show_progress: bool = False, **kwargs: Any) -> List[BaseNode]:
+        all_nodes = []
+        for node in get_tqdm_iterable(nodes, show_progress, "Parsing nodes"):
+            file_path = node.metadata.get("file_path") or node.metadata.get("file_name") or ""
+            ext = os.path.splitext(file_path)[1].lower()
+            chunks = split_source(node.get_content(metadata_mode=MetadataMode.NONE), ext, self.max_chars)
+            if not chunks:
+                continue
+
+            split_nodes = build_nodes_from_splits([chunk[0] for chunk in chunks], node, id_func=self.id_func)
+            for split_node, (_, start_line, end_line, symbols) in zip(split_nodes, chunks):
+                split_node.metadata["symbols"] = ", ".join(symbols)
+                split_node.metadata["start_line"] = start_line
+                split_node.metadata["end_line"] = end_line
+                # A fresh list, the split nodes share the document's by default
+                split_node.excluded_embed_metadata_keys = [
+                    *split_node.excluded_embed_metadata_keys,
+                    *(key for key in LINE_METADATA_KEYS if key not in split_node.excluded_embed_metadata_keys),
+                ]
+            all_nodes.extend(split_nodes)
+        return all_nodes
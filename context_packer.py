@@ -0,0 +1,213 @@
+'''
+Token-budgeted context packing
+
+Builds the context of a template query under a token budget counted with the
+LLM's own tokenizer (or a characters-per-token estimate when it cannot be
+loaded). For file templates the selected file's sections (its indexed chunks)
+are ranked and the most relevant ones that fit its share of the budget are
+kept, in file order; retrieved chunks fill the rest, best first,
+skipping any that repeat text already in the context. LLMUsage records the
+prompt token counts and prompt evaluation time Ollama reports for each call.
+'''
+import contextvars
+import hashlib
+import math
+import re
+
+from llama_index.core.instrumentation.event_handlers import BaseEventHandler
+from llama_index.core.instrumentation.events.llm import LLMChatEndEvent
+from llama_index.core.schema import MetadataMode, NodeWithScore, TextNode
+
+_WORD = re.compile(r"[A-Za-z_][A-Za-z0-9_]{2,}")
+# Prompt words that say nothing about which part of a file matters
+_STOPWORDS = {
+    "the", "and", "for", "with", "that", "this", "are", "from", "not", "its", "you", "your",
+    "using", "only", "retrieved", "repository", "context", "explain", "file", "files", "should",
+    "what", "how", "when", "where", "who", "why", "does", "into", "any", "each", "all",
+}
+
+
+class TokenCounter:
+    """
+    Counts tokens with a Hugging Face tokenizer, or estimates them at
+    chars_per_token when none is given.
+    """
+    def __init__(self, tokenizer=None, name: str = "heuristic", chars_per_token: float = 3.5):
+        self.tokenizer = tokenizer
+        self.name = name
+        self.chars_per_token = chars_per_token
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        if self.tokenizer is not None:
+            return len(self.tokenizer.encode(text, add_special_tokens=False))
+        return math.ceil(len(text) / self.chars_per_token)
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        if self.count(text) <= max_tokens:
+            return text
+        if self.tokenizer is not None:
+            ids = self.tokenizer.encode(text, add_special_tokens=False)[:max_tokens]
+            return self.tokenizer.decode(ids)
+        return text[:int(max_tokens * self.chars_per_token)]
+
+
+def load_token_counter(tokenizer_name: str | None, chars_per_token: float = 3.5) -> TokenCounter:
+    """
+    TokenCounter for tokenizer_name, falling back to the estimate when
+    transformers is missing or the tokenizer cannot be downloaded (gated
+    models need a Hugging Face token).
+    """
+    if tokenizer_name:
+        try:
+            from transformers import AutoTokenizer
+
+            return TokenCounter(AutoTokenizer.from_pretrained(tokenizer_name), name=tokenizer_name)
+        except Exception as e:
+            print(f"Could not load tokenizer '{tokenizer_name}' ({e}), estimating {chars_per_token} characters per token")
+    return TokenCounter(chars_per_token=chars_per_token)
+
+
+def _terms(text: str) -> set:
+    return {word.lower() for word in _WORD.findall(text)} - _STOPWORDS
+
+
+def _fingerprint(text: str) -> str:
+    return hashlib.sha1(" ".join(text.split()).encode()).hexdigest()
+
+
+def rank_sections(sections: list, question: str) -> list:
+    """
+    Section indices, most relevant first: overlap with the question's words,
+    sections that define something, and the file's opening section (imports,
+    module docstring) score higher.
+    """
+    question_terms = _terms(question)
+
+    def score(i):
+        section = sections[i]
+        terms = _terms(section.text) | _terms(section.metadata.get("symbols", ""))
+        overlap = len(question_terms & terms) / (len(question_terms) or 1)
+        return overlap + (0.5 if section.metadata.get("symbols") else 0.0) + (1.0 if i == 0 else 0.0)
+
+    return sorted(range(len(sections)), key=lambda i: (-score(i), i))
+
+
+def _overlaps(node, section) -> bool:
+    meta, other = node.metadata, section.metadata
+    if meta.get("file_path") != other.get("file_path") or meta.get("start_line") is None:
+        return False
+    return int(meta["start_line"]) <= other["end_line"] and int(meta["end_line"]) >= other["start_line"]
+
+
+class ContextPacker:
+    """
+    Chooses the nodes of one query's context under a token budget.
+    """
+    def __init__(self, counter: TokenCounter):
+        self.counter = counter
+
+    def tokens(self, node) -> int:
+        return self.counter.count(node.get_content(metadata_mode=MetadataMode.LLM))
+
+    def pack(self, question: str, retrieved: list, sections: list | None, budget: int, file_share: float = 0.7) -> tuple:
+        """
+        Returns (nodes, report). nodes are NodeWithScore, file sections first
+        in file order, then retrieved chunks in rank order.
+        """
+        # Copied, as a section cut down to fit replaces its entry
+        sections = list(sections or [])
+        report = {
+            "budget": budget,
+            "file_sections": {"total": len(sections), "kept": 0, "tokens": 0},
+            "chunks": {"retrieved": len(retrieved), "kept": 0, "duplicates": 0, "over_budget": 0, "tokens": 0},
+        }
+
+        kept_sections, used = [], 0
+        file_budget = int(budget * file_share) if sections else 0
+        for i in rank_sections(sections, question):
+            cost = self.tokens(sections[i])
+            if used + cost <= file_budget:
+                kept_sections.append(i)
+                used += cost
+            elif not kept_sections:
+                # Not even the best section fits whole; keep as much of it as does
+                section = sections[i]
+                overhead = cost - self.counter.count(section.text)
+                text = self.counter.truncate(section.text, max(0, file_budget - overhead))
+                sections[i] = TextNode(text=text, metadata=dict(section.metadata), excluded_llm_metadata_keys=section.excluded_llm_metadata_keys)
+                kept_sections.append(i)
+                used += self.tokens(sections[i])
+        kept_sections.sort()
+        report["file_sections"].update(kept=len(kept_sections), tokens=used)
+
+        nodes = [NodeWithScore(node=sections[i], score=None) for i in kept_sections]
+        seen = {_fingerprint(node.node.get_content()) for node in nodes}
+        chunk_tokens = 0
+        for result in retrieved:
+            text = result.node.get_content()
+            duplicate = _fingerprint(text) in seen or any(
+                _overlaps(result.node, sections[i]) or text.strip() in sections[i].text for i in kept_sections
+            )
+            if duplicate:
+                report["chunks"]["duplicates"] += 1
+                continue
+            cost = self.tokens(result.node)
+            if used + cost > budget:
+                report["chunks"]["over_budget"] += 1
+                continue
+            nodes.append(result)
+            seen.add(_fingerprint(text))
+            used += cost
+            chunk_tokens += cost
+        report["chunks"].update(kept=len(nodes) - len(kept_sections), tokens=chunk_tokens)
+        report["context_tokens"] = used
+        return nodes, report
+
+
+    def prompt_tokens(self, template, question: str, nodes: list, llm=None) -> int:
+        """
+        Tokens of the QA prompt a compact response synthesizer sends for nodes.
+        """
+        context = "\n\n".join(node.node.get_content(metadata_mode=MetadataMode.LLM) for node in nodes)
+        return self.counter.count(template.format(llm=llm, context_str=context, query_str=question))
+
+
+_CURRENT_USAGE = contextvars.ContextVar("codemap_llm_usage", default=None)
+
+
+def track_llm_usage() -> dict:
+    """
+    Starts collecting LLM usage for the current task; returns the dict that
+    LLMUsage fills in as calls finish.
+    """
+    usage = {"calls": 0, "prompt_eval_count": 0, "prompt_eval_s": 0.0, "eval_count": 0, "eval_s": 0.0}
+    _CURRENT_USAGE.set(usage)
+    return usage
+
+
+class LLMUsage(BaseEventHandler):
+    """
+    Adds the token counts and durations from Ollama's final response of each
+    call to the dict of the task that made it (see track_llm_usage).
+    Register once on the root instrumentation dispatcher.
+    """
+    @classmethod
+    def class_name(cls) -> str:
+        return "LLMUsage"
+
+    def handle(self, event, **kwargs):
+        # Ollama completes through chat, so chat end events see every call once,
+        # streamed or not (the last streamed chunk carries the counts)
+        usage = _CURRENT_USAGE.get()
+        if usage is None or not isinstance(event, LLMChatEndEvent) or event.response is None:
+            return
+        raw = event.response.raw
+        if not raw or "prompt_eval_count" not in raw:
+            return
+        usage["calls"] += 1
+        usage["prompt_eval_count"] += raw.get("prompt_eval_count") or 0
+        usage["prompt_eval_s"] = round(usage["prompt_eval_s"] + (raw.get("prompt_eval_duration") or 0) / 1e9, 3)
+        usage["eval_count"] += raw.get("eval_count") or 0
+        usage["eval_s"] = round(usage["eval_s"] + (raw.get("eval_duration") or 0) / 1e9, 3)
@@ -0,0 +1,158 @@
+'''
+Persistent embedding cache
+
+Chunk embeddings are stored in one fixed-size binary file per embedding model,
+keyed by a hash of (model name, chunk text). The file is memory-mapped, so
+lookups read straight from the page cache and nothing is parsed at start-up
+beyond the key column. When the file is full the least recently used entries
+are overwritten.
+'''
+import hashlib
+import os
+import re
+import threading
+from typing import Any, List
+
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from pydantic import PrivateAttr
+
+
+def embedding_key(model_name: str, text: str) -> bytes:
+    return hashlib.sha256(f"{model_name}\0{text}".encode("utf-8")).digest()
+
+
+class EmbeddingStore:
+    """
+    Fixed-capacity memory-mapped table of (key, last_used, vector) records.
+    An all-zero key marks a free slot.
+    """
+    def __init__(self, root: str, model_name: str, dims: int, capacity: int):
+        self.model_name = model_name
+        self.dims = dims
+        self.capacity = capacity
+        self.dtype = np.dtype([("key", "u1", (32,)), ("tick", "<u8"), ("vector", "<f4", (dims,))])
+        os.makedirs(root, exist_ok=True)
+        safe_name = re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name)
+        self.path = os.path.join(root, f"{safe_name}-{dims}d-{capacity}.bin")
+
+        self._lock = threading.Lock()
+        expected_size = self.dtype.itemsize * capacity
+        if os.path.exists(self.path) and os.path.getsize(self.path) == expected_size:
+            self._table = np.memmap(self.path, dtype=self.dtype, mode="r+", shape=(capacity,))
+        else:
+            self._table = np.memmap(self.path, dtype=self.dtype, mode="w+", shape=(capacity,))
+
+        keys = self._table["key"]
+        used = np.flatnonzero(keys.any(axis=1))
+        self._slots = {keys[i].tobytes(): int(i) for i in used}
+        self._free = sorted(set(range(capacity)) - set(self._slots.values()), reverse=True)
+        self._tick = int(self._table["tick"].max()) if capacity else 0
+
+    def __len__(self):
+        return len(self._slots)
+
+    def get_many(self, keys: List[bytes]) -> dict:
+        """
+        Returns {key: vector} for the keys present in the store.
+        """
+        found = {}
+        with self._lock:
+            self._tick += 1
+            for key in keys:
+                slot = self._slots.get(key)
+                if slot is not None:
+                    self._table["tick"][slot] = self._tick
+                    found[key] = self._table["vector"][slot].tolist()
+        return found
+
+    def _allocate(self, count: int) -> List[int]:
+        slots = [self._free.pop() for _ in range(min(count, len(self._free)))]
+        if len(slots) < count:
+            ticks = self._table["tick"].copy()
+            ticks[slots] = np.iinfo(np.uint64).max
+            victims = np.argpartition(ticks, count - len(slots) - 1)[:count - len(slots)]
+            for slot in victims.tolist():
+                self._slots.pop(self._table["key"][slot].tobytes(), None)
+                slots.append(slot)
+        return slots
+
+    def put_many(self, items: dict):
+        """
+        Stores {key: vector}, evicting the least recently used entries if full.
+        """
+        with self._lock:
+            items = {k: v for k, v in items.items() if k not in self._slots}
+            if not items or not self.capacity:
+                return
+            items = dict(list(items.items())[-self.capacity:])
+            self._tick += 1
+            for slot, (key, vector) in zip(self._allocate(len(items)), items.items()):
+                self._table["key"][slot] = np.frombuffer(key, dtype=np.uint8)
+                self._table["tick"][slot] = self._tick
+                self._table["vector"][slot] = vector
+                self._slots[key] = slot
+
+    def flush(self):
+        with self._lock:
+            self._table.flush()
+
+
+class CachedEmbedding(BaseEmbedding):
+    """
+    Wraps an embedding model so chunk (text) embeddings are served from an
+    EmbeddingStore when possible. Query embeddings always go to the model.
+    Keys use the store's model name, which should identify the backend too.
+    """
+    _inner: BaseEmbedding = PrivateAttr()
+    _store: EmbeddingStore = PrivateAttr()
+    _hits: int = PrivateAttr(default=0)
+    _misses: int = PrivateAttr(default=0)
+
+    def __init__(self, inner: BaseEmbedding, store: EmbeddingStore, embed_batch_size: int = 100, **kwargs: Any):
+        super().__init__(model_name=inner.model_name, embed_batch_size=embed_batch_size, **kwargs)
+        self._inner = inner
+        self._store = store
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CachedEmbedding"
+
+    def counters(self) -> dict:
+        return {"hits": self._hits, "misses": self._misses, "entries": len(self._store)}
+
+    def flush(self):
+        self._store.flush()
+
+    def _lookup(self, texts: List[str]):
+        keys = [embedding_key(self._store.model_name, text) for text in texts]
+        found = self._store.get_many(keys)
+        missing = [i for i, key in enumerate(keys) if key not in found]
+        self._hits += len(texts) - len(missing)
+        self._misses += len(missing)
+        return keys, found, missing
+
+    def _merge(self, keys, found, missing, computed) -> List[List[float]]:
+        new_items = {keys[i]: vector for i, vector in zip(missing, computed)}
+        self._store.put_many(new_items)
+        found.update(new_items)
+        return [found[key] for key in keys]
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._inner.get_query_embedding(query)
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return await self._inner.aget_query_embedding(query)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._get_text_embeddings([text])[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        keys, found, missing = self._lookup(texts)
+        computed = self._inner.get_text_embedding_batch([texts[i] for i in missing]) if missing else []
+        return self._merge(keys, found, missing, computed)
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        keys, found, missing = self._lookup(texts)
+        computed = await self._inner.aget_text_embedding_batch([texts[i] for i in missing]) if missing else []
+        return self._merge(keys, found, missing, computed)
@@ -0,0 +1,225 @@
+'''
+CPU embedding engine
+
+Embeds ingestion chunks in length-sorted batches (similar lengths share a batch,
+so little compute is spent on padding) spread over a pool of worker processes,
+each holding its own copy of the model. Query embeddings stay in-process.
+'''
+import asyncio
+import multiprocessing
+import os
+import re
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, List
+
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from pydantic import PrivateAttr
+
+# Model instance owned by each worker process, set by _init_worker
+_WORKER_MODEL = None
+
+
+EMBED_BACKENDS = ("torch", "int8", "onnx")
+ONNX_EXPORT_DIR = "/tmp/CodeMap-cache/onnx"
+
+
+def _load_int8_model(model_name: str, batch_size: int) -> BaseEmbedding:
+    """
+    Full-precision model with its Linear layers dynamically quantized to int8.
+    """
+    import torch
+    from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+
+    embed_model = HuggingFaceEmbedding(model_name=model_name, embed_batch_size=batch_size, device="cpu")
+    embed_model._model = torch.quantization.quantize_dynamic(
+        embed_model._model, {torch.nn.Linear}, dtype=torch.qint8
+    )
+    return embed_model
+
+def _load_onnx_model(model_name: str, batch_size: int) -> BaseEmbedding:
+    """
+    ONNX Runtime model, exported from the Hugging Face checkpoint on first use.
+    """
+    try:
+        from llama_index.embeddings.huggingface_optimum import OptimumEmbedding
+    except ImportError as e:
+        raise ImportError(
+            "The onnx embedding backend needs `pip install llama-index-embeddings-huggingface-optimum`"
+        ) from e
+
+    export_dir = os.path.join(ONNX_EXPORT_DIR, re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name))
+    if not os.path.exists(os.path.join(export_dir, "model.onnx")):
+        OptimumEmbedding.create_and_save_optimum_model(model_name, export_dir)
+    # sentence-transformers checkpoints are trained with mean pooling and normalized outputs
+    return OptimumEmbedding(folder_name=export_dir, pooling="mean", normalize=True, embed_batch_size=batch_size)
+
+def load_embed_model(model_name: str, batch_size: int = 32, backend: str = "torch") -> BaseEmbedding:
+    """
+    Loads model_name on CPU with the given backend:
+    "torch" (full precision), "int8" (dynamically quantized) or "onnx" (ONNX Runtime).
+    """
+    if backend == "int8":
+        return _load_int8_model(model_name, batch_size)
+    if backend == "onnx":
+        return _load_onnx_model(model_name, batch_size)
+    if backend != "torch":
+        raise ValueError(f"Unknown embedding backend '{backend}'. Available: {list(EMBED_BACKENDS)}")
+
+    from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+
+    return HuggingFaceEmbedding(model_name=model_name, embed_batch_size=batch_size, device="cpu")
+
+def check_embedding_dims(embed_model: BaseEmbedding, dims: int):
+    """
+    Raises if the model does not produce vectors of the size the index maps.
+    """
+    produced = len(embed_model.get_text_embedding("dimension check"))
+    if produced != dims:
+        raise ValueError(f"Embedding model produces {produced}-dim vectors, the index expects {dims}")
+
+def _init_worker(model_name: str, batch_size: int, threads: int, backend: str):
+    global _WORKER_MODEL
+    import torch
+
+    # Split the cores between workers instead of every worker grabbing all of them
+    torch.set_num_threads(threads)
+    _WORKER_MODEL = load_embed_model(model_name, batch_size, backend)
+
+def _embed_batch(texts: List[str]):
+    start = time.perf_counter()
+    vectors = _WORKER_MODEL.get_text_embedding_batch(texts)
+    return os.getpid(), vectors, time.perf_counter() - start
+
+def length_sorted_batches(texts: List[str], batch_size: int) -> List[List[int]]:
+    """
+    Groups text indices into batches of similar length.
+    """
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    return [order[i:i + batch_size] for i in range(0, len(order), batch_size)]
+
+
+class ParallelEmbedding(BaseEmbedding):
+    """
+    Text embeddings fan out over `workers` processes in length-sorted batches of
+    `batch_size`; with workers <= 1 the batches run on local_model in-process.
+    Query embeddings always use local_model. Workers load `backend`, which
+    should match how local_model was loaded.
+    """
+    _local_model: BaseEmbedding = PrivateAttr()
+    _workers: int = PrivateAttr()
+    _batch_size: int = PrivateAttr()
+    _backend: str = PrivateAttr()
+    _executor: Any = PrivateAttr(default=None)
+    _lock: Any = PrivateAttr()
+    _worker_stats: dict = PrivateAttr()
+
+    def __init__(self, local_model: BaseEmbedding, workers: int = 1, batch_size: int = 32, backend: str = "torch", **kwargs: Any):
+        # Hand whole ingest batches to _get_text_embeddings so sorting and fan-out see all of them
+        kwargs.setdefault("embed_batch_size", batch_size * max(workers, 1) * 8)
+        super().__init__(model_name=local_model.model_name, **kwargs)
+        self._local_model = local_model
+        self._workers = workers
+        self._batch_size = batch_size
+        self._backend = backend
+        self._lock = threading.Lock()
+        self._worker_stats = {}
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "ParallelEmbedding"
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                threads = max(1, (os.cpu_count() or 1) // self._workers)
+                # Spawned workers re-import the parent's __main__ module before _init_worker
+                # runs, so the app's own setup must stay out of its import-time code
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self._workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(self.model_name, self._batch_size, threads, self._backend),
+                )
+            return self._executor
+
+    def close(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    def _record(self, worker, count: int, seconds: float):
+        with self._lock:
+            stats = self._worker_stats.setdefault(worker, {"chunks": 0, "seconds": 0.0})
+            stats["chunks"] += count
+            stats["seconds"] += seconds
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {worker: dict(s) for worker, s in self._worker_stats.items()}
+
+    def worker_stats(self, since: dict | None = None) -> dict:
+        """
+        Chunks embedded, busy seconds and chunks/s per worker, counted from
+        an earlier snapshot() when one is given.
+        """
+        since = since or {}
+        report = {}
+        for worker, s in self.snapshot().items():
+            base = since.get(worker, {"chunks": 0, "seconds": 0.0})
+            chunks = s["chunks"] - base["chunks"]
+            seconds = s["seconds"] - base["seconds"]
+            if chunks:
+                report[str(worker)] = {
+                    "chunks": chunks,
+                    "seconds": round(seconds, 3),
+                    "chunks_per_s": round(chunks / seconds, 1) if seconds else None,
+                }
+        return report
+
+    def _embed_local(self, texts: List[str]):
+        start = time.perf_counter()
+        vectors = self._local_model.get_text_embedding_batch(texts)
+        return "local", vectors, time.perf_counter() - start
+
+    def _collect(self, texts, batches, results) -> List[List[float]]:
+        embeddings = [None] * len(texts)
+        for batch, (worker, vectors, seconds) in zip(batches, results):
+            self._record(worker, len(batch), seconds)
+            for i, vector in zip(batch, vectors):
+                embeddings[i] = vector
+        return embeddings
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._local_model.get_query_embedding(query)
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return await asyncio.to_thread(self._local_model.get_query_embedding, query)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._get_text_embeddings([text])[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        batches = length_sorted_batches(texts, self._batch_size)
+        if self._workers <= 1:
+            results = [self._embed_local([texts[i] for i in batch]) for batch in batches]
+        else:
+            executor = self._get_executor()
+            futures = [executor.submit(_embed_batch, [texts[i] for i in batch]) for batch in batches]
+            results = [future.result() for future in futures]
+        return self._collect(texts, batches, results)
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        # Runs off the event loop so queries are not blocked behind ingestion
+        batches = length_sorted_batches(texts, self._batch_size)
+        if self._workers <= 1:
+            results = [await asyncio.to_thread(self._embed_local, [texts[i] for i in batch]) for batch in batches]
+        else:
+            executor = self._get_executor()
+            results = await asyncio.gather(*[
+                asyncio.wrap_future(executor.submit(_embed_batch, [texts[i] for i in batch]))
+                for batch in batches
+            ])
+        return self._collect(texts, batches, results)
@@ -0,0 +1,125 @@
+'''
+Elasticsearch bulk-load profile
+
+While an index is being loaded it runs with refresh disabled and no replicas,
+and chunks go in through BulkWriter: fixed-size bulk requests, several in
+flight at once, none of them forcing a refresh. When the load ends the
+settings the index had before are put back, the index is refreshed once and, optionally,
+force-merged down to a few segments. Shared indices (see index_layout) serve
+other sessions while one loads, so only the closing refresh applies to them.
+'''
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
+from llama_index.core.schema import MetadataMode
+from llama_index.core.vector_stores.utils import node_to_metadata_dict
+
+BULK_LOAD_SETTINGS = {"refresh_interval": "-1", "number_of_replicas": 0}
+
+
+async def current_settings(async_es_client, index_name: str, names=tuple(BULK_LOAD_SETTINGS)) -> dict:
+    """
+    The index's own values of the given settings; None for those left at the
+    cluster default, which is what putting None restores.
+    """
+    response = await async_es_client.indices.get_settings(index=index_name, name=[f"index.{name}" for name in names], flat_settings=True)
+    values = next(iter(response.values()), {}).get("settings", {})
+    return {name: values.get(f"index.{name}") for name in names}
+
+
+class BulkWriter:
+    """
+    Drop-in for ElasticsearchStore.async_add that splits nodes into bulk
+    requests of chunk_size documents and sends up to `parallel` at a time,
+    without refreshing the index after each one. routing is sent as the bulk
+    request's default routing, which keeps a tenant's chunks on one shard.
+    """
+    def __init__(self, vector_store, chunk_size: int = 500, parallel: int = 4, max_chunk_bytes: int = 50 * 1024**2, routing: str | None = None):
+        self.vector_store = vector_store
+        self.chunk_size = chunk_size
+        self.max_chunk_bytes = max_chunk_bytes
+        self.routing = routing
+        self._semaphore = asyncio.Semaphore(parallel)
+        self.parallel = parallel
+        self.docs = 0
+        self.requests = 0
+        self.seconds = 0.0
+
+    async def _bulk(self, nodes):
+        store = self.vector_store._store
+        bulk_kwargs = {"chunk_size": self.chunk_size, "max_chunk_bytes": self.max_chunk_bytes}
+        if self.routing:
+            bulk_kwargs["routing"] = self.routing
+        async with self._semaphore:
+            await store.add_texts(
+                texts=[node.get_content(metadata_mode=MetadataMode.NONE) for node in nodes],
+                metadatas=[node_to_metadata_dict(node, remove_text=True) for node in nodes],
+                vectors=[node.get_embedding() for node in nodes],
+                ids=[node.node_id for node in nodes],
+                refresh_indices=False,
+                create_index_if_not_exists=False,
+                bulk_kwargs=bulk_kwargs,
+            )
+            self.requests += 1
+
+    async def async_add(self, nodes) -> list:
+        if not nodes:
+            return []
+        if not self.vector_store._store.num_dimensions:
+            self.vector_store._store.num_dimensions = len(nodes[0].get_embedding())
+
+        started = time.perf_counter()
+        await asyncio.gather(*(
+            self._bulk(nodes[start:start + self.chunk_size])
+            for start in range(0, len(nodes), self.chunk_size)
+        ))
+        self.seconds += time.perf_counter() - started
+        self.docs += len(nodes)
+        return [node.node_id for node in nodes]
+
+    def stats(self) -> dict:
+        return {
+            "docs": self.docs,
+            "bulk_requests": self.requests,
+            "chunk_size": self.chunk_size,
+            "parallel": self.parallel,
+            "write_s": round(self.seconds, 2),
+            "docs_per_s": round(self.docs / self.seconds, 1) if self.seconds else None,
+        }
+
+
+@asynccontextmanager
+async def bulk_load_profile(async_es_client, index_name: str, live_settings: dict | None = None, force_merge_segments: int | None = None, stats: dict | None = None, apply_settings: bool = True):
+    """
+    Switches index_name to BULK_LOAD_SETTINGS for the duration of the block.
+    live_settings (by default the index's settings before the switch) are
+    restored and the index refreshed even if the load fails;
+    the optional force-merge only runs after a successful load. With
+    apply_settings=False (an index already serving queries) the settings
+    and the merge are left alone and only the refresh happens. Timings are
+    written to stats if given.
+    """
+    stats = stats if stats is not None else {}
+    if apply_settings:
+        if live_settings is None:
+            live_settings = await current_settings(async_es_client, index_name)
+        await async_es_client.indices.put_settings(index=index_name, settings=BULK_LOAD_SETTINGS)
+    succeeded = False
+    try:
+        yield
+        succeeded = True
+    finally:
+        started = time.perf_counter()
+        if apply_settings:
+            await async_es_client.indices.put_settings(index=index_name, settings=live_settings)
+        await async_es_client.indices.refresh(index=index_name)
+        stats["restore_s"] = round(time.perf_counter() - started, 2)
+
+        if succeeded and apply_settings and force_merge_segments:
+            started = time.perf_counter()
+            # Merging can take far longer than an ordinary request
+            await async_es_client.options(request_timeout=3600).indices.forcemerge(
+                index=index_name, max_num_segments=force_merge_segments
+            )
+            stats["force_merge_s"] = round(time.perf_counter() - started, 2)
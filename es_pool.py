@@ -0,0 +1,105 @@
+'''
+Shared Elasticsearch clients
+
+One sync and one async client live for the whole process, so connections are
+kept alive and reused across requests. aiohttp sessions belong to the event loop
+that created them, while every Flask async view runs on a loop of its own, so
+the async client is bound to a dedicated background loop and coroutines that
+use it are submitted there with run().
+'''
+import asyncio
+import threading
+import time
+
+from elasticsearch import AsyncElasticsearch, Elasticsearch
+
+
+class ElasticsearchPool:
+    """
+    Long-lived, connection-pooled sync and async clients for one cluster.
+    """
+    def __init__(self, url, connections_per_node=10, request_timeout=30, max_retries=3, retry_on_timeout=True):
+        self.url = url
+        self.config = {
+            "connections_per_node": connections_per_node,
+            "request_timeout": request_timeout,
+            "max_retries": max_retries,
+            "retry_on_timeout": retry_on_timeout,
+        }
+        self.sync = Elasticsearch(url, **self.config)
+        self.client = AsyncElasticsearch(url, **self.config)
+
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="es-pool-loop", daemon=True)
+        self._thread.start()
+
+        self._lock = threading.Lock()
+        self._started = time.time()
+        self._counters = {"submitted": 0, "completed": 0, "failed": 0, "cancelled": 0}
+
+    @property
+    def loop(self):
+        return self._loop
+
+    def _on_done(self, future):
+        with self._lock:
+            if future.cancelled():
+                self._counters["cancelled"] += 1
+            elif future.exception() is not None:
+                self._counters["failed"] += 1
+            else:
+                self._counters["completed"] += 1
+
+    def submit(self, coro):
+        """
+        Schedules coro on the pool loop from any thread, returns a concurrent Future.
+        """
+        with self._lock:
+            self._counters["submitted"] += 1
+        future = asyncio.run_coroutine_threadsafe(coro, self._loop)
+        future.add_done_callback(self._on_done)
+        return future
+
+    async def run(self, coro):
+        """
+        Awaits coro on the pool loop from whichever loop the caller is on.
+        """
+        try:
+            if asyncio.get_running_loop() is self._loop:
+                return await coro
+        except RuntimeError:
+            pass
+        return await asyncio.wrap_future(self.submit(coro))
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._counters)
+        finished = counters["completed"] + counters["failed"] + counters["cancelled"]
+        counters["in_flight"] = counters["submitted"] - finished
+        return {
+            "url": self.url,
+            "config": self.config,
+            "nodes": [str(node.base_url) for node in self.client.transport.node_pool.all()],
+            "uptime_s": round(time.time() - self._started, 1),
+            "coroutines": counters,
+        }
+
+    async def health(self):
+        """
+        Cluster health plus pool stats, for the health-check endpoint.
+        """
+        try:
+            cluster = await self.run(self.client.cluster.health())
+            elasticsearch = {
+                "status": cluster["status"],
+                "number_of_nodes": cluster["number_of_nodes"],
+                "active_shards": cluster["active_shards"],
+            }
+        except Exception as e:
+            elasticsearch = {"status": "unreachable", "error": str(e)}
+        return {"elasticsearch": elasticsearch, "pool": self.stats()}
+
+    def close(self):
+        asyncio.run_coroutine_threadsafe(self.client.close(), self._loop).result()
+        self.sync.close()
+        self._loop.call_soon_threadsafe(self._loop.stop)
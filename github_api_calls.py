@@ -3,6 +3,11 @@ GitHub REST API
 '''
 import requests
 import os
+import shutil
+import tarfile
+import tempfile
+import threading
+import zipfile
 
 folder_location = "temp_files/"
 
@@ -63,11 +68,12 @@ def check_repo_exists(url):
         return false;
     return true;
 
-def get_repo_contents(headers, url, save_path):
+def get_repo_contents(headers, url, save_path, session=None):
     """
     Downloads the repo contents to files under the dynamic save_path.
     """
-    response = requests.get(url, headers=headers)
+    http = session or requests
+    response = http.get(url, headers=headers)
     response.raise_for_status()
     data = response.json()
 
@@ -81,7 +87,7 @@ def get_repo_contents(headers, url, save_path):
     contents_url = data['contents_url'].replace('{+path}', '')
     
     # Initial fetch
-    contents_response = requests.get(contents_url, headers=headers)
+    contents_response = http.get(contents_url, headers=headers)
     contents_response.raise_for_status()
     contents_data = contents_response.json()
 
@@ -92,7 +98,7 @@ def get_repo_contents(headers, url, save_path):
         item = content_queue.pop(0)
         
         if item['type'] == 'file':
-            file_response = requests.get(item['download_url'], headers=headers)
+            file_response = http.get(item['download_url'], headers=headers)
             file_response.raise_for_status()
 
             # Use the dynamic save_path
@@ -104,17 +110,113 @@ def get_repo_contents(headers, url, save_path):
                 
         elif item['type'] == 'dir':
             # Fetch directory contents and add them to the queue
-            dir_resp = requests.get(item['url'], headers=headers)
+            dir_resp = http.get(item['url'], headers=headers)
             dir_resp.raise_for_status()
             content_queue.extend(dir_resp.json())
 
 
-def get_commit_history(headers, url, save_path):
+def _archive_member_path(save_path, member_name):
+    """
+    Maps an archive member name onto save_path, dropping the leading
+    <owner>-<repo>-<sha>/ folder GitHub wraps every archive in.
+    Returns None for the wrapper folder itself and for unsafe paths.
+    """
+    parts = member_name.replace("\\", "/").split("/")[1:]
+    parts = [part for part in parts if part not in ("", ".")]
+    if not parts or ".." in parts:
+        return None
+    return os.path.join(save_path, *parts)
+
+def _write_member(src, local_path):
+    """
+    Writes an archive member to a temp file renamed over local_path, so a
+    file already there (possibly a hardlink into the blob cache) is replaced,
+    never written through.
+    """
+    os.makedirs(os.path.dirname(local_path), exist_ok=True)
+    tmp_path = f"{local_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'wb') as dst:
+        shutil.copyfileobj(src, dst)
+    os.replace(tmp_path, local_path)
+
+def _extract_tar_stream(stream, save_path):
+    """
+    Extracts a gzipped tar stream member by member without buffering the archive.
+    Returns the number of files written.
+    """
+    file_count = 0
+    with tarfile.open(fileobj=stream, mode="r|gz") as tar:
+        for member in tar:
+            if not member.isfile():
+                continue
+            local_path = _archive_member_path(save_path, member.name)
+            if local_path is None:
+                continue
+            with tar.extractfile(member) as src:
+                _write_member(src, local_path)
+            file_count += 1
+    return file_count
+
+def _extract_zip_stream(response, save_path, chunk_size):
+    """
+    Zip archives keep their index at the end, so the body is spooled to a
+    temp file (in memory while small) before extracting.
+    Returns the number of files written.
+    """
+    file_count = 0
+    with tempfile.SpooledTemporaryFile(max_size=64 * 1024 * 1024) as spool:
+        for chunk in response.iter_content(chunk_size=chunk_size):
+            spool.write(chunk)
+        spool.seek(0)
+        with zipfile.ZipFile(spool) as archive:
+            for info in archive.infolist():
+                if info.is_dir():
+                    continue
+                local_path = _archive_member_path(save_path, info.filename)
+                if local_path is None:
+                    continue
+                with archive.open(info) as src:
+                    _write_member(src, local_path)
+                file_count += 1
+    return file_count
+
+def get_repo_archive(headers, url, save_path, ref=None, archive_format="tarball", chunk_size=1024 * 1024, session=None):
+    """
+    Downloads the repo contents with a single archive request instead of
+    crawling the Contents API file by file.
+    Parameters:
+        url: The repo API url from set_up_github_connection (any host serving
+             <url>/tarball/<ref> works, e.g. a local stand-in)
+        ref: Branch, tag or commit sha, defaults to the default branch
+        archive_format: "tarball" (streamed) or "zipball"
+    Returns:
+        The number of files written under save_path
+    """
+    if archive_format not in ("tarball", "zipball"):
+        raise ValueError(f"Unsupported archive format: {archive_format}")
+
+    archive_url = f"{url}/{archive_format}"
+    if ref:
+        archive_url += f"/{ref}"
+
+    os.makedirs(save_path, exist_ok=True)
+
+    http = session or requests
+    with http.get(archive_url, headers=headers, stream=True) as response:
+        response.raise_for_status()
+        if archive_format == "tarball":
+            response.raw.decode_content = True
+            return _extract_tar_stream(response.raw, save_path)
+        return _extract_zip_stream(response, save_path, chunk_size)
+
+
+def get_commit_history(headers, url, save_path, session=None):
     """
     Prints the commit history to a file under save_path/commits.txt
     """
+    http = session or requests
     commits_url = url + "/commits"
-    response = requests.get(commits_url, headers=headers)
+    response = http.get(commits_url, headers=headers)
     response.raise_for_status()
     data = response.json()
     
@@ -126,50 +228,66 @@ def get_commit_history(headers, url, save_path):
                 f.write(item['commit']['verification']['payload'])
                 f.write('\n--------------------------------------------\n')
                 
-def get_issue_history(headers, url, save_path):
+def get_issue_comments(headers, item, session=None):
+    """
+    Fetches the comments of a single issue, returns an empty list on failure.
+    """
+    if not item.get('url'):
+        return []
+    http = session or requests
+    comments_resp = http.get(item['url'] + "/comments", headers=headers)
+    if comments_resp.status_code != 200:
+        return []
+    return comments_resp.json()
+
+def write_issue(f, item, comments):
+    """
+    Writes one issue and its comments in the issues.txt format.
+    """
+    if item.get('title'):
+        f.write('--------------------------------------------\n')
+        f.write("TITLE: " + item['title'] + "\n")
+    if item.get('state'):
+        f.write("ISSUE STATE: " + item['state'] + "\n")
+    if item.get('labels'):
+        f.write("LABELS:\n")
+        for label in item['labels']:
+            if label.get('name'):
+                f.write(" - " + label['name'] + "\n")
+    if item.get('assignees'):
+        f.write("ASSIGNEES:\n")
+        for assignee in item['assignees']:
+            f.write(" - " + assignee['login'] + "\n")
+    if item.get("body"):
+        f.write(item['body'] + "\n")
+    if item.get('url'):
+        f.write("COMMENTS:\n")
+        for comment in comments:
+            if comment.get('body'):
+                f.write("\t" + comment['body'] + "\n")
+
+def get_issue_history(headers, url, save_path, session=None):
     """
     Prints the github issue history to a file under save_path/issues.txt
     """
+    http = session or requests
     issues_url = url + "/issues"
     params = {"state" : "all"}
     
-    response = requests.get(issues_url, headers=headers, params=params)
+    response = http.get(issues_url, headers=headers, params=params)
     response.raise_for_status()
     data = response.json()
     
     file_path = os.path.join(save_path, 'issues.txt')
     with open(file_path, 'w', encoding='utf-8') as f:
         for item in data:
-            if item.get('title'):
-                f.write('--------------------------------------------\n')
-                f.write("TITLE: " + item['title'] + "\n")
-            if item.get('state'):
-                f.write("ISSUE STATE: " + item['state'] + "\n")
-            if item.get('labels'):
-                f.write("LABELS:\n")
-                for label in item['labels']:
-                    if label.get('name'):
-                        f.write(" - " + label['name'] + "\n")
-            if item.get('assignees'):
-                f.write("ASSIGNEES:\n")
-                for assignee in item['assignees']:
-                    f.write(" - " + assignee['login'] + "\n")
-            if item.get("body"):
-                f.write(item['body'] + "\n")
-            if item.get('url'):
-                f.write("COMMENTS:\n")
-                comments_url = item['url'] + "/comments"
-                comments_resp = requests.get(comments_url, headers=headers)
-                if comments_resp.status_code == 200:
-                    comment_data = comments_resp.json()
-                    for comment in comment_data:
-                        if comment.get('body'):
-                            f.write("\t" + comment['body'] + "\n")
-
-def list_pull_requests(headers, url, save_path, state="open", per_page=30, page=1):
+            write_issue(f, item, get_issue_comments(headers, item, session=session))
+
+def list_pull_requests(headers, url, save_path, state="open", per_page=30, page=1, session=None):
     """
     Lists pull requests for the repo.
     """
+    http = session or requests
     pulls_url = url + "/pulls"
     params = {
         "state": state,
@@ -179,7 +297,7 @@ def list_pull_requests(headers, url, save_path, state="open", per_page=30, page=
         "direction": "desc",
     }
 
-    response = requests.get(pulls_url, headers=headers, params=params)
+    response = http.get(pulls_url, headers=headers, params=params)
     response.raise_for_status()
     data = response.json()
 
@@ -200,13 +318,14 @@ def list_pull_requests(headers, url, save_path, state="open", per_page=30, page=
 
     return data
 
-def get_pull_request_details(headers, url, pull_number, save_path):
+def get_pull_request_details(headers, url, pull_number, save_path, session=None):
     """
     Gets full details for a specific pull request.
     """
+    http = session or requests
     pr_url = url + f"/pulls/{pull_number}"
 
-    response = requests.get(pr_url, headers=headers)
+    response = http.get(pr_url, headers=headers)
     response.raise_for_status()
     pr = response.json()
 
@@ -223,12 +342,13 @@ def get_pull_request_details(headers, url, pull_number, save_path):
 
     return pr
 
-def get_pr_review_comments(headers, url, pull_number, save_path):
+def get_pr_review_comments(headers, url, pull_number, save_path, session=None):
     """
     Prints the github PR history to a file.
     """
+    http = session or requests
     comments_url = url + f"/pulls/{pull_number}/comments"
-    response = requests.get(comments_url, headers=headers)
+    response = http.get(comments_url, headers=headers)
     data = response.json()
 
     prs_dir = os.path.join(save_path, "PRS")
@@ -0,0 +1,325 @@
+'''
+Concurrent GitHub downloader
+
+Shares one pooled requests.Session between a bounded set of worker threads so
+directory listings, file blobs and issue comments are fetched in parallel over
+kept-alive connections instead of one fresh connection per call.
+'''
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from github_api_calls import get_commit_history, get_issue_comments, get_repo_archive, write_issue
+
+# Tree entry modes that hold regular file content (symlinks and submodules are skipped)
+FILE_MODES = ("100644", "100755")
+
+
+class StageStats:
+    """
+    Request, item and byte counters for one download stage.
+    """
+    def __init__(self, name):
+        self.name = name
+        self.requests = 0
+        self.items = 0
+        self.bytes = 0
+        self.started = None
+        self.finished = None
+        self._lock = threading.Lock()
+
+    def record(self, requests_made=1, items=0, size=0):
+        now = time.perf_counter()
+        with self._lock:
+            if self.started is None:
+                self.started = now
+            self.finished = now
+            self.requests += requests_made
+            self.items += items
+            self.bytes += size
+
+    def start(self):
+        with self._lock:
+            if self.started is None:
+                self.started = time.perf_counter()
+
+    def summary(self):
+        elapsed = (self.finished - self.started) if self.started and self.finished else 0.0
+        return {
+            "requests": self.requests,
+            "items": self.items,
+            "bytes": self.bytes,
+            "seconds": round(elapsed, 3),
+            "requests_per_s": round(self.requests / elapsed, 2) if elapsed else None,
+            "mb_per_s": round(self.bytes / elapsed / 1e6, 3) if elapsed else None,
+        }
+
+
+class DownloadReport:
+    """
+    Per-stage throughput of a single repository download.
+    """
+    def __init__(self, max_workers):
+        self.max_workers = max_workers
+        self.commit_sha = None
+        self.blob_cache = None
+        self.stages = {}
+        self._lock = threading.Lock()
+        self._started = time.perf_counter()
+        self.total_seconds = None
+
+    def stage(self, name):
+        with self._lock:
+            if name not in self.stages:
+                self.stages[name] = StageStats(name)
+            return self.stages[name]
+
+    def finish(self):
+        self.total_seconds = round(time.perf_counter() - self._started, 3)
+
+    def summary(self):
+        return {
+            "max_workers": self.max_workers,
+            "commit_sha": self.commit_sha,
+            "blob_cache": self.blob_cache,
+            "total_seconds": self.total_seconds,
+            "stages": {name: stats.summary() for name, stats in self.stages.items()},
+        }
+
+    def __str__(self):
+        lines = [f"Download finished in {self.total_seconds}s with {self.max_workers} workers"]
+        for name, stats in self.stages.items():
+            s = stats.summary()
+            lines.append(
+                f"  {name:<9} {s['requests']:>6} req  {s['items']:>6} items  "
+                f"{s['bytes'] / 1e6:>8.2f} MB  {s['seconds']:>7.2f}s  "
+                f"{s['requests_per_s'] or 0:>7.1f} req/s  {s['mb_per_s'] or 0:>6.2f} MB/s"
+            )
+        return "\n".join(lines)
+
+
+class GitHubDownloader:
+    """
+    Downloads a repository, its commits and its issues with a shared
+    connection pool and at most max_workers requests in flight.
+    With a blob_cache, code is resolved through the Git Trees API and only
+    blobs missing from the cache are fetched; past archive_threshold missing
+    blobs a single archive request is cheaper and is used instead.
+    """
+    def __init__(self, max_workers=8, retries=3, blob_cache=None, archive_threshold=64):
+        self.max_workers = max_workers
+        self.blob_cache = blob_cache
+        self.archive_threshold = archive_threshold
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=max_workers,
+            pool_maxsize=max_workers,
+            max_retries=Retry(total=retries, backoff_factor=0.5, status_forcelist=[502, 503, 504]),
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="github-dl")
+
+    def close(self):
+        self._pool.shutdown(wait=False)
+        self.session.close()
+
+    def _get(self, url, headers, stats, **kwargs):
+        stats.start()
+        response = self.session.get(url, headers=headers, **kwargs)
+        response.raise_for_status()
+        stats.record(size=len(response.content))
+        return response
+
+    def _fetch_listing(self, headers, url, stats):
+        listing = self._get(url, headers, stats).json()
+        stats.record(requests_made=0, items=len(listing))
+        return listing
+
+    def _fetch_file(self, headers, item, save_path, stats):
+        response = self._get(item['download_url'], headers, stats)
+
+        local_path = os.path.join(save_path, item['path'])
+        os.makedirs(os.path.dirname(local_path), exist_ok=True)
+        with open(local_path, 'wb') as file:
+            file.write(response.content)
+        stats.record(requests_made=0, items=1)
+
+    def download_contents(self, headers, url, save_path, report):
+        """
+        Crawls the Contents API with directory listings and file blobs
+        fetched concurrently; each file is written as soon as it arrives.
+        """
+        listing_stats = report.stage("listings")
+        blob_stats = report.stage("blobs")
+
+        repo_data = self._get(url, headers, listing_stats).json()
+        contents_url = repo_data['contents_url'].replace('{+path}', '')
+        pending = set()
+
+        def schedule(items):
+            for item in items:
+                if item['type'] == 'file':
+                    pending.add(self._pool.submit(self._fetch_file, headers, item, save_path, blob_stats))
+                elif item['type'] == 'dir':
+                    pending.add(self._pool.submit(self._fetch_listing, headers, item['url'], listing_stats))
+
+        schedule(self._fetch_listing(headers, contents_url, listing_stats))
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                listing = future.result()
+                if listing:
+                    schedule(listing)
+
+    def download_archive(self, headers, url, save_path, report, ref=None):
+        stats = report.stage("archive")
+        stats.start()
+        file_count = get_repo_archive(headers, url, save_path, ref=ref, session=self.session)
+        stats.record(items=file_count)
+        return file_count
+
+    def resolve_commit(self, headers, url, report, ref=None):
+        """
+        Resolves ref (default branch when None) to a commit sha.
+        """
+        sha_headers = dict(headers, Accept="application/vnd.github.sha")
+        return self._get(f"{url}/commits/{ref or 'HEAD'}", sha_headers, report.stage("tree")).text.strip()
+
+    def _fetch_blob(self, headers, url, entry, save_path, stats):
+        raw_headers = dict(headers, Accept="application/vnd.github.raw")
+        data = self._get(f"{url}/git/blobs/{entry['sha']}", raw_headers, stats).content
+        self.blob_cache.put(entry['sha'], data)
+        if not self.blob_cache.link_into(entry['sha'], os.path.join(save_path, entry['path']), count=False):
+            # Evicted straight away by a tiny budget, write the content directly
+            with open(os.path.join(save_path, entry['path']), 'wb') as file:
+                file.write(data)
+        stats.record(requests_made=0, items=1)
+
+    def download_tree(self, headers, url, save_path, report, ref=None):
+        """
+        Lists the recursive Git tree for the commit, hardlinks every blob the
+        cache already holds and fetches only the rest. Raises when the tree
+        listing is truncated so the caller can fall back to the archive.
+        """
+        tree_stats = report.stage("tree")
+        cache_stats = report.stage("cached")
+        blob_stats = report.stage("blobs")
+
+        commit_sha = self.resolve_commit(headers, url, report, ref=ref)
+        report.commit_sha = commit_sha
+        tree = self._get(f"{url}/git/trees/{commit_sha}", headers, tree_stats, params={"recursive": 1}).json()
+        if tree.get('truncated'):
+            raise RuntimeError("Git tree listing is truncated")
+
+        entries = [e for e in tree['tree'] if e['type'] == 'blob' and e['mode'] in FILE_MODES]
+        tree_stats.record(requests_made=0, items=len(entries))
+
+        missing = []
+        for entry in entries:
+            if self.blob_cache.link_into(entry['sha'], os.path.join(save_path, entry['path'])):
+                cache_stats.record(requests_made=0, items=1, size=entry.get('size', 0))
+            else:
+                missing.append(entry)
+
+        if len(missing) > self.archive_threshold:
+            # Extracted aside and only the missing files moved in, so files linked from
+            # the blob cache (shared with other sessions) are never rewritten
+            staging = tempfile.mkdtemp(prefix=".codemap-archive-", dir=save_path)
+            try:
+                self.download_archive(headers, url, staging, report, ref=commit_sha)
+                for entry in missing:
+                    extracted = os.path.join(staging, entry['path'])
+                    if not os.path.isfile(extracted):
+                        continue
+                    local_path = os.path.join(save_path, entry['path'])
+                    os.makedirs(os.path.dirname(local_path), exist_ok=True)
+                    os.replace(extracted, local_path)
+                    # Rejected when export-subst or similar changed the bytes
+                    self.blob_cache.put_file(entry['sha'], local_path)
+            finally:
+                shutil.rmtree(staging, ignore_errors=True)
+        else:
+            for entry in missing:
+                os.makedirs(os.path.dirname(os.path.join(save_path, entry['path'])), exist_ok=True)
+            futures = [self._pool.submit(self._fetch_blob, headers, url, entry, save_path, blob_stats) for entry in missing]
+            for future in futures:
+                future.result()
+
+        report.blob_cache = self.blob_cache.stats()
+        return commit_sha
+
+    def download_commits(self, headers, url, save_path, report):
+        stats = report.stage("commits")
+        stats.start()
+        get_commit_history(headers, url, save_path, session=self.session)
+        stats.record()
+
+    def download_issues(self, headers, url, save_path, report):
+        """
+        Fetches every issue's comments in parallel and writes issues.txt in
+        the original issue order as results come in.
+        """
+        issue_stats = report.stage("issues")
+        comment_stats = report.stage("comments")
+
+        issues = self._get(url + "/issues", headers, issue_stats, params={"state": "all"}).json()
+        issue_stats.record(requests_made=0, items=len(issues))
+
+        def fetch_comments(item):
+            comment_stats.start()
+            comments = get_issue_comments(headers, item, session=self.session)
+            comment_stats.record(items=len(comments))
+            return comments
+
+        file_path = os.path.join(save_path, 'issues.txt')
+        with open(file_path, 'w', encoding='utf-8') as f:
+            for item, comments in zip(issues, self._pool.map(fetch_comments, issues)):
+                write_issue(f, item, comments)
+
+    def download_repo(self, headers, url, save_path, mode="archive", ref=None):
+        """
+        Downloads code, commits and issues into save_path. The three stages run
+        side by side. Code comes from the blob cache plus the Git Trees API when
+        mode is "tree", from one archive request when mode is "archive", or from
+        the Contents API crawl; each mode falls back to the next one on failure.
+        ref pins the code to a commit for the tree and archive modes.
+        Returns a DownloadReport with per-stage throughput.
+        """
+        os.makedirs(save_path, exist_ok=True)
+        report = DownloadReport(self.max_workers)
+
+        def download_code():
+            if mode == "tree" and self.blob_cache is not None:
+                try:
+                    self.download_tree(headers, url, save_path, report, ref=ref)
+                    return
+                except Exception as e:
+                    print(f"Tree download failed ({e}), falling back to archive download")
+            if mode in ("tree", "archive"):
+                try:
+                    self.download_archive(headers, url, save_path, report, ref=ref)
+                    return
+                except Exception as e:
+                    print(f"Archive download failed ({e}), falling back to per-file download")
+            self.download_contents(headers, url, save_path, report)
+
+        # Stage drivers get their own threads so they never wait on the worker pool from inside it
+        with ThreadPoolExecutor(max_workers=3, thread_name_prefix="github-stage") as stages:
+            futures = [
+                stages.submit(download_code),
+                stages.submit(self.download_commits, headers, url, save_path, report),
+                stages.submit(self.download_issues, headers, url, save_path, report),
+            ]
+            for future in futures:
+                future.result()
+
+        report.finish()
+        return report
@@ -0,0 +1,63 @@
+'''
+Index layout
+
+Maps the logical per-session index names the app uses (github_rag_index_<id>)
+to where the documents physically live. In the "dedicated" layout every
+session has an index of its own. In the "shared" layout sessions are spread
+over a few shared indices by a stable hash of their name: each document carries
+the session name in metadata.tenant, is routed by it (so one session's chunks
+sit on one shard), and every search, aggregation and delete is filtered by it.
+Everything that touches chunk documents goes through IndexLayout.resolve.
+'''
+import hashlib
+from typing import NamedTuple
+
+INDEX_LAYOUTS = ("dedicated", "shared")
+SHARED_INDEX_PREFIX = "codemap_shared"
+TENANT_FIELD = "metadata.tenant"
+
+
+class IndexLocation(NamedTuple):
+    name: str
+    index: str
+    tenant: str | None = None
+
+    @property
+    def routing(self) -> str | None:
+        return self.tenant
+
+    def filters(self) -> list:
+        return [{"term": {TENANT_FIELD: self.tenant}}] if self.tenant else []
+
+    def query(self, query: dict | None = None) -> dict | None:
+        """
+        query restricted to this location's documents (match_all when both are empty).
+        """
+        if not self.tenant:
+            return query
+        clauses = {"filter": self.filters()}
+        if query:
+            clauses["must"] = [query]
+        return {"bool": clauses}
+
+
+class IndexLayout:
+    def __init__(self, mode: str = "dedicated", shared_indices: int = 2, shared_prefix: str = SHARED_INDEX_PREFIX):
+        if mode not in INDEX_LAYOUTS:
+            raise ValueError(f"Unknown index layout '{mode}', expected one of {INDEX_LAYOUTS}")
+        self.mode = mode
+        self.shared_indices = shared_indices
+        self.shared_prefix = shared_prefix
+
+    @property
+    def shared(self) -> bool:
+        return self.mode == "shared"
+
+    def resolve(self, index_name: str) -> IndexLocation:
+        if not self.shared:
+            return IndexLocation(index_name, index_name)
+        slot = int(hashlib.sha1(index_name.encode()).hexdigest(), 16) % self.shared_indices
+        return IndexLocation(index_name, f"{self.shared_prefix}_{slot}", index_name)
+
+    def physical_indices(self) -> list:
+        return [f"{self.shared_prefix}_{slot}" for slot in range(self.shared_indices)] if self.shared else []
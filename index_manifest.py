@@ -0,0 +1,151 @@
+'''
+Indexed file manifest
+
+The list of files in a session index is computed once at ingest time with a
+paginated composite aggregation over metadata.file_path, stored in a small
+sidecar index and cached in memory, so the file dropdown and file-scoped
+queries do not have to scan chunk documents. Each ingest gets a new manifest
+version, which callers can use to invalidate anything derived from the index.
+'''
+import os
+import time
+import uuid
+
+from index_layout import IndexLayout
+
+MANIFEST_INDEX = "codemap_manifests"
+
+
+async def iter_composite_buckets(async_es_client, index_name: str, sources: list, query: dict | None = None, page_size: int = 1000, routing: str | None = None):
+    """
+    Pages through a composite aggregation, yielding every bucket.
+    """
+    after_key = None
+    while True:
+        composite = {"size": page_size, "sources": sources}
+        if after_key:
+            composite["after"] = after_key
+        body = {"size": 0, "aggs": {"buckets": {"composite": composite}}}
+        if query:
+            body["query"] = query
+        response = await async_es_client.search(index=index_name, body=body, routing=routing)
+        agg = response["aggregations"]["buckets"]
+        for bucket in agg["buckets"]:
+            yield bucket
+        after_key = agg.get("after_key")
+        if not after_key or not agg["buckets"]:
+            break
+
+async def list_indexed_files(async_es_client, index_name: str, query: dict | None = None, routing: str | None = None) -> list:
+    """
+    Every distinct file in the index (or the part of it matching query) with
+    its chunk count, sorted by file name.
+    """
+    files = []
+    sources = [{"file_path": {"terms": {"field": "metadata.file_path"}}}]
+    async for bucket in iter_composite_buckets(async_es_client, index_name, sources, query=query, routing=routing):
+        file_path = bucket["key"]["file_path"]
+        files.append({"value": os.path.basename(file_path), "path": file_path, "chunks": bucket["doc_count"]})
+
+    files.sort(key=lambda x: x["value"].lower())
+    return files
+
+
+class ManifestCache:
+    """
+    Per-index file manifests, cached in memory and persisted in MANIFEST_INDEX.
+    Manifests are keyed by logical index name; resolve maps that name to its
+    IndexLocation (see index_layout). Only build, which runs at the end of an
+    ingest, persists a manifest, so a stored manifest means a complete index.
+    """
+    def __init__(self, manifest_index: str = MANIFEST_INDEX, resolve=None):
+        self.manifest_index = manifest_index
+        self.resolve = resolve or IndexLayout().resolve
+        self._manifests = {}
+        # Indices whose cached manifest is also the stored one
+        self._stored = set()
+
+    async def _ensure_manifest_index(self, async_es_client):
+        if not await async_es_client.indices.exists(index=self.manifest_index):
+            await async_es_client.indices.create(
+                index=self.manifest_index,
+                body={
+                    "mappings": {
+                        # The file list is only ever read back whole, keep it out of the mapping
+                        "dynamic": False,
+                        "properties": {
+                            "index_name": {"type": "keyword"},
+                            "version": {"type": "keyword"},
+                            "built_at": {"type": "date", "format": "epoch_second"},
+                        },
+                    }
+                },
+            )
+
+    def _cache(self, manifest: dict, stored: bool = True) -> dict:
+        manifest["by_path"] = {f["path"]: i for i, f in enumerate(manifest["files"])}
+        self._manifests[manifest["index_name"]] = manifest
+        if stored:
+            self._stored.add(manifest["index_name"])
+        else:
+            self._stored.discard(manifest["index_name"])
+        return manifest
+
+    async def _list(self, async_es_client, index_name: str) -> dict:
+        location = self.resolve(index_name)
+        await async_es_client.indices.refresh(index=location.index)
+        return {
+            "index_name": index_name,
+            "version": uuid.uuid4().hex,
+            "built_at": int(time.time()),
+            "files": await list_indexed_files(async_es_client, location.index, query=location.query(), routing=location.routing),
+        }
+
+    async def build(self, async_es_client, index_name: str) -> dict:
+        """
+        Lists the files of index_name, stores the result as a new manifest
+        version. Only call this once an ingest into index_name has finished.
+        """
+        manifest = await self._list(async_es_client, index_name)
+        await self._ensure_manifest_index(async_es_client)
+        await async_es_client.index(index=self.manifest_index, id=index_name, document=manifest, refresh=True)
+        return self._cache(manifest)
+
+    async def get(self, async_es_client, index_name: str) -> dict:
+        """
+        Cached manifest for index_name, loading or building it on a miss.
+        """
+        manifest = self._manifests.get(index_name)
+        if manifest is not None:
+            return manifest
+
+        if await async_es_client.indices.exists(index=self.manifest_index):
+            response = await async_es_client.options(ignore_status=404).get(index=self.manifest_index, id=index_name)
+            if response.get("found"):
+                return self._cache(dict(response["_source"]))
+
+        # Ingested before manifests existed, or being ingested right now: list the index
+        # as it is, but leave storing a manifest to the end of the ingest
+        return self._cache(await self._list(async_es_client, index_name), stored=False)
+
+    async def exists(self, async_es_client, index_name: str) -> bool:
+        """
+        Whether a manifest was stored for index_name, i.e. an ingest into it ran to the end.
+        """
+        if index_name in self._stored:
+            return True
+        if not await async_es_client.indices.exists(index=self.manifest_index):
+            return False
+        return bool(await async_es_client.exists(index=self.manifest_index, id=index_name))
+
+    def invalidate(self, index_name: str):
+        self._manifests.pop(index_name, None)
+        self._stored.discard(index_name)
+
+    async def delete(self, async_es_client, index_name: str):
+        self.invalidate(index_name)
+        await async_es_client.options(ignore_status=404).delete(index=self.manifest_index, id=index_name, refresh=True)
+
+    def cached_version(self, index_name: str) -> str | None:
+        manifest = self._manifests.get(index_name)
+        return manifest["version"] if manifest else None
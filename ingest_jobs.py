@@ -0,0 +1,185 @@
+'''
+Background ingestion jobs
+
+/api/initialize_index hands ingestion to a JobManager and returns a job id
+straight away. Jobs run as tasks on the ES pool loop, at most max_concurrent at
+a time (the rest wait as "queued"), and report per-stage progress counters that
+the status endpoint can poll. Cancelling a job cancels its task; stages running
+in worker threads check JobProgress.cancelled between files and batches.
+'''
+import asyncio
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from llama_index.core.schema import TransformComponent
+from pydantic import PrivateAttr
+
+INGEST_COUNTERS = ("files_total", "files_read", "chunks_produced", "chunks_embedded", "docs_written")
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class JobProgress:
+    """
+    Thread-safe stage name plus counters for one job.
+    """
+    def __init__(self, counters=INGEST_COUNTERS):
+        self._lock = threading.Lock()
+        self.stage = "queued"
+        self.counters = {name: 0 for name in counters}
+        self.cancelled = False
+
+    def set_stage(self, stage: str):
+        with self._lock:
+            self.stage = stage
+
+    def add(self, counter: str, n: int = 1):
+        with self._lock:
+            self.counters[counter] = self.counters.get(counter, 0) + n
+
+    def set(self, counter: str, value: int):
+        with self._lock:
+            self.counters[counter] = value
+
+    def check_cancelled(self):
+        if self.cancelled:
+            raise JobCancelled()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {"stage": self.stage, **self.counters}
+
+
+class CountNodes(TransformComponent):
+    """
+    Pass-through pipeline step that adds the number of nodes it sees to a
+    progress counter, and stops the pipeline once the job is cancelled.
+    """
+    counter: str
+    _progress: JobProgress = PrivateAttr()
+
+    def __init__(self, progress: JobProgress, counter: str, **kwargs):
+        super().__init__(counter=counter, **kwargs)
+        self._progress = progress
+
+    def __call__(self, nodes, **kwargs):
+        self._progress.check_cancelled()
+        self._progress.add(self.counter, len(nodes))
+        return nodes
+
+
+class Job:
+    def __init__(self, key: str):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.status = "queued"
+        self.progress = JobProgress()
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.task = None
+
+    @property
+    def active(self) -> bool:
+        return self.status in ("queued", "running")
+
+    def summary(self) -> dict:
+        now = time.time()
+        return {
+            "job_id": self.id,
+            "key": self.key,
+            "status": self.status,
+            "progress": self.progress.snapshot(),
+            "result": self.result,
+            "error": self.error,
+            "queued_s": round((self.started_at or now) - self.created_at, 1),
+            "elapsed_s": round((self.finished_at or now) - self.started_at, 1) if self.started_at else 0.0,
+        }
+
+
+class JobManager:
+    """
+    Runs job coroutines on the ES pool loop with a concurrency cap. submit() and
+    cancel() must be called on that loop; get() is safe from any thread.
+    """
+    def __init__(self, max_concurrent: int = 1, keep_finished: int = 100):
+        self.max_concurrent = max_concurrent
+        self.keep_finished = keep_finished
+        self._semaphore = None
+        self._jobs = OrderedDict()
+
+    async def _run(self, job: Job, run, on_cancel):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrent)
+        try:
+            async with self._semaphore:
+                job.status = "running"
+                job.started_at = time.time()
+                job.result = await run(job.progress)
+                job.status = "done"
+        except (asyncio.CancelledError, JobCancelled):
+            job.status = "cancelled"
+            # Jobs cancelled while queued never touched anything
+            if on_cancel is not None and job.started_at is not None:
+                await on_cancel()
+        except Exception as e:
+            print(f"[JOBS] {job.key} ({job.id}) failed: {e}")
+            job.status = "failed"
+            job.error = str(e)
+        finally:
+            job.finished_at = time.time()
+            job.progress.set_stage(job.status)
+            self._prune()
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self._jobs.items() if not job.active]
+        for job_id in finished[:max(0, len(finished) - self.keep_finished)]:
+            del self._jobs[job_id]
+
+    async def submit(self, key: str, run, on_cancel=None) -> Job:
+        """
+        Starts run(progress) as a job for key. Returns the job already active
+        for key instead, if there is one.
+        """
+        existing = self.active(key)
+        if existing is not None:
+            return existing
+        job = Job(key)
+        self._jobs[job.id] = job
+        job.task = asyncio.get_running_loop().create_task(self._run(job, run, on_cancel))
+        return job
+
+    async def cancel(self, job_id: str) -> Job | None:
+        job = self._jobs.get(job_id)
+        if job is not None and job.active:
+            job.progress.cancelled = True
+            job.task.cancel()
+            if job.status == "queued":
+                # The task may not have started yet, in which case _run never sees the cancel
+                job.status = "cancelled"
+                job.finished_at = time.time()
+                job.progress.set_stage(job.status)
+        return job
+
+    def get(self, job_id: str) -> Job | None:
+        return self._jobs.get(job_id)
+
+    def active(self, key: str) -> Job | None:
+        for job in self._jobs.values():
+            if job.key == key and job.active:
+                return job
+        return None
+
+    def stats(self) -> dict:
+        jobs = list(self._jobs.values())
+        return {
+            "max_concurrent": self.max_concurrent,
+            "running": sum(1 for job in jobs if job.status == "running"),
+            "queued": sum(1 for job in jobs if job.status == "queued"),
+        }
@@ -0,0 +1,103 @@
+'''
+LLM request scheduler
+
+Ollama serves a handful of generations at a time, so every LLM-bound call takes
+a slot from a PrioritySemaphore first. Waiters are served by priority (lower
+runs first), and background work can never hold the slots reserved for live
+user queries.
+'''
+import asyncio
+import heapq
+import itertools
+from contextlib import asynccontextmanager
+
+LIVE_PRIORITY = 0
+BACKGROUND_PRIORITY = 10
+
+
+class PrioritySemaphore:
+    """
+    asyncio semaphore that wakes the highest-priority waiter first. Priorities
+    at or above BACKGROUND_PRIORITY count as background and may hold at most
+    limit - reserved_for_live slots. Use from a single event loop.
+    """
+    def __init__(self, limit: int = 1, reserved_for_live: int = 0):
+        self.limit = limit
+        self.background_limit = max(1, limit - reserved_for_live)
+        self._active = 0
+        self._active_background = 0
+        self._waiters = []
+        self._counter = itertools.count()
+        self.granted = {"live": 0, "background": 0}
+
+    @staticmethod
+    def _is_background(priority: int) -> bool:
+        return priority >= BACKGROUND_PRIORITY
+
+    def _can_grant(self, priority: int) -> bool:
+        if self._active >= self.limit:
+            return False
+        return not self._is_background(priority) or self._active_background < self.background_limit
+
+    def _grant(self, priority: int):
+        self._active += 1
+        if self._is_background(priority):
+            self._active_background += 1
+            self.granted["background"] += 1
+        else:
+            self.granted["live"] += 1
+
+    def _wake(self):
+        while self._waiters:
+            priority, _, future = self._waiters[0]
+            if future.done():
+                heapq.heappop(self._waiters)
+                continue
+            # Waiters are ordered, so if the best one cannot run nothing behind it can either
+            if not self._can_grant(priority):
+                return
+            heapq.heappop(self._waiters)
+            self._grant(priority)
+            future.set_result(None)
+
+    async def acquire(self, priority: int = LIVE_PRIORITY):
+        if not self._waiters and self._can_grant(priority):
+            self._grant(priority)
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._counter), future))
+        # Waiters queued ahead may be unable to run (background at its limit) while this one can
+        self._wake()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Granted just as we were cancelled, hand the slot on
+                self.release(priority)
+            raise
+
+    def release(self, priority: int = LIVE_PRIORITY):
+        self._active -= 1
+        if self._is_background(priority):
+            self._active_background -= 1
+        self._wake()
+
+    @asynccontextmanager
+    async def slot(self, priority: int = LIVE_PRIORITY):
+        await self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release(priority)
+
+    def stats(self) -> dict:
+        waiting = [p for p, _, f in self._waiters if not f.done()]
+        return {
+            "limit": self.limit,
+            "background_limit": self.background_limit,
+            "active": self._active,
+            "active_background": self._active_background,
+            "waiting_live": sum(1 for p in waiting if not self._is_background(p)),
+            "waiting_background": sum(1 for p in waiting if self._is_background(p)),
+            "granted": dict(self.granted),
+        }
@@ -0,0 +1,180 @@
+'''
+Hybrid retrieval
+
+Runs a BM25 match over chunk text and a kNN search over chunk embeddings side
+by side and fuses the two rankings with reciprocal rank fusion (RRF), so exact
+identifiers that embed poorly still surface. Fusion happens client-side, which
+works on any Elasticsearch licence. "dense" and "bm25" modes run a single leg.
+Both legs take filter clauses, which scope_filters uses to keep a search
+inside one file or directory; fetch_file_chunks reads a file back from the
+index in line order.
+'''
+import asyncio
+import os
+
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import NodeWithScore, QueryBundle
+from llama_index.vector_stores.elasticsearch.utils import convert_es_hit_to_node
+
+RETRIEVAL_MODES = ("hybrid", "dense", "bm25")
+# What a file template searches: the selected file, its directory or the whole repository
+RETRIEVAL_SCOPES = ("file", "directory", "repo")
+
+# Splits identifiers like parseHttpRequest / parse_http_request into their words
+# while keeping the original token, so BM25 matches both forms
+CODE_ANALYSIS = {
+    "filter": {
+        "code_words": {
+            "type": "word_delimiter_graph",
+            "preserve_original": True,
+            "split_on_case_change": True,
+            "split_on_numerics": True,
+        }
+    },
+    "analyzer": {
+        # flatten_graph, as the graph filter runs at index time
+        "code": {"type": "custom", "tokenizer": "whitespace", "filter": ["code_words", "lowercase", "flatten_graph"]}
+    },
+}
+
+
+def rrf_fuse(rankings: list, rrf_k: int = 60) -> list:
+    """
+    Fuses ranked lists of hits into (hit, score) pairs, best first.
+    """
+    scores, hits = {}, {}
+    for ranking in rankings:
+        for rank, hit in enumerate(ranking, start=1):
+            scores[hit["_id"]] = scores.get(hit["_id"], 0.0) + 1.0 / (rrf_k + rank)
+            hits.setdefault(hit["_id"], hit)
+    order = sorted(scores, key=scores.get, reverse=True)
+    return [(hits[doc_id], scores[doc_id]) for doc_id in order]
+
+
+def scope_filters(scope: str, file_path: str | None) -> list:
+    """
+    Filter clauses on metadata.file_path (a keyword, see the dynamic template
+    in setup_fresh_index) restricting a search to scope around file_path.
+    """
+    if scope not in RETRIEVAL_SCOPES:
+        raise ValueError(f"Unknown retrieval scope '{scope}', expected one of {RETRIEVAL_SCOPES}")
+    if scope == "repo" or not file_path:
+        return []
+    if scope == "file":
+        return [{"term": {"metadata.file_path": file_path}}]
+    return [{"prefix": {"metadata.file_path": os.path.dirname(file_path).rstrip("/") + "/"}}]
+
+
+async def fetch_file_chunks(async_es_client, index_name: str, file_path: str, filters: list | None = None, routing: str | None = None, limit: int = 1000) -> list:
+    """
+    Every chunk of file_path stored in the index, as nodes in line order.
+    """
+    response = await async_es_client.search(
+        index=index_name,
+        query={"bool": {"filter": [{"term": {"metadata.file_path": file_path}}] + (filters or [])}},
+        # Chunks from the sentence splitter carry no line numbers
+        sort=[{"metadata.start_line": {"order": "asc", "unmapped_type": "long"}}],
+        size=limit,
+        source_excludes=["embedding"],
+        routing=routing,
+    )
+    return [convert_es_hit_to_node(hit, text_field="content") for hit in response["hits"]["hits"]]
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    BM25 + kNN retriever over an index written by ElasticsearchStore.
+    The searches are async; retrieve() runs them on loop, the event loop the
+    client belongs to (ES_POOL.loop), or on a fresh loop when none is given.
+    """
+    def __init__(
+        self,
+        async_es_client,
+        index_name: str,
+        embed_model,
+        mode: str = "hybrid",
+        top_k: int = 2,
+        num_candidates: int = 100,
+        window: int = 20,
+        rrf_k: int = 60,
+        filters: list | None = None,
+        routing: str | None = None,
+        loop: asyncio.AbstractEventLoop | None = None,
+        **kwargs,
+    ):
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode '{mode}', expected one of {RETRIEVAL_MODES}")
+        super().__init__(**kwargs)
+        self.client = async_es_client
+        self.index_name = index_name
+        self.embed_model = embed_model
+        self.mode = mode
+        self.top_k = top_k
+        # Each leg returns `window` hits for fusion; kNN needs num_candidates >= window
+        self.window = max(window, top_k)
+        self.num_candidates = max(num_candidates, self.window)
+        self.rrf_k = rrf_k
+        # Filter clauses applied to both legs, e.g. the tenant of a shared index
+        self.filters = filters or []
+        self.routing = routing
+        self.loop = loop
+
+    async def _dense(self, query: str) -> list:
+        # The model call blocks, keep it off the shared pool loop
+        vector = await asyncio.to_thread(self.embed_model.get_query_embedding, query)
+        knn = {
+            "field": "embedding",
+            "query_vector": vector,
+            "k": self.window,
+            "num_candidates": self.num_candidates,
+        }
+        if self.filters:
+            knn["filter"] = self.filters
+        response = await self.client.search(
+            index=self.index_name,
+            knn=knn,
+            size=self.window,
+            source_excludes=["embedding"],
+            routing=self.routing,
+        )
+        return response["hits"]["hits"]
+
+    async def _bm25(self, query: str) -> list:
+        response = await self.client.search(
+            index=self.index_name,
+            query={"bool": {"must": [{"match": {"content": query}}], "filter": self.filters}},
+            size=self.window,
+            source_excludes=["embedding"],
+            routing=self.routing,
+        )
+        return response["hits"]["hits"]
+
+    def _retrieve(self, query_bundle: QueryBundle) -> list:
+        if self.loop is None:
+            return asyncio.run(self._aretrieve(query_bundle))
+        try:
+            on_loop = asyncio.get_running_loop() is self.loop
+        except RuntimeError:
+            on_loop = False
+        if on_loop:
+            # Blocking here would stop the loop that has to run the searches
+            raise RuntimeError("retrieve() called on the client's own event loop, use aretrieve()")
+        return asyncio.run_coroutine_threadsafe(self._aretrieve(query_bundle), self.loop).result()
+
+    async def _aretrieve(self, query_bundle: QueryBundle) -> list:
+        query = query_bundle.query_str
+        legs = []
+        if self.mode in ("hybrid", "dense"):
+            legs.append(self._dense(query))
+        if self.mode in ("hybrid", "bm25"):
+            legs.append(self._bm25(query))
+        rankings = await asyncio.gather(*legs)
+
+        if len(rankings) == 1:
+            fused = [(hit, hit["_score"]) for hit in rankings[0]]
+        else:
+            fused = rrf_fuse(rankings, self.rrf_k)
+        return [
+            NodeWithScore(node=convert_es_hit_to_node(hit, text_field="content"), score=score)
+            for hit, score in fused[:self.top_k]
+        ]
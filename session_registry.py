@@ -0,0 +1,271 @@
+'''
+Session registry and reaper
+
+Every session owns a download folder (/tmp/CodeMap/<sessionId>) and an index.
+The registry records when each session was last used; the reaper runs on the
+ES pool loop and deletes sessions idle for longer than the TTL, then evicts the
+least recently used ones while the folders exceed the disk budget or the
+sessions holding an index exceed the index budget. Last access is kept in a
+SQLite file, so a restart does not make sessions still in use look idle.
+Folders and indices the registry has never seen are picked up by a discovery
+pass, dated by their mtime or creation date, so they are reclaimed too.
+'''
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+
+REAP_REASONS = ("ttl", "disk", "indices")
+
+
+def dir_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+class SessionRecord:
+    def __init__(self, session_id: str, last_access: float):
+        self.session_id = session_id
+        self.last_access = last_access
+        self.created_at = time.time()
+        self.index_name = None
+        self.repo_path = None
+        self.disk_bytes = None
+
+    def summary(self) -> dict:
+        return {
+            "session_id": self.session_id,
+            "index_name": self.index_name,
+            "repo_path": self.repo_path,
+            "idle_s": round(time.time() - self.last_access, 1),
+            "disk_bytes": self.disk_bytes,
+        }
+
+
+class SessionRegistry:
+    """
+    Last access, folder and index of every known session, persisted to
+    db_path when given. Thread-safe.
+    """
+    def __init__(self, db_path: str | None = None):
+        self._lock = threading.Lock()
+        self._sessions = {}
+        self._db = None
+        if db_path:
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                " session_id TEXT PRIMARY KEY, last_access REAL, index_name TEXT, repo_path TEXT)"
+            )
+            self._db.commit()
+            for session_id, last_access, index_name, repo_path in self._db.execute("SELECT * FROM sessions"):
+                record = self._record(session_id, last_access)
+                record.index_name = index_name
+                record.repo_path = repo_path
+
+    def _save(self, record: SessionRecord):
+        if self._db is not None:
+            self._db.execute(
+                "INSERT OR REPLACE INTO sessions (session_id, last_access, index_name, repo_path) VALUES (?, ?, ?, ?)",
+                (record.session_id, record.last_access, record.index_name, record.repo_path),
+            )
+            self._db.commit()
+
+    def _record(self, session_id: str, last_access: float) -> SessionRecord:
+        record = self._sessions.get(session_id)
+        if record is None:
+            record = self._sessions[session_id] = SessionRecord(session_id, last_access)
+        return record
+
+    def touch(self, session_id: str, index_name: str | None = None, repo_path: str | None = None):
+        """
+        Marks session_id as used now, recording its index and folder if given.
+        """
+        with self._lock:
+            record = self._record(session_id, time.time())
+            record.last_access = time.time()
+            if index_name:
+                record.index_name = index_name
+            if repo_path:
+                record.repo_path = repo_path
+            self._save(record)
+
+    def adopt(self, session_id: str, last_access: float, index_name: str | None = None, repo_path: str | None = None):
+        """
+        Registers a session found on disk or in Elasticsearch. last_access only
+        dates sessions the registry has never seen; a known session keeps its
+        own, and adopting it only fills in its folder or index.
+        """
+        with self._lock:
+            record = self._sessions.get(session_id)
+            if record is not None and (record.index_name or not index_name) and (record.repo_path or not repo_path):
+                return
+            record = self._record(session_id, last_access)
+            record.index_name = record.index_name or index_name
+            record.repo_path = record.repo_path or repo_path
+            self._save(record)
+
+    def remove(self, session_id: str):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+            if self._db is not None:
+                self._db.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+                self._db.commit()
+
+    def get(self, session_id: str) -> SessionRecord | None:
+        with self._lock:
+            return self._sessions.get(session_id)
+
+    def by_last_access(self) -> list:
+        """
+        Records, least recently used first.
+        """
+        with self._lock:
+            return sorted(self._sessions.values(), key=lambda record: record.last_access)
+
+
+class SessionReaper:
+    """
+    Periodically reclaims idle sessions. discover() returns the sessions that
+    exist on disk and in Elasticsearch as dicts of SessionRegistry.adopt
+    arguments; reclaim(record) deletes one session and returns
+    {"bytes": ..., "indices": ...}; is_busy(record) protects sessions with
+    work in flight. Use from the ES pool loop.
+    """
+    def __init__(
+        self,
+        registry: SessionRegistry,
+        discover,
+        reclaim,
+        is_busy=lambda record: False,
+        ttl_s: float = 24 * 3600,
+        max_disk_bytes: int | None = None,
+        max_indices: int | None = None,
+        interval_s: float = 300,
+    ):
+        self.registry = registry
+        self.discover = discover
+        self.reclaim = reclaim
+        self.is_busy = is_busy
+        self.ttl_s = ttl_s
+        self.max_disk_bytes = max_disk_bytes
+        self.max_indices = max_indices
+        self.interval_s = interval_s
+        self.task = None
+        self._counters = {
+            "sweeps": 0,
+            "failed_sweeps": 0,
+            "bytes_reclaimed": 0,
+            "indices_deleted": 0,
+            "sessions_reaped": dict.fromkeys(REAP_REASONS, 0),
+        }
+        self._last_sweep = None
+
+    async def _measure(self, records: list):
+        for record in records:
+            if record.repo_path and os.path.isdir(record.repo_path):
+                record.disk_bytes = await asyncio.to_thread(dir_size, record.repo_path)
+            else:
+                record.disk_bytes = 0
+
+    def _plan(self, records: list) -> list:
+        """
+        (record, reason) pairs to reclaim, records given least recently used first.
+        """
+        now = time.time()
+        candidates = [record for record in records if not self.is_busy(record)]
+        plan = [(record, "ttl") for record in candidates if now - record.last_access > self.ttl_s]
+        chosen = {record.session_id for record, _ in plan}
+
+        kept = [record for record in records if record.session_id not in chosen]
+        disk = sum(record.disk_bytes or 0 for record in kept)
+        indices = sum(1 for record in kept if record.index_name)
+        for record in candidates:
+            # Evicting a session that holds neither a folder nor an index frees nothing
+            if record.session_id in chosen or not (record.disk_bytes or record.index_name):
+                continue
+            if self.max_disk_bytes is not None and disk > self.max_disk_bytes:
+                reason = "disk"
+            elif self.max_indices is not None and indices > self.max_indices:
+                reason = "indices"
+            else:
+                break
+            plan.append((record, reason))
+            chosen.add(record.session_id)
+            disk -= record.disk_bytes or 0
+            indices -= 1 if record.index_name else 0
+        return plan
+
+    async def sweep(self) -> dict:
+        """
+        One discovery and reclaim pass. Returns what it did.
+        """
+        started = time.perf_counter()
+        for found in await self.discover():
+            self.registry.adopt(**found)
+        records = self.registry.by_last_access()
+        await self._measure(records)
+
+        reaped = []
+        for record, reason in self._plan(records):
+            try:
+                freed = await self.reclaim(record)
+            except Exception as e:
+                print(f"[REAPER] Could not reclaim {record.session_id}: {e}")
+                continue
+            self.registry.remove(record.session_id)
+            self._counters["sessions_reaped"][reason] += 1
+            self._counters["bytes_reclaimed"] += freed.get("bytes", 0)
+            self._counters["indices_deleted"] += freed.get("indices", 0)
+            reaped.append({"session_id": record.session_id, "reason": reason, **freed})
+
+        self._counters["sweeps"] += 1
+        self._last_sweep = {
+            "at": time.time(),
+            "duration_s": round(time.perf_counter() - started, 2),
+            "sessions": len(records) - len(reaped),
+            "reaped": reaped,
+        }
+        if reaped:
+            print(f"[REAPER] Reclaimed {len(reaped)} sessions: {reaped}")
+        return self._last_sweep
+
+    async def run_forever(self):
+        while True:
+            try:
+                await self.sweep()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._counters["failed_sweeps"] += 1
+                print(f"[REAPER] Sweep failed: {e}")
+            await asyncio.sleep(self.interval_s)
+
+    def start(self):
+        """
+        Starts run_forever on the running loop unless it is already running.
+        """
+        if self.task is None or self.task.done():
+            self.task = asyncio.get_running_loop().create_task(self.run_forever())
+        return self.task
+
+    def stats(self) -> dict:
+        records = self.registry.by_last_access()
+        return {
+            "ttl_s": self.ttl_s,
+            "max_disk_bytes": self.max_disk_bytes,
+            "max_indices": self.max_indices,
+            "sessions": len(records),
+            "disk_bytes": sum(record.disk_bytes or 0 for record in records),
+            "indices": sum(1 for record in records if record.index_name),
+            **{key: dict(value) if isinstance(value, dict) else value for key, value in self._counters.items()},
+            "last_sweep": self._last_sweep,
+        }
@@ -0,0 +1,206 @@
+'''
+Repository snapshots
+
+A snapshot is one repository at one commit, ingested with one ingest
+configuration, identified by (owner, repo, commit sha, ingest config hash).
+Sessions asking for the same snapshot share its download folder and index
+instead of downloading and embedding it again. Each snapshot counts the
+sessions attached to it, and the session reaper only deletes a snapshot no
+session references. Identical downloads arriving together are coalesced with
+SingleFlight; identical ingests already are, since JobManager keys jobs by
+index name. A marker file written after the download lets a restarted server
+find its snapshots again.
+'''
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+MARKER_FILE = ".codemap-snapshot.json"
+
+
+def config_hash(config: dict) -> str:
+    """
+    Stable hash of the settings that change what an ingest produces.
+    """
+    return hashlib.sha256(json.dumps(config, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+
+def snapshot_id(owner: str, repo: str, commit_sha: str, ingest_config_hash: str) -> str:
+    key = f"{owner.lower()}/{repo.lower()}@{commit_sha}#{ingest_config_hash}"
+    return hashlib.sha256(key.encode()).hexdigest()[:16]
+
+
+class SingleFlight:
+    """
+    Runs fn once per key at a time. Callers arriving while it runs wait for
+    and share its result (or exception). Thread-safe.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self.coalesced = 0
+
+    def do(self, key: str, fn) -> tuple:
+        """
+        Returns (result, coalesced), coalesced being True for callers that
+        waited on another caller's run.
+        """
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+            else:
+                self.coalesced += 1
+        if not leader:
+            return future.result(), True
+
+        try:
+            result = fn()
+            future.set_result(result)
+            return result, False
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+
+
+class Snapshot:
+    def __init__(self, snapshot_id: str, owner: str, repo: str, commit_sha: str, ingest_config_hash: str, repo_path: str, index_name: str):
+        self.id = snapshot_id
+        self.owner = owner
+        self.repo = repo
+        self.commit_sha = commit_sha
+        self.config_hash = ingest_config_hash
+        self.repo_path = repo_path
+        self.index_name = index_name
+        self.downloaded = False
+        self.indexed = False
+        self.created_at = time.time()
+        self.sessions = set()
+
+    @property
+    def session_key(self) -> str:
+        """
+        Name the snapshot goes by in the session registry, matching its folder
+        and index suffix.
+        """
+        return os.path.basename(self.repo_path)
+
+    def marker(self) -> dict:
+        return {
+            "snapshot_id": self.id,
+            "owner": self.owner,
+            "repo": self.repo,
+            "commit_sha": self.commit_sha,
+            "config_hash": self.config_hash,
+            "index_name": self.index_name,
+        }
+
+    def summary(self) -> dict:
+        return dict(
+            self.marker(),
+            downloaded=self.downloaded,
+            indexed=self.indexed,
+            refs=len(self.sessions),
+        )
+
+
+class SnapshotRegistry:
+    """
+    Snapshots by id, with the sessions attached to each. Folders live under
+    root as snap_<id> and indices are named <index_prefix>_snap_<id>.
+    Thread-safe.
+    """
+    def __init__(self, root: str, index_prefix: str):
+        self.root = root
+        self.index_prefix = index_prefix
+        self._lock = threading.Lock()
+        self._snapshots = {}
+        self._session_snapshot = {}
+
+    def get_or_create(self, owner: str, repo: str, commit_sha: str, ingest_config_hash: str) -> Snapshot:
+        snap_id = snapshot_id(owner, repo, commit_sha, ingest_config_hash)
+        with self._lock:
+            snapshot = self._snapshots.get(snap_id)
+            if snapshot is None:
+                snapshot = Snapshot(
+                    snap_id, owner, repo, commit_sha, ingest_config_hash,
+                    os.path.join(self.root, f"snap_{snap_id}"),
+                    f"{self.index_prefix}_snap_{snap_id}",
+                )
+                # Downloaded before a restart
+                snapshot.downloaded = os.path.isfile(os.path.join(snapshot.repo_path, MARKER_FILE))
+                self._snapshots[snap_id] = snapshot
+            return snapshot
+
+    def mark_downloaded(self, snapshot: Snapshot):
+        with open(os.path.join(snapshot.repo_path, MARKER_FILE), "w") as f:
+            json.dump(snapshot.marker(), f)
+        snapshot.downloaded = True
+
+    def by_path(self, repo_path: str | None) -> Snapshot | None:
+        """
+        Snapshot downloaded into repo_path, read back from its marker file
+        when this process has not seen it yet.
+        """
+        if not repo_path or os.path.dirname(os.path.realpath(repo_path)) != os.path.realpath(self.root):
+            return None
+        marker_path = os.path.join(repo_path, MARKER_FILE)
+        if not os.path.isfile(marker_path):
+            return None
+        with open(marker_path) as f:
+            marker = json.load(f)
+        return self.get_or_create(marker["owner"], marker["repo"], marker["commit_sha"], marker["config_hash"])
+
+    def by_index(self, index_name: str | None) -> Snapshot | None:
+        with self._lock:
+            for snapshot in self._snapshots.values():
+                if snapshot.index_name == index_name:
+                    return snapshot
+        return None
+
+    def attach(self, snapshot: Snapshot, session_id: str) -> int:
+        """
+        References snapshot from session_id, dropping the session's reference
+        to any other snapshot. Returns the snapshot's reference count.
+        """
+        with self._lock:
+            previous = self._session_snapshot.get(session_id)
+            if previous is not None and previous is not snapshot:
+                previous.sessions.discard(session_id)
+            snapshot.sessions.add(session_id)
+            self._session_snapshot[session_id] = snapshot
+            return len(snapshot.sessions)
+
+    def release(self, session_id: str) -> Snapshot | None:
+        with self._lock:
+            snapshot = self._session_snapshot.pop(session_id, None)
+            if snapshot is not None:
+                snapshot.sessions.discard(session_id)
+            return snapshot
+
+    def refs(self, index_name: str | None) -> int:
+        snapshot = self.by_index(index_name)
+        return len(snapshot.sessions) if snapshot else 0
+
+    def forget(self, snapshot: Snapshot):
+        with self._lock:
+            self._snapshots.pop(snapshot.id, None)
+            for session_id in snapshot.sessions:
+                self._session_snapshot.pop(session_id, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            snapshots = list(self._snapshots.values())
+            return {
+                "snapshots": len(snapshots),
+                "indexed": sum(1 for snapshot in snapshots if snapshot.indexed),
+                "attached_sessions": len(self._session_snapshot),
+                "shared": sum(1 for snapshot in snapshots if len(snapshot.sessions) > 1),
+            }
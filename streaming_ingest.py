@@ -0,0 +1,209 @@
+'''
+Streaming ingestion
+
+Reads files lazily and pushes them through chunk -> embed -> write as separate
+stages joined by bounded queues, so the stages overlap (the next batch is being
+chunked and embedded while the previous one is written to Elasticsearch) and a
+slow stage holds back the ones before it. On top of the queue bounds, the source
+text in flight is capped by a byte budget, so memory stays flat however large
+the repository is.
+'''
+import asyncio
+import concurrent.futures
+import os
+import resource
+import threading
+import time
+
+from llama_index.core import SimpleDirectoryReader
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def current_rss_bytes() -> int:
+    """
+    Resident set size of this process. Falls back to the lifetime peak where
+    /proc is not available.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class RssSampler:
+    """
+    Samples this process's RSS in the background while the block runs and
+    records the peak and wall time. Embedding worker processes are not included.
+    """
+    def __init__(self, interval: float = 0.1):
+        self.interval = interval
+        self.start_rss = 0
+        self.peak_rss = 0
+        self.wall_s = 0.0
+        self._task = None
+        self._started = None
+
+    async def _sample(self):
+        while True:
+            self.peak_rss = max(self.peak_rss, current_rss_bytes())
+            await asyncio.sleep(self.interval)
+
+    async def __aenter__(self):
+        self._started = time.perf_counter()
+        self.start_rss = self.peak_rss = current_rss_bytes()
+        self._task = asyncio.create_task(self._sample())
+        return self
+
+    async def __aexit__(self, *exc):
+        self._task.cancel()
+        self.peak_rss = max(self.peak_rss, current_rss_bytes())
+        self.wall_s = time.perf_counter() - self._started
+
+    def report(self) -> dict:
+        return {
+            "wall_s": round(self.wall_s, 2),
+            "start_rss_mb": round(self.start_rss / 1024**2, 1),
+            "peak_rss_mb": round(self.peak_rss / 1024**2, 1),
+            "growth_mb": round((self.peak_rss - self.start_rss) / 1024**2, 1),
+        }
+
+
+class _Stopped(Exception):
+    pass
+
+
+class ByteBudget:
+    """
+    Async counting budget of bytes in flight. A request larger than the whole
+    budget is let through on its own so one huge file cannot stall the stream.
+    """
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.in_use = 0
+        self.peak = 0
+        self._condition = asyncio.Condition()
+
+    async def acquire(self, n: int):
+        n = min(n, self.capacity)
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_use + n <= self.capacity)
+            self.in_use += n
+            self.peak = max(self.peak, self.in_use)
+        return n
+
+    async def release(self, n: int):
+        async with self._condition:
+            self.in_use -= n
+            self._condition.notify_all()
+
+
+async def stream_ingest(
+    file_paths: list,
+    node_parser,
+    embed_model,
+    vector_store,
+    progress,
+    prepare_documents=None,
+    batch_docs: int = 64,
+    queue_depth: int = 2,
+    max_inflight_bytes: int = 256 * 1024**2,
+) -> int:
+    """
+    Ingests file_paths into vector_store (anything with async_add, such as an
+    ElasticsearchStore or a BulkWriter) through overlapped read, chunk, embed
+    and write stages. prepare_documents(documents) may tag the documents of
+    each batch before chunking. Reports progress on the JobProgress counters
+    and returns the number of chunks written.
+    """
+    loop = asyncio.get_running_loop()
+    budget = ByteBudget(max_inflight_bytes)
+    to_chunk = asyncio.Queue(maxsize=queue_depth)
+    to_embed = asyncio.Queue(maxsize=queue_depth)
+    to_write = asyncio.Queue(maxsize=queue_depth)
+    stop = threading.Event()
+    written = 0
+
+    def wait_for(coro):
+        # Blocks the reader thread until the pool loop has room for the batch
+        future = asyncio.run_coroutine_threadsafe(coro, loop)
+        while True:
+            try:
+                return future.result(timeout=0.5)
+            except concurrent.futures.TimeoutError:
+                if stop.is_set():
+                    future.cancel()
+                    raise _Stopped()
+
+    def send(batch, batch_bytes):
+        held = wait_for(budget.acquire(batch_bytes))
+        wait_for(to_chunk.put((batch, held)))
+
+    def read():
+        batch, batch_bytes, files_read = [], 0, 0
+        try:
+            for file_documents in SimpleDirectoryReader(input_files=file_paths).iter_data():
+                if stop.is_set() or progress.cancelled:
+                    return
+                batch.extend(file_documents)
+                batch_bytes += sum(len(document.text) for document in file_documents)
+                files_read += 1
+                progress.add("files_read")
+                if len(batch) >= batch_docs:
+                    send(batch, batch_bytes)
+                    batch, batch_bytes = [], 0
+            if batch:
+                send(batch, batch_bytes)
+        except _Stopped:
+            return
+        # Empty files yield no documents but still count as read
+        progress.add("files_read", len(file_paths) - files_read)
+
+    async def read_stage():
+        await asyncio.to_thread(read)
+        await to_chunk.put(None)
+
+    async def chunk_stage():
+        while (item := await to_chunk.get()) is not None:
+            documents, held = item
+            if prepare_documents is not None:
+                documents = prepare_documents(documents)
+            nodes = await asyncio.to_thread(node_parser, documents)
+            progress.add("chunks_produced", len(nodes))
+            await to_embed.put((nodes, held))
+        await to_embed.put(None)
+
+    async def embed_stage():
+        while (item := await to_embed.get()) is not None:
+            nodes, held = item
+            progress.check_cancelled()
+            nodes = await embed_model.acall(nodes)
+            progress.add("chunks_embedded", len(nodes))
+            await to_write.put((nodes, held))
+        await to_write.put(None)
+
+    async def write_stage():
+        nonlocal written
+        while (item := await to_write.get()) is not None:
+            nodes, held = item
+            nodes = [node for node in nodes if node.embedding is not None]
+            if nodes:
+                await vector_store.async_add(nodes)
+            written += len(nodes)
+            progress.add("docs_written", len(nodes))
+            await budget.release(held)
+
+    tasks = [loop.create_task(stage()) for stage in (read_stage, chunk_stage, embed_stage, write_stage)]
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        # A failed or cancelled stage takes the whole stream down with it
+        stop.set()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+    # The reader stops quietly on cancellation, make sure the caller hears about it
+    progress.check_cancelled()
+    return written
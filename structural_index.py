@@ -0,0 +1,243 @@
+'''
+Structural repository index
+
+A deterministic description of a repository built from the files on disk at
+ingest time: the file tree, and per file its line count, classes, functions
+(methods as Class.method) and imports. Python is parsed with the ast module,
+brace languages with the declaration scanner of code_chunker, imports with a
+regex per language. Listing templates are answered from it directly instead of
+asking the LLM to reconstruct the same facts from retrieved chunks. Each index
+gets one gzipped JSON file; files whose content hash is unchanged are carried
+over from the previous build.
+'''
+import ast
+import gzip
+import json
+import os
+import re
+import threading
+import time
+
+from code_chunker import _CONTAINER, BRACE_EXTS, brace_boundaries
+
+STRUCTURE_VERSION = 1
+
+_IMPORTS = {
+    ".js": [re.compile(r"""^\s*import\s+(?:[^'"]*?\s+from\s+)?['"]([^'"]+)['"]"""), re.compile(r"""require\(\s*['"]([^'"]+)['"]\s*\)""")],
+    ".java": [re.compile(r"^\s*import\s+(?:static\s+)?([\w.]+(?:\.\*)?)\s*;")],
+    ".c": [re.compile(r"""^\s*#\s*include\s*[<"]([^>"]+)[>"]""")],
+    ".go": [re.compile(r"""^\s*(?:import\s+)?(?:[\w.]+\s+)?"([^"]+)"\s*$""")],
+}
+for _ext, _like in ((".ts", ".js"), (".cpp", ".c"), (".h", ".c"), (".hpp", ".c")):
+    _IMPORTS[_ext] = _IMPORTS[_like]
+
+
+def python_structure(text: str) -> dict:
+    """
+    Classes, functions and imports of a Python file. Nested functions are
+    left out; methods of nested classes are named Outer.Inner.method.
+    Raises SyntaxError for files ast cannot parse.
+    """
+    tree = ast.parse(text)
+    classes, functions, imports = [], [], []
+
+    def visit(body, prefix):
+        for node in body:
+            if isinstance(node, ast.ClassDef):
+                classes.append(prefix + node.name)
+                visit(node.body, f"{prefix}{node.name}.")
+            elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                functions.append(prefix + node.name)
+
+    visit(tree.body, "")
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            imports.extend(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            imports.append("." * node.level + (node.module or ""))
+    return {"classes": classes, "functions": functions, "imports": list(dict.fromkeys(imports))}
+
+
+def brace_structure(text: str, ext: str) -> dict:
+    """
+    Classes, functions and imports of a brace-language file. A symbol is a
+    class when its name was declared as a class/struct/interface-like container.
+    """
+    lines = text.splitlines()
+    containers = {match.group(1) for match in map(_CONTAINER.match, lines) if match}
+    classes, functions = [], []
+    for _, symbol in brace_boundaries(text):
+        # C++ out-of-class definitions are named Class::method
+        symbol = symbol.replace("::", ".")
+        (classes if symbol.rsplit(".", 1)[-1] in containers else functions).append(symbol)
+
+    imports = []
+    in_go_block = False
+    for line in lines:
+        if ext == ".go":
+            # import ( ... ) blocks list one path per line
+            if re.match(r"^\s*import\s*\($", line):
+                in_go_block = True
+                continue
+            if in_go_block and line.strip() == ")":
+                in_go_block = False
+                continue
+            if not in_go_block and not line.lstrip().startswith("import"):
+                continue
+        for pattern in _IMPORTS.get(ext, []):
+            imports.extend(pattern.findall(line))
+    return {"classes": classes, "functions": functions, "imports": list(dict.fromkeys(imports))}
+
+
+def file_structure(path: str) -> dict:
+    with open(path, encoding="utf-8", errors="ignore") as f:
+        text = f.read()
+    ext = os.path.splitext(path)[1].lower()
+    entry = {"lines": text.count("\n") + (1 if text and not text.endswith("\n") else 0), "classes": [], "functions": [], "imports": []}
+    try:
+        if ext == ".py":
+            entry.update(python_structure(text))
+        elif ext in BRACE_EXTS:
+            entry.update(brace_structure(text, ext))
+    except (SyntaxError, ValueError, RecursionError):
+        entry["parse_error"] = True
+    return entry
+
+
+def build_structure(repo_path: str, file_hashes: dict, previous: dict | None = None) -> dict:
+    """
+    Structural index of the files of file_hashes ({path: content hash}, paths
+    under repo_path), reusing the entries of previous whose hash is unchanged.
+    """
+    started = time.perf_counter()
+    reusable = (previous or {}).get("files", {}) if (previous or {}).get("version") == STRUCTURE_VERSION else {}
+    files, reused = {}, 0
+    for path, content_hash in sorted(file_hashes.items()):
+        rel = os.path.relpath(path, repo_path).replace(os.sep, "/")
+        if rel in reusable and reusable[rel].get("hash") == content_hash:
+            files[rel] = reusable[rel]
+            reused += 1
+            continue
+        try:
+            files[rel] = dict(file_structure(path), hash=content_hash)
+        except OSError:
+            continue
+    return {
+        "version": STRUCTURE_VERSION,
+        "built_at": time.time(),
+        "files": files,
+        "stats": {
+            "files": len(files),
+            "reused": reused,
+            "lines": sum(entry["lines"] for entry in files.values()),
+            "classes": sum(len(entry["classes"]) for entry in files.values()),
+            "functions": sum(len(entry["functions"]) for entry in files.values()),
+            "elapsed_s": round(time.perf_counter() - started, 3),
+        },
+    }
+
+
+def file_tree(structure: dict) -> list:
+    """
+    The files as nested [{"name", "type": "folder", "children"}, {"name",
+    "type": "file"}], folders first, each level sorted by name.
+    """
+    root = {}
+    for rel in structure["files"]:
+        node = root
+        *folders, name = rel.split("/")
+        for folder in folders:
+            node = node.setdefault(folder + "/", {})
+        node[name] = None
+
+    def render(node):
+        folders = sorted(key for key in node if key.endswith("/"))
+        names = sorted(key for key in node if not key.endswith("/"))
+        return [{"name": key[:-1], "type": "folder", "children": render(node[key])} for key in folders] + [
+            {"name": name, "type": "file"} for name in names
+        ]
+
+    return render(root)
+
+
+def functions_by_file(structure: dict) -> dict:
+    return {rel: entry["functions"] for rel, entry in structure["files"].items() if entry["functions"]}
+
+
+def render_tree(structure: dict, max_entries_per_folder: int = 50) -> str:
+    """
+    The file tree as indented text with line counts, folders listing at most
+    max_entries_per_folder entries.
+    """
+    files = structure["files"]
+    lines = [f"{len(files)} files, {structure['stats']['lines']} lines", "."]
+
+    def walk(nodes, prefix, path):
+        shown = nodes[:max_entries_per_folder]
+        for i, node in enumerate(shown):
+            last = i == len(shown) - 1 and len(nodes) <= max_entries_per_folder
+            branch, indent = ("└── ", "    ") if last else ("├── ", "│   ")
+            rel = f"{path}{node['name']}"
+            if node["type"] == "folder":
+                lines.append(f"{prefix}{branch}{node['name']}/")
+                walk(node["children"], prefix + indent, rel + "/")
+            else:
+                lines.append(f"{prefix}{branch}{node['name']} ({files[rel]['lines']} lines)")
+        if len(nodes) > max_entries_per_folder:
+            lines.append(f"{prefix}└── ... {len(nodes) - max_entries_per_folder} more")
+
+    walk(file_tree(structure), "", "")
+    return "\n".join(lines)
+
+
+class StructureStore:
+    """
+    Structural indices by index name, as <root>/<index_name>.json.gz with the
+    most recently used ones kept in memory. Thread-safe.
+    """
+    def __init__(self, root: str, max_cached: int = 32):
+        os.makedirs(root, exist_ok=True)
+        self.root = root
+        self.max_cached = max_cached
+        self._lock = threading.Lock()
+        self._cached = {}
+
+    def _path(self, index_name: str) -> str:
+        return os.path.join(self.root, f"{index_name}.json.gz")
+
+    def _remember(self, index_name: str, structure: dict):
+        self._cached.pop(index_name, None)
+        self._cached[index_name] = structure
+        while len(self._cached) > self.max_cached:
+            self._cached.pop(next(iter(self._cached)))
+
+    def save(self, index_name: str, structure: dict):
+        tmp_path = self._path(index_name) + ".tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            json.dump(structure, f, separators=(",", ":"))
+        os.replace(tmp_path, self._path(index_name))
+        with self._lock:
+            self._remember(index_name, structure)
+
+    def load(self, index_name: str) -> dict | None:
+        with self._lock:
+            structure = self._cached.get(index_name)
+            if structure is not None:
+                self._remember(index_name, structure)
+                return structure
+        try:
+            with gzip.open(self._path(index_name), "rt", encoding="utf-8") as f:
+                structure = json.load(f)
+        except (OSError, ValueError):
+            return None
+        with self._lock:
+            self._remember(index_name, structure)
+        return structure
+
+    def delete(self, index_name: str):
+        with self._lock:
+            self._cached.pop(index_name, None)
+        try:
+            os.remove(self._path(index_name))
+        except FileNotFoundError:
+            pass
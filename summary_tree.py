@@ -0,0 +1,371 @@
+'''
+Hierarchical repository summaries
+
+After an ingest every file is summarized once by the LLM (map), then file and
+subdirectory summaries are rolled up into one summary per directory, up to the
+repository root (reduce). Repository-wide templates are answered from the root
+and top-level directory summaries instead of a handful of retrieved chunks.
+
+Summaries are cached by content: a file's key is its content hash, a
+directory's key is derived from its children's keys, so re-indexing a changed
+repository only re-summarizes the changed files and the directories above
+them. Directories start as soon as their children are done. The builder caps
+the summary calls in flight; each call then waits for an LLM_SCHEDULER
+background slot, so the effective cap is the smaller of the two.
+'''
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from llama_index.core.schema import TextNode
+
+# Bump when the prompts change so cached summaries are regenerated
+SUMMARY_PROMPT_VERSION = 1
+
+FILE_PROMPT = (
+    "Summarize the source file below for a developer new to the repository in at most "
+    "five sentences: what it is for, its main classes or functions and what it depends on. "
+    "Answer with the summary only.\n\nFILE: {path}\n\n{text}"
+)
+DIRECTORY_PROMPT = (
+    "Below are summaries of the files and folders in the directory '{path}' of a code "
+    "repository{part}. Summarize what the directory as a whole is responsible for and how its "
+    "parts fit together in at most six sentences. Answer with the summary only.\n\n{entries}"
+)
+ROOT = "."
+
+
+def summary_key(*parts) -> str:
+    return hashlib.sha256(json.dumps([SUMMARY_PROMPT_VERSION, *parts]).encode()).hexdigest()
+
+
+class SummaryStore:
+    """
+    Summaries by key in SQLite, plus the latest summary tree of each index.
+    Thread-safe.
+    """
+    def __init__(self, db_path: str, max_entries: int = 200_000):
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._trees = {}
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS summaries (key TEXT PRIMARY KEY, summary TEXT, last_used REAL)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS trees (index_name TEXT PRIMARY KEY, tree TEXT)")
+        self._db.commit()
+
+    def get(self, key: str) -> str | None:
+        with self._lock:
+            row = self._db.execute("SELECT summary FROM summaries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._db.execute("UPDATE summaries SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._db.commit()
+            return row[0]
+
+    def put(self, key: str, summary: str):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO summaries (key, summary, last_used) VALUES (?, ?, ?)",
+                (key, summary, time.time()),
+            )
+            self._db.commit()
+
+    def prune(self):
+        with self._lock:
+            self._db.execute(
+                "DELETE FROM summaries WHERE key IN ("
+                " SELECT key FROM summaries ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            self._db.commit()
+
+    def save_tree(self, index_name: str, tree: dict):
+        with self._lock:
+            self._trees[index_name] = tree
+            self._db.execute("INSERT OR REPLACE INTO trees (index_name, tree) VALUES (?, ?)", (index_name, json.dumps(tree)))
+            self._db.commit()
+
+    def load_tree(self, index_name: str) -> dict | None:
+        with self._lock:
+            tree = self._trees.get(index_name)
+            if tree is None:
+                row = self._db.execute("SELECT tree FROM trees WHERE index_name = ?", (index_name,)).fetchone()
+                if row is not None:
+                    tree = self._trees[index_name] = json.loads(row[0])
+            return tree
+
+    def forget(self, index_name: str):
+        """
+        Drops the tree of index_name. Its summaries stay cached for other
+        indices, and for the next ingest of the same content.
+        """
+        with self._lock:
+            self._trees.pop(index_name, None)
+            self._db.execute("DELETE FROM trees WHERE index_name = ?", (index_name,))
+            self._db.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "summaries": self._db.execute("SELECT COUNT(*) FROM summaries").fetchone()[0],
+                "trees": self._db.execute("SELECT COUNT(*) FROM trees").fetchone()[0],
+            }
+
+
+class SummaryBuilder:
+    """
+    Builds the summary tree of a repository. summarize(prompt) is the LLM
+    call; counter (a context_packer.TokenCounter) keeps every prompt under
+    max_input_tokens, splitting large directories into parts that are
+    summarized first and then combined. At most concurrency calls are in
+    flight; summarize may limit them further.
+    """
+    def __init__(self, store: SummaryStore, summarize, counter, model: str, max_input_tokens: int = 3000, concurrency: int = 4):
+        self.store = store
+        self.summarize = summarize
+        self.counter = counter
+        self.model = model
+        self.max_input_tokens = max_input_tokens
+        self.concurrency = concurrency
+
+    async def _call(self, prompt: str, semaphore: asyncio.Semaphore, stats: dict) -> str:
+        async with semaphore:
+            summary = (await self.summarize(prompt)).strip()
+        stats["llm_calls"] += 1
+        return summary
+
+    async def _cached(self, key: str, make_summary, stats: dict) -> str:
+        summary = await asyncio.to_thread(self.store.get, key)
+        if summary is not None:
+            stats["cache_hits"] += 1
+            return summary
+        summary = await make_summary()
+        await asyncio.to_thread(self.store.put, key, summary)
+        return summary
+
+    def _groups(self, entries: list, overhead: int) -> list:
+        """
+        entries packed into groups that fit the input budget. Groups hold at
+        least two entries (the last one may be alone), so each round of
+        partial summaries roughly halves their number.
+        """
+        groups, current, used = [], [], 0
+        for entry in entries:
+            cost = self.counter.count(entry)
+            if len(current) >= 2 and used + cost + overhead > self.max_input_tokens:
+                groups.append(current)
+                current, used = [], 0
+            current.append(entry)
+            used += cost
+        if current:
+            groups.append(current)
+        return groups
+
+    async def _reduce(self, path: str, entries: list, semaphore, stats: dict) -> str:
+        overhead = self.counter.count(DIRECTORY_PROMPT.format(path=path, part=" (part 10 of 10)", entries=""))
+        # A single entry can never take the whole budget
+        entry_budget = max(1, (self.max_input_tokens - overhead) // 2)
+        entries = [self.counter.truncate(entry, entry_budget) for entry in entries]
+        while True:
+            groups = self._groups(entries, overhead)
+            if len(groups) <= 1:
+                return await self._call(
+                    DIRECTORY_PROMPT.format(path=path, part="", entries="\n\n".join(entries)), semaphore, stats
+                )
+            stats["partial_summaries"] += len(groups)
+            partials = await asyncio.gather(*(
+                self._call(
+                    DIRECTORY_PROMPT.format(path=path, part=f" (part {i + 1} of {len(groups)})", entries="\n\n".join(group)),
+                    semaphore, stats,
+                )
+                for i, group in enumerate(groups)
+            ))
+            entries = [f"{path} (part {i + 1}): {partial}" for i, partial in enumerate(partials)]
+
+    async def build(self, repo_path: str, file_hashes: dict, stats: dict | None = None) -> dict:
+        """
+        Summarizes the files of file_hashes ({path: content hash}, paths under
+        repo_path) and every directory above them, counting what it did in
+        stats as it goes. Returns the tree, which maps paths relative to
+        repo_path ("." for the root) to {"kind", "key", "summary", "children"}.
+        """
+        started = time.perf_counter()
+        stats = stats if stats is not None else {}
+        stats.update(files=0, directories=0, llm_calls=0, cache_hits=0, partial_summaries=0)
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        children = {ROOT: []}
+        files = {}
+        for path, content_hash in file_hashes.items():
+            rel = os.path.relpath(path, repo_path).replace(os.sep, "/")
+            files[rel] = (path, content_hash)
+            child, parent = rel, os.path.dirname(rel) or ROOT
+            while True:
+                siblings = children.setdefault(parent, [])
+                if child in siblings:
+                    break
+                siblings.append(child)
+                if parent == ROOT:
+                    break
+                child, parent = parent, os.path.dirname(parent) or ROOT
+        tree = {}
+        tasks = {}
+
+        async def summarize_file(rel):
+            path, content_hash = files[rel]
+            key = summary_key("file", self.model, rel, content_hash)
+
+            async def make_summary():
+                text = await asyncio.to_thread(_read_text, path)
+                if not text.strip():
+                    return "Empty file."
+                text = self.counter.truncate(text, self.max_input_tokens - self.counter.count(FILE_PROMPT))
+                return await self._call(FILE_PROMPT.format(path=rel, text=text), semaphore, stats)
+
+            summary = await self._cached(key, make_summary, stats)
+            stats["files"] += 1
+            tree[rel] = {"kind": "file", "key": key, "summary": summary, "children": []}
+            return key
+
+        async def summarize_directory(rel):
+            names = sorted(children[rel])
+            child_keys = await asyncio.gather(*(node(name) for name in names))
+            key = summary_key("directory", self.model, rel, list(zip(names, child_keys)))
+
+            async def make_summary():
+                if not names:
+                    return "Empty directory."
+                entries = [
+                    f"{name}{'/' if tree[name]['kind'] == 'directory' else ''}: {tree[name]['summary']}"
+                    for name in names
+                ]
+                return await self._reduce(rel, entries, semaphore, stats)
+
+            summary = await self._cached(key, make_summary, stats)
+            stats["directories"] += 1
+            tree[rel] = {"kind": "directory", "key": key, "summary": summary, "children": names}
+            return key
+
+        def node(rel):
+            # Each node is summarized once, however many times it is awaited
+            if rel not in tasks:
+                tasks[rel] = asyncio.ensure_future(summarize_file(rel) if rel in files else summarize_directory(rel))
+            return tasks[rel]
+
+        try:
+            await node(ROOT)
+        finally:
+            for task in tasks.values():
+                task.cancel()
+        await asyncio.to_thread(self.store.prune)
+        stats["elapsed_s"] = round(time.perf_counter() - started, 2)
+        return tree
+
+
+def _read_text(path: str) -> str:
+    with open(path, encoding="utf-8", errors="ignore") as f:
+        return f.read()
+
+
+def summary_nodes(tree: dict, max_depth: int = 1) -> list:
+    """
+    The root summary followed by the directory summaries down to max_depth,
+    breadth first, as TextNodes for the context packer.
+    """
+    nodes, level = [], [ROOT]
+    for depth in range(max_depth + 1):
+        following = []
+        for rel in level:
+            entry = tree.get(rel)
+            if entry is None or entry["kind"] != "directory" or not entry["summary"]:
+                continue
+            label = "repository root" if rel == ROOT else f"{rel}/"
+            nodes.append(TextNode(text=entry["summary"], metadata={"summary_of": label, "entries": len(entry["children"])}))
+            following.extend(entry["children"])
+        level = following
+    return nodes
+
+
+class SummaryJob:
+    def __init__(self, index_name: str):
+        self.index_name = index_name
+        self.status = "pending"
+        self.stats = None
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self.task = None
+
+    def summary(self) -> dict:
+        return {
+            "index_name": self.index_name,
+            "status": self.status,
+            "stats": dict(self.stats) if self.stats is not None else None,
+            "error": self.error,
+            "elapsed_s": round((self.finished_at or time.time()) - self.created_at, 1),
+        }
+
+
+class SummaryManager:
+    """
+    Builds summary trees in the background, one job per index, and stores
+    them in the builder's store when they finish, then calls on_done(index_name).
+    Use from the ES pool loop.
+    """
+    def __init__(self, builder: SummaryBuilder, on_done=None):
+        self.builder = builder
+        self.on_done = on_done
+        self._jobs = {}
+
+    async def _run(self, job: SummaryJob, repo_path: str, file_hashes: dict):
+        job.status = "running"
+        try:
+            # Filled in as the build goes, so status polls show its progress
+            job.stats = {}
+            tree = await self.builder.build(repo_path, file_hashes, job.stats)
+            await asyncio.to_thread(self.builder.store.save_tree, job.index_name, tree)
+            if self.on_done is not None:
+                self.on_done(job.index_name)
+            job.status = "done"
+            print(f"[SUMMARY] {job.index_name}: {job.stats}")
+        except asyncio.CancelledError:
+            job.status = "cancelled"
+            raise
+        except Exception as e:
+            job.status = "failed"
+            job.error = str(e)
+            print(f"[SUMMARY] {job.index_name} failed: {e}")
+        finally:
+            job.finished_at = time.time()
+
+    async def start(self, index_name: str, repo_path: str, file_hashes: dict) -> dict:
+        """
+        Starts building the tree of index_name, replacing any job still running for it.
+        """
+        self.cancel(index_name)
+        job = SummaryJob(index_name)
+        job.task = asyncio.get_running_loop().create_task(self._run(job, repo_path, file_hashes))
+        self._jobs[index_name] = job
+        return job.summary()
+
+    async def wait(self, index_name: str):
+        """
+        Returns once the job of index_name has finished, whatever its outcome.
+        """
+        job = self._jobs.get(index_name)
+        if job is not None and job.task is not None:
+            await asyncio.wait({job.task})
+
+    def cancel(self, index_name: str):
+        job = self._jobs.get(index_name)
+        if job is not None and job.task is not None and not job.task.done():
+            job.task.cancel()
+
+    def status(self, index_name: str) -> dict | None:
+        job = self._jobs.get(index_name)
+        return job.summary() if job else None
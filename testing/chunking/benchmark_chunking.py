@@ -0,0 +1,112 @@
+'''
+Benchmark for syntax-aware chunking.
+
+Chunks a repo with the old 512-token SentenceSplitter and with CodeNodeParser,
+and for each prints the chunk count, characters embedded and chunks cut through
+the middle of a Python function. If Elasticsearch is up at es_url, both are
+also embedded into scratch indices to compare index size and top-k kNN query
+latency.
+
+Run from the top-level folder: python testing/chunking/benchmark_chunking.py [repo_path]
+'''
+import ast
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.getcwd())
+from elasticsearch import AsyncElasticsearch
+from llama_index.core import SimpleDirectoryReader, VectorStoreIndex
+from llama_index.core.ingestion import IngestionPipeline
+from llama_index.core.node_parser import SentenceSplitter
+from llama_index.core.schema import MetadataMode
+from llama_index.vector_stores.elasticsearch import ElasticsearchStore
+
+from code_chunker import CodeNodeParser
+from embedding_engine import load_embed_model
+
+es_url = "http://127.0.0.1:9201"
+model_name = "sentence-transformers/all-MiniLM-L6-v2"
+required_exts = [".py", ".md", ".txt", ".js", ".json", ".ts", ".go", ".c", ".cpp", ".h", ".hpp", ".java"]
+queries = [
+    "How is data encrypted before it is stored?",
+    "Where is the configuration loaded?",
+    "What does the web dashboard do when it starts?",
+    "How does the buffer manager clear its buffer?",
+    "How does Java call into the native vault?",
+]
+query_rounds = 10
+parsers = {
+    "sentence-512": SentenceSplitter(chunk_size=512, chunk_overlap=50),
+    "code-aware": CodeNodeParser(max_chars=2000),
+}
+
+def split_functions(documents, nodes):
+    """
+    Python functions whose body ends up spread over more than one chunk.
+    """
+    split = 0
+    for document in documents:
+        if not document.metadata["file_path"].endswith(".py"):
+            continue
+        try:
+            tree = ast.parse(document.text)
+        except SyntaxError:
+            continue
+        chunks = [n for n in nodes if n.metadata["file_path"] == document.metadata["file_path"]]
+        for fn in ast.walk(tree):
+            if isinstance(fn, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                source = ast.get_source_segment(document.text, fn)
+                if source and not any(source in c.get_content(metadata_mode=MetadataMode.NONE) for c in chunks):
+                    split += 1
+    return split
+
+async def measure_index(name, nodes, embed_model):
+    client = AsyncElasticsearch(es_url, request_timeout=120)
+    index_name = f"github_rag_index_benchmark_chunking_{name.replace('-', '_')}"
+    try:
+        await client.options(ignore_status=404).indices.delete(index=index_name)
+        store = ElasticsearchStore(index_name=index_name, es_client=client)
+        await store.async_add(nodes)
+        await client.indices.refresh(index=index_name)
+        await client.indices.forcemerge(index=index_name, max_num_segments=1)
+        size = (await client.indices.stats(index=index_name))["_all"]["primaries"]["store"]["size_in_bytes"]
+
+        retriever = VectorStoreIndex.from_vector_store(store, embed_model=embed_model).as_retriever(similarity_top_k=4)
+        await retriever.aretrieve(queries[0])
+        latencies, context_chars = [], 0
+        for _ in range(query_rounds):
+            for query in queries:
+                start = time.perf_counter()
+                results = await retriever.aretrieve(query)
+                latencies.append(time.perf_counter() - start)
+                context_chars += sum(len(r.node.get_content()) for r in results)
+        latencies.sort()
+        return {
+            "index_kb": round(size / 1024, 1),
+            "p50_ms": round(latencies[len(latencies) // 2] * 1000, 1),
+            "p95_ms": round(latencies[int(len(latencies) * 0.95)] * 1000, 1),
+            "context_chars_per_query": context_chars // len(latencies),
+        }
+    finally:
+        await client.options(ignore_status=404).indices.delete(index=index_name)
+        await client.close()
+
+if __name__ == "__main__":
+    repo_path = sys.argv[1] if len(sys.argv) > 1 else "test"
+    documents = SimpleDirectoryReader(input_dir=repo_path, recursive=True, required_exts=required_exts).load_data()
+    embed_model = load_embed_model(model_name)
+    print(f"{len(documents)} documents from {repo_path}")
+
+    for name, parser in parsers.items():
+        nodes = IngestionPipeline(transformations=[parser]).run(documents=documents)
+        embedded_chars = sum(len(n.get_content(metadata_mode=MetadataMode.EMBED)) for n in nodes)
+        print(f"{name}: {len(nodes)} chunks, {embedded_chars} chars embedded, "
+              f"{split_functions(documents, nodes)} Python functions split across chunks")
+
+        nodes = IngestionPipeline(transformations=[embed_model]).run(nodes=nodes)
+        try:
+            print(f"  {asyncio.run(measure_index(name, nodes, embed_model))}")
+        except Exception as e:
+            print(f"  index/query benchmark skipped: {e}")
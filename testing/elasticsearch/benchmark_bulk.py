@@ -0,0 +1,81 @@
+'''
+Benchmark for the Elasticsearch bulk-load profile.
+
+Writes the same synthetic chunks (random 384-dim vectors plus text) into a
+scratch index through ElasticsearchStore.async_add with default settings, and
+through BulkWriter under bulk_load_profile at several bulk sizes and
+parallelism levels, and prints docs/s for each. Needs a local single-node
+Elasticsearch at es_url.
+
+Run from the top-level folder: python testing/elasticsearch/benchmark_bulk.py [num_docs]
+'''
+import asyncio
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.getcwd())
+from elasticsearch import AsyncElasticsearch
+from llama_index.core.schema import TextNode
+from llama_index.vector_stores.elasticsearch import ElasticsearchStore
+
+from es_ingest import BulkWriter, bulk_load_profile
+
+es_url = "http://127.0.0.1:9201"
+index_name = "github_rag_index_benchmark_bulk"
+dims = 384
+batch = 1000  # chunks handed to the writer at a time, roughly one ingest batch
+configs = [(500, 1), (500, 4), (1000, 4), (250, 8)]
+
+def make_nodes(num_docs):
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((num_docs, dims)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return [
+        TextNode(text=f"chunk {i} " + "lorem ipsum dolor sit amet " * 60, embedding=vectors[i].tolist(),
+                 metadata={"file_path": f"/tmp/repo/file_{i % 200}.py"})
+        for i in range(num_docs)
+    ]
+
+async def create_index(client):
+    await client.options(ignore_status=404).indices.delete(index=index_name)
+    body = {"mappings": {"properties": {"embedding": {"type": "dense_vector", "dims": dims, "index": True, "similarity": "cosine"}}}}
+    await client.indices.create(index=index_name, body=body)
+
+async def timed_load(client, nodes, writer):
+    start = time.perf_counter()
+    for i in range(0, len(nodes), batch):
+        await writer.async_add(nodes[i:i + batch])
+    await client.indices.refresh(index=index_name)
+    seconds = time.perf_counter() - start
+    count = (await client.count(index=index_name))["count"]
+    return seconds, count
+
+async def main(num_docs):
+    client = AsyncElasticsearch(es_url, request_timeout=120)
+    nodes = make_nodes(num_docs)
+    print(f"{num_docs} docs, {dims} dims")
+    try:
+        await create_index(client)
+        store = ElasticsearchStore(index_name=index_name, es_client=client)
+        seconds, count = await timed_load(client, nodes, store)
+        print(f"default async_add:            {num_docs / seconds:8.1f} docs/s ({count} indexed)")
+
+        for chunk_size, parallel in configs:
+            await create_index(client)
+            writer = BulkWriter(ElasticsearchStore(index_name=index_name, es_client=client), chunk_size, parallel)
+            profile_stats = {}
+            async with bulk_load_profile(client, index_name, stats=profile_stats):
+                seconds, _ = await timed_load(client, nodes, writer)
+            seconds += profile_stats["restore_s"]
+            count = (await client.count(index=index_name))["count"]
+            print(f"bulk chunk={chunk_size:<5} parallel={parallel}: {num_docs / seconds:8.1f} docs/s "
+                  f"({count} indexed, restore {profile_stats['restore_s']}s)")
+    finally:
+        await client.options(ignore_status=404).indices.delete(index=index_name)
+        await client.close()
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000))
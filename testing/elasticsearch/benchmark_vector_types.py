@@ -0,0 +1,98 @@
+'''
+Benchmark for quantized vector index types.
+
+Loads the same synthetic embeddings (random 384-dim unit vectors, or the real
+chunks of a repo if a path is given) into one scratch index per vector index
+type. Prints each index's on-disk size and estimated vector memory, plus
+top-k overlap with the float hnsw baseline and mean kNN latency over a fixed
+set of query vectors. Needs Elasticsearch at es_url.
+
+Run from the top-level folder: python testing/elasticsearch/benchmark_vector_types.py [num_docs | repo_path]
+'''
+import asyncio
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.getcwd())
+from elasticsearch import AsyncElasticsearch
+from elasticsearch.helpers import async_bulk
+
+from vector_index import choose_index_options, index_footprint
+
+es_url = "http://127.0.0.1:9201"
+dims = 384
+index_prefix = "github_rag_index_benchmark_vectors"
+types = ["hnsw", "int8_hnsw", "int4_hnsw", "bbq_hnsw", "flat", "int8_flat"]
+num_queries = 50
+top_k = 10
+num_candidates = 100
+
+def load_vectors(arg):
+    if arg and os.path.isdir(arg):
+        from llama_index.core import SimpleDirectoryReader
+        from code_chunker import CodeNodeParser
+        from embedding_engine import load_embed_model
+
+        documents = SimpleDirectoryReader(input_dir=arg, recursive=True).load_data()
+        nodes = CodeNodeParser().get_nodes_from_documents(documents)
+        model = load_embed_model("sentence-transformers/all-MiniLM-L6-v2")
+        vectors = np.array(model.get_text_embedding_batch([n.get_content() for n in nodes]), dtype=np.float32)
+    else:
+        rng = np.random.default_rng(0)
+        vectors = rng.standard_normal((int(arg or 20000), dims)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+async def load_index(client, index_name, index_options, vectors):
+    await client.options(ignore_status=404).indices.delete(index=index_name)
+    await client.indices.create(index=index_name, body={"mappings": {"properties": {"embedding": {
+        "type": "dense_vector", "dims": dims, "index": True, "similarity": "cosine", "index_options": index_options,
+    }}}})
+    actions = ({"_index": index_name, "_id": str(i), "embedding": v.tolist()} for i, v in enumerate(vectors))
+    await async_bulk(client, actions, chunk_size=1000, refresh=True)
+    await client.indices.forcemerge(index=index_name, max_num_segments=1)
+
+async def search_all(client, index_name, queries):
+    results, start = [], time.perf_counter()
+    for query in queries:
+        response = await client.search(index=index_name, size=top_k, source=False, knn={
+            "field": "embedding", "query_vector": query.tolist(), "k": top_k, "num_candidates": num_candidates,
+        })
+        results.append([hit["_id"] for hit in response["hits"]["hits"]])
+    return results, (time.perf_counter() - start) / len(queries) * 1000
+
+async def main(arg):
+    vectors = load_vectors(arg)
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.choice(len(vectors), size=min(num_queries, len(vectors)), replace=False)]
+    print(f"{len(vectors)} vectors, {len(queries)} queries, top {top_k}, auto type: {choose_index_options(len(vectors))['type']}")
+
+    client = AsyncElasticsearch(es_url, request_timeout=600)
+    baseline = None
+    try:
+        for index_type in types:
+            index_name = f"{index_prefix}_{index_type}"
+            try:
+                await load_index(client, index_name, choose_index_options(len(vectors), override=index_type), vectors)
+            except Exception as e:
+                print(f"{index_type:<10} not supported by this cluster: {e}")
+                continue
+            results, latency_ms = await search_all(client, index_name, queries)
+            if baseline is None:
+                baseline = results
+            overlap = np.mean([len(set(a) & set(b)) / top_k for a, b in zip(results, baseline)])
+            report = await index_footprint(client, index_name, detailed=True)
+            print(f"{index_type:<10} disk {report['store_bytes'] / 1024**2:7.1f} MB  "
+                  f"vectors on disk {report['field_disk_bytes'].get('embedding', 0) / 1024**2:7.1f} MB  "
+                  f"vector RAM {report['vector_memory_bytes'] / 1024**2:7.1f} MB  "
+                  f"overlap@{top_k} {overlap:.3f}  {latency_ms:6.1f} ms/query")
+            await client.indices.delete(index=index_name)
+    finally:
+        for index_type in types:
+            await client.options(ignore_status=404).indices.delete(index=f"{index_prefix}_{index_type}")
+        await client.close()
+
+if __name__ == "__main__":
+    asyncio.run(main(sys.argv[1] if len(sys.argv) > 1 else None))
@@ -0,0 +1,89 @@
+'''
+Regression check for the bulk-load profile on a fresh index.
+
+Creates an index through RAGES.setup_fresh_index, loads it inside
+bulk_load_profile the way set_up_pipeline does, and checks the settings the
+index is left with: none of refresh and replicas may still be at its
+BULK_LOAD_SETTINGS value. Runs against a small in-memory stand-in for the ES
+index settings API, so it needs no Elasticsearch.
+
+Run from the top-level folder: python testing/elasticsearch/check_bulk_profile.py
+'''
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.getcwd())
+import RAGES
+from es_ingest import BULK_LOAD_SETTINGS, bulk_load_profile
+
+index_name = "github_rag_index_check_bulk_profile"
+
+class FakeIndices:
+    def __init__(self):
+        # Index-level settings as flat "index.*" keys, absent when left at the cluster default
+        self.settings = {}
+
+    def exists(self, index):
+        return index in self.settings
+
+    def delete(self, index):
+        self.settings.pop(index, None)
+
+    def create(self, index, body):
+        self.settings[index] = {
+            f"index.{name}": str(value) for name, value in body.get("settings", {}).items() if name != "analysis"
+        }
+
+class AsyncFakeIndices:
+    def __init__(self, indices):
+        self.indices = indices
+        self.puts = []
+
+    async def get_settings(self, index, name, flat_settings):
+        values = self.indices.settings[index]
+        return {index: {"settings": {key: values[key] for key in name if key in values}}}
+
+    async def put_settings(self, index, settings):
+        self.puts.append(dict(settings))
+        for name, value in settings.items():
+            if value is None:
+                self.indices.settings[index].pop(f"index.{name}", None)
+            else:
+                self.indices.settings[index][f"index.{name}"] = str(value)
+
+    async def refresh(self, index):
+        pass
+
+class FakeClient:
+    def __init__(self, indices):
+        self.indices = indices
+
+class FakePool:
+    def __init__(self):
+        self.sync = FakeClient(FakeIndices())
+        self.client = FakeClient(AsyncFakeIndices(self.sync.indices))
+
+async def main():
+    pool = RAGES.ES_POOL = FakePool()
+    RAGES.setup_fresh_index(index_name, estimated_chunks=1000)
+    created = dict(pool.sync.indices.settings[index_name])
+
+    async with bulk_load_profile(pool.client, index_name):
+        during = dict(pool.sync.indices.settings[index_name])
+    after = pool.sync.indices.settings[index_name]
+
+    print(f"created: {created}\nduring load: {during}\nafter load: {after}")
+    bulk = {f"index.{name}": str(value) for name, value in BULK_LOAD_SETTINGS.items()}
+    if during != bulk:
+        print("FAIL: the load did not run with the bulk-load settings")
+        return False
+    left = {key: value for key, value in after.items() if bulk.get(key) == value}
+    if left:
+        print(f"FAIL: the load left the index with the bulk-load settings {left}")
+        return False
+    print("OK: the index is back at its serving settings")
+    return True
+
+if __name__ == "__main__":
+    sys.exit(0 if asyncio.run(main()) else 1)
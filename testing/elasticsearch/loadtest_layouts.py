@@ -0,0 +1,117 @@
+'''
+Load test for the dedicated and shared index layouts.
+
+For each session count, creates that many synthetic sessions (random 384-dim
+unit vectors, docs_per_session chunks each) in both layouts: one index per
+session, and sessions packed into a few shared indices with a tenant field and
+routing. Prints the cluster's index and shard counts, JVM heap used after a GC
+settles, and p50/p95 latency of tenant-scoped kNN queries spread over all
+sessions. Needs Elasticsearch at es_url; everything it creates is deleted.
+
+Run from the top-level folder: python testing/elasticsearch/loadtest_layouts.py [sessions ...]
+'''
+import asyncio
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.getcwd())
+from elasticsearch import AsyncElasticsearch
+from elasticsearch.helpers import async_bulk
+
+from index_layout import IndexLayout
+
+es_url = "http://127.0.0.1:9201"
+dims = 384
+docs_per_session = 500
+session_prefix = "github_rag_index_loadtest"
+shared_prefix = "codemap_shared_loadtest"
+shared_indices = 2
+index_options = {"type": "int8_hnsw", "m": 16, "ef_construction": 100}
+num_queries = 200
+concurrency = 8
+top_k = 2
+num_candidates = 100
+
+def mapping():
+    return {"mappings": {
+        "dynamic_templates": [{"metadata_as_keywords": {
+            "path_match": "metadata.*", "match_mapping_type": "string", "mapping": {"type": "keyword"},
+        }}],
+        "properties": {"embedding": {
+            "type": "dense_vector", "dims": dims, "index": True, "similarity": "cosine", "index_options": index_options,
+        }},
+    }}
+
+async def load_sessions(client, layout, sessions, rng):
+    for index in layout.physical_indices():
+        await client.indices.create(index=index, body=mapping())
+    for name in sessions:
+        location = layout.resolve(name)
+        if not layout.shared:
+            await client.indices.create(index=location.index, body=mapping())
+        vectors = rng.standard_normal((docs_per_session, dims)).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        metadata = {"tenant": location.tenant} if location.tenant else {}
+        actions = (
+            {"_index": location.index, "_routing": location.routing, "embedding": v.tolist(), "metadata": metadata}
+            for v in vectors
+        )
+        await async_bulk(client, actions, chunk_size=1000)
+    await client.indices.refresh(index=f"{session_prefix}_*,{shared_prefix}_*")
+
+async def cluster_footprint(client):
+    # Let the cluster settle so heap reflects what the indices hold, not the load
+    await asyncio.sleep(5)
+    stats = await client.nodes.stats(metric="jvm,indices")
+    heap = sum(node["jvm"]["mem"]["heap_used_in_bytes"] for node in stats["nodes"].values())
+    health = await client.cluster.health()
+    indices = await client.cat.indices(index=f"{session_prefix}_*,{shared_prefix}_*", format="json")
+    return len(indices), health["active_shards"], heap
+
+async def query_latencies(client, layout, sessions, rng):
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(name):
+        location = layout.resolve(name)
+        vector = rng.standard_normal(dims)
+        knn = {"field": "embedding", "query_vector": (vector / np.linalg.norm(vector)).tolist(), "k": top_k, "num_candidates": num_candidates}
+        if location.filters():
+            knn["filter"] = location.filters()
+        async with semaphore:
+            start = time.perf_counter()
+            await client.search(index=location.index, knn=knn, size=top_k, source=False, routing=location.routing)
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(one(sessions[i % len(sessions)]) for i in range(num_queries)))
+    latencies.sort()
+    return latencies[len(latencies) // 2] * 1000, latencies[int(len(latencies) * 0.95)] * 1000
+
+async def cleanup(client):
+    await client.options(ignore_status=404).indices.delete(index=f"{session_prefix}_*,{shared_prefix}_*")
+
+async def main(session_counts):
+    client = AsyncElasticsearch(es_url, request_timeout=600)
+    rng = np.random.default_rng(0)
+    print(f"{docs_per_session} chunks per session, {num_queries} queries at concurrency {concurrency}")
+    try:
+        await cleanup(client)
+        for count in session_counts:
+            sessions = [f"{session_prefix}_{i:05d}" for i in range(count)]
+            for mode in ("dedicated", "shared"):
+                layout = IndexLayout(mode, shared_indices=shared_indices, shared_prefix=shared_prefix)
+                await load_sessions(client, layout, sessions, rng)
+                indices, shards, heap = await cluster_footprint(client)
+                p50, p95 = await query_latencies(client, layout, sessions, rng)
+                print(f"{count:>5} sessions {mode:<9}  indices {indices:>5}  shards {shards:>5}  "
+                      f"heap {heap / 1024**2:8.1f} MB  p50 {p50:6.1f} ms  p95 {p95:6.1f} ms")
+                await cleanup(client)
+    finally:
+        await cleanup(client)
+        await client.close()
+
+if __name__ == "__main__":
+    asyncio.run(main([int(arg) for arg in sys.argv[1:]] or [10, 100, 500]))
@@ -0,0 +1,108 @@
+'''
+Benchmark for the CPU embedding backends.
+
+Loads each backend (torch, int8, onnx) in its own process and reports model load
+time, chunk throughput, single-query latency and peak RSS, then compares the
+top-k chunks retrieved for the prompt templates against the full-precision
+torch model (overlap@k).
+
+Run from the top-level folder: python testing/embeddings/benchmark_backends.py [repo_path]
+'''
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.getcwd())
+from embedding_engine import EMBED_BACKENDS, load_embed_model
+
+model_name = "sentence-transformers/all-MiniLM-L6-v2"
+prompts_file = "CodeMap-prompts/prompt_templates.json"
+required_exts = [".py", ".md", ".txt", ".js", ".json", ".ts", ".go", ".c", ".cpp", ".h", ".hpp", ".java"]
+expected_dims = 384
+top_k = 5
+query_repeats = 20
+
+def load_chunks(repo_path):
+    from llama_index.core import SimpleDirectoryReader
+    from llama_index.core.node_parser import SentenceSplitter
+    from llama_index.core.schema import MetadataMode
+
+    documents = SimpleDirectoryReader(input_dir=repo_path, recursive=True, required_exts=required_exts).load_data()
+    nodes = SentenceSplitter(chunk_size=512, chunk_overlap=50).get_nodes_from_documents(documents)
+    return [node.get_content(metadata_mode=MetadataMode.EMBED) for node in nodes]
+
+def run_backend(backend, texts, queries, results):
+    try:
+        start = time.perf_counter()
+        embed_model = load_embed_model(model_name, batch_size=32, backend=backend)
+        load_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        chunk_vectors = embed_model.get_text_embedding_batch(texts)
+        chunk_seconds = time.perf_counter() - start
+
+        query_vectors = [embed_model.get_query_embedding(q) for q in queries]
+        start = time.perf_counter()
+        for _ in range(query_repeats):
+            embed_model.get_query_embedding(queries[0])
+        query_ms = (time.perf_counter() - start) / query_repeats * 1000
+
+        results[backend] = {
+            "load_s": load_seconds,
+            "chunks_per_s": len(texts) / chunk_seconds,
+            "query_ms": query_ms,
+            # ru_maxrss is in KiB on Linux
+            "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            "chunk_vectors": chunk_vectors,
+            "query_vectors": query_vectors,
+        }
+    except Exception as e:
+        results[backend] = {"error": str(e)}
+
+def top_k_ids(chunk_vectors, query_vectors):
+    chunks = np.array(chunk_vectors, dtype=np.float32)
+    chunks /= np.linalg.norm(chunks, axis=1, keepdims=True)
+    ranked = []
+    for query in query_vectors:
+        q = np.array(query, dtype=np.float32)
+        ranked.append(set(np.argsort(-(chunks @ (q / np.linalg.norm(q))))[:top_k].tolist()))
+    return ranked
+
+if __name__ == "__main__":
+    repo_path = sys.argv[1] if len(sys.argv) > 1 else "test"
+    texts = load_chunks(repo_path)
+    with open(prompts_file) as f:
+        queries = [template["prompt"] for template in json.load(f).values()]
+    print(f"{len(texts)} chunks from {repo_path}, {len(queries)} template queries, top_k={top_k}")
+
+    ctx = multiprocessing.get_context("spawn")
+    with ctx.Manager() as manager:
+        results = manager.dict()
+        for backend in EMBED_BACKENDS:
+            process = ctx.Process(target=run_backend, args=(backend, texts, queries, results))
+            process.start()
+            process.join()
+        results = dict(results)
+
+    baseline = results.get("torch", {})
+    baseline_top = top_k_ids(baseline["chunk_vectors"], baseline["query_vectors"]) if "chunk_vectors" in baseline else None
+
+    print(f"{'backend':<8} {'dims':>5} {'load s':>7} {'chunks/s':>9} {'query ms':>9} {'peak MB':>8} {'overlap@k':>10}")
+    for backend in EMBED_BACKENDS:
+        r = results[backend]
+        if "error" in r:
+            print(f"{backend:<8} failed: {r['error']}")
+            continue
+        dims = len(r["chunk_vectors"][0])
+        overlap = "-"
+        if baseline_top is not None:
+            top = top_k_ids(r["chunk_vectors"], r["query_vectors"])
+            overlap = f"{np.mean([len(a & b) / top_k for a, b in zip(top, baseline_top)]):.3f}"
+        flag = "" if dims == expected_dims else "  (dims mismatch)"
+        print(f"{backend:<8} {dims:>5} {r['load_s']:>7.2f} {r['chunks_per_s']:>9.1f} {r['query_ms']:>9.2f} "
+              f"{r['peak_rss_mb']:>8.0f} {overlap:>10}{flag}")
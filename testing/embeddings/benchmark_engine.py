@@ -0,0 +1,61 @@
+'''
+Benchmark for the multi-process embedding engine.
+
+Chunks a repo the same way set_up_pipeline does, embeds the chunks with the plain
+HuggingFaceEmbedding model and with ParallelEmbedding at several worker counts,
+checks the vectors agree within float tolerance and prints chunks/s overall and
+per worker.
+
+Run from the top-level folder: python testing/embeddings/benchmark_engine.py [repo_path]
+'''
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.getcwd())
+from llama_index.core import SimpleDirectoryReader
+from llama_index.core.node_parser import SentenceSplitter
+from llama_index.core.schema import MetadataMode
+
+from embedding_engine import ParallelEmbedding, load_embed_model
+
+model_name = "sentence-transformers/all-MiniLM-L6-v2"
+required_exts = [".py", ".md", ".txt", ".js", ".json", ".ts", ".go", ".c", ".cpp", ".h", ".hpp", ".java"]
+worker_counts = [1, 2, 4]
+batch_size = 32
+tolerance = 1e-4
+
+def load_chunks(repo_path):
+    documents = SimpleDirectoryReader(input_dir=repo_path, recursive=True, required_exts=required_exts).load_data()
+    nodes = SentenceSplitter(chunk_size=512, chunk_overlap=50).get_nodes_from_documents(documents)
+    return [node.get_content(metadata_mode=MetadataMode.EMBED) for node in nodes]
+
+def timed(embed_fn, texts):
+    start = time.perf_counter()
+    vectors = embed_fn(texts)
+    return np.array(vectors, dtype=np.float32), time.perf_counter() - start
+
+if __name__ == "__main__":
+    repo_path = sys.argv[1] if len(sys.argv) > 1 else "test"
+    texts = load_chunks(repo_path)
+    print(f"{len(texts)} chunks from {repo_path}")
+
+    baseline_model = load_embed_model(model_name, batch_size=10)
+    baseline, seconds = timed(baseline_model.get_text_embedding_batch, texts)
+    print(f"baseline (default settings): {len(texts) / seconds:8.1f} chunks/s")
+
+    for workers in worker_counts:
+        engine = ParallelEmbedding(load_embed_model(model_name, batch_size), workers=workers, batch_size=batch_size)
+        # First call pays for worker start-up and model loading
+        engine.get_text_embedding_batch(texts[:batch_size])
+        warm = engine.snapshot()
+
+        vectors, seconds = timed(engine.get_text_embedding_batch, texts)
+        max_diff = float(np.abs(vectors - baseline).max())
+        status = "OK" if max_diff <= tolerance else "MISMATCH"
+        print(f"workers={workers}: {len(texts) / seconds:8.1f} chunks/s, max |diff| {max_diff:.2e} [{status}]")
+        for worker, stats in engine.worker_stats(since=warm).items():
+            print(f"  worker {worker}: {stats['chunks']} chunks, {stats['chunks_per_s']} chunks/s")
+        engine.close()
@@ -0,0 +1,89 @@
+'''
+Local stand-in for the GitHub archive endpoint.
+
+Serves the test/ fixture repo as a tarball (or zipball) from a local HTTP server
+and runs get_repo_archive against it, so the bulk download path can be checked
+without a token or network access.
+
+Run from the top-level folder: python testing/githubRest/archive_standin.py
+'''
+import io
+import os
+import sys
+import tarfile
+import tempfile
+import threading
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.getcwd())
+from github_api_calls import get_repo_archive
+
+fixture_dir = "test"
+archive_root = "owner-repo-0123456"
+
+def build_tarball(source_dir):
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as tar:
+        tar.add(source_dir, arcname=archive_root)
+    return buffer.getvalue()
+
+def build_zipball(source_dir):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        for root, _, files in os.walk(source_dir):
+            for name in files:
+                full_path = os.path.join(root, name)
+                rel_path = os.path.relpath(full_path, source_dir)
+                archive.write(full_path, f"{archive_root}/{rel_path}")
+    return buffer.getvalue()
+
+def make_handler(archives):
+    class ArchiveHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            archive_format = self.path.rstrip("/").split("/")[-1]
+            body = archives.get(archive_format)
+            if body is None:
+                self.send_response(404)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return ArchiveHandler
+
+def list_files(directory):
+    found = set()
+    for root, _, files in os.walk(directory):
+        for name in files:
+            found.add(os.path.relpath(os.path.join(root, name), directory))
+    return found
+
+if __name__ == "__main__":
+    archives = {
+        "tarball": build_tarball(fixture_dir),
+        "zipball": build_zipball(fixture_dir),
+    }
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(archives))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/repos/owner/repo"
+
+    expected = list_files(fixture_dir)
+    try:
+        for archive_format in archives:
+            with tempfile.TemporaryDirectory() as save_path:
+                count = get_repo_archive({}, url, save_path, archive_format=archive_format)
+                extracted = list_files(save_path)
+                status = "OK" if extracted == expected else "MISMATCH"
+                print(f"{archive_format}: {count} files extracted [{status}]")
+                if extracted != expected:
+                    print(f"  missing: {sorted(expected - extracted)}")
+                    print(f"  extra:   {sorted(extracted - expected)}")
+    finally:
+        server.shutdown()
@@ -0,0 +1,50 @@
+'''
+Benchmark for streaming vs batch ingestion.
+
+Ingests a repo into a throwaway index once per ingest mode, each in a fresh
+Python process so the peak RSS of one run does not leak into the next, and
+prints wall time, peak RSS and throughput side by side. Needs Elasticsearch at
+ES_URL, like the app.
+
+Run from the top-level folder: python testing/ingest/benchmark_streaming.py [repo_path]
+'''
+import json
+import os
+import subprocess
+import sys
+
+sys.path.insert(0, os.getcwd())
+
+modes = ["batch", "streaming"]
+index_name = "github_rag_index_benchmark_streaming"
+
+def run_mode(repo_path, mode):
+    import RAGES
+
+    RAGES.set_up_app()
+    try:
+        _, _, stats = RAGES.ES_POOL.submit(RAGES.set_up_pipeline(repo_path, index_name, ingest_mode=mode)).result()
+        print(json.dumps({"performance": stats["performance"], "chunks": stats["chunks"]["updated"]}))
+    finally:
+        RAGES.ES_POOL.sync.options(ignore_status=404).indices.delete(index=index_name)
+        RAGES.EMBED_ENGINE.close()
+
+if __name__ == "__main__":
+    if len(sys.argv) > 2 and sys.argv[1] == "--child":
+        run_mode(sys.argv[3], sys.argv[2])
+        sys.exit(0)
+
+    repo_path = sys.argv[1] if len(sys.argv) > 1 else "test"
+    results = {}
+    for mode in modes:
+        output = subprocess.run(
+            [sys.executable, __file__, "--child", mode, repo_path],
+            capture_output=True, text=True, check=True,
+        ).stdout
+        results[mode] = json.loads(output.strip().splitlines()[-1])
+
+    print(f"{'mode':>10} {'wall s':>8} {'peak RSS MB':>12} {'growth MB':>10} {'chunks/s':>9}")
+    for mode, result in results.items():
+        perf = result["performance"]
+        rate = result["chunks"] / perf["wall_s"] if perf["wall_s"] else 0.0
+        print(f"{mode:>10} {perf['wall_s']:>8} {perf['peak_rss_mb']:>12} {perf['growth_mb']:>10} {rate:>9.1f}")
@@ -0,0 +1,45 @@
+'''
+Regression check for PrioritySemaphore queueing.
+
+With limit=2 and one slot reserved for live queries, one background holder
+and one background waiter, a live acquire must get the reserved slot straight
+away instead of queueing behind the background waiter until the holder
+releases. Needs nothing but this repo.
+
+Run from the top-level folder: python testing/llm/check_priority_wake.py
+'''
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.getcwd())
+from llm_scheduler import BACKGROUND_PRIORITY, LIVE_PRIORITY, PrioritySemaphore
+
+timeout_s = 1.0
+
+async def main():
+    scheduler = PrioritySemaphore(2, reserved_for_live=1)
+    await scheduler.acquire(BACKGROUND_PRIORITY)
+    background_waiter = asyncio.create_task(scheduler.acquire(BACKGROUND_PRIORITY))
+    await asyncio.sleep(0)
+    print(f"before live acquire: {scheduler.stats()}")
+
+    try:
+        await asyncio.wait_for(scheduler.acquire(LIVE_PRIORITY), timeout_s)
+    except asyncio.TimeoutError:
+        print(f"FAIL: live acquire blocked with the reserved slot free: {scheduler.stats()}")
+        sys.exit(1)
+    stats = scheduler.stats()
+    print(f"after live acquire:  {stats}")
+    assert stats["active"] == 2 and stats["waiting_background"] == 1 and stats["waiting_live"] == 0
+
+    # Background holder finishes: the background waiter takes its slot
+    scheduler.release(BACKGROUND_PRIORITY)
+    await asyncio.wait_for(background_waiter, timeout_s)
+    scheduler.release(BACKGROUND_PRIORITY)
+    scheduler.release(LIVE_PRIORITY)
+    assert scheduler.stats()["active"] == 0
+    print("OK")
+
+if __name__ == "__main__":
+    asyncio.run(main())
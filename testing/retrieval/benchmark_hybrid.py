@@ -0,0 +1,100 @@
+'''
+Benchmark for hybrid retrieval and HNSW settings.
+
+Indexes a repo (test/ by default) once per HNSW configuration, then runs a
+fixed query set, each query labelled with the file that answers it, through
+the dense, bm25 and hybrid retrievers at several num_candidates values. Prints
+recall@k (did the expected file come back) and p50/p95 retrieval latency.
+Needs Elasticsearch at es_url and the embedding model.
+
+Run from the top-level folder: python testing/retrieval/benchmark_hybrid.py [repo_path]
+'''
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.getcwd())
+from elasticsearch import AsyncElasticsearch
+from llama_index.core import SimpleDirectoryReader
+from llama_index.core.ingestion import IngestionPipeline
+from llama_index.vector_stores.elasticsearch import ElasticsearchStore
+
+from code_chunker import CodeNodeParser
+from embedding_engine import load_embed_model
+from retrieval import CODE_ANALYSIS, RETRIEVAL_MODES, HybridRetriever
+
+es_url = "http://127.0.0.1:9201"
+model_name = "sentence-transformers/all-MiniLM-L6-v2"
+dims = 384
+index_name = "github_rag_index_benchmark_hybrid"
+top_k = 2
+rounds = 5
+hnsw_configs = [(16, 100), (32, 200), (8, 50)]
+num_candidates_values = [10, 50, 100]
+# (query, file expected among the top_k results) for the test/ fixture repo
+queries = [
+    ("encrypt_data", "encryptor.c"),
+    ("How is the payload encrypted?", "encryptor.c"),
+    ("BufferManager clearBuffer", "buffer_mgmt.cpp"),
+    ("pushData", "buffer_mgmt.cpp"),
+    ("load_config", "main.py"),
+    ("Where is the settings file read?", "main.py"),
+    ("triggerEncryption", "dashboard.ts"),
+    ("What happens when the dashboard initializes?", "dashboard.ts"),
+    ("formatBytes", "utils.js"),
+    ("onStorageRequest native bridge", "NativeVault.java"),
+    ("What is the overall architecture of the system?", "architecture.md"),
+    ("Which Python packages are required?", "requirements.txt"),
+]
+
+async def build_index(client, nodes, m, ef_construction):
+    await client.options(ignore_status=404).indices.delete(index=index_name)
+    await client.indices.create(index=index_name, body={
+        "settings": {"analysis": CODE_ANALYSIS},
+        "mappings": {"properties": {
+            "content": {"type": "text", "analyzer": "code"},
+            "embedding": {
+                "type": "dense_vector", "dims": dims, "index": True, "similarity": "cosine",
+                "index_options": {"type": "int8_hnsw", "m": m, "ef_construction": ef_construction},
+            },
+        }},
+    })
+    await ElasticsearchStore(index_name=index_name, es_client=client).async_add(nodes)
+    await client.indices.refresh(index=index_name)
+
+async def evaluate(client, embed_model, mode, num_candidates):
+    retriever = HybridRetriever(client, index_name, embed_model, mode=mode, top_k=top_k, num_candidates=num_candidates)
+    hits, latencies = 0, []
+    for round_ in range(rounds):
+        for query, expected in queries:
+            start = time.perf_counter()
+            results = await retriever.aretrieve(query)
+            latencies.append(time.perf_counter() - start)
+            if round_ == 0:
+                hits += any(r.node.metadata.get("file_name") == expected for r in results)
+    latencies.sort()
+    return hits / len(queries), latencies[len(latencies) // 2] * 1000, latencies[int(len(latencies) * 0.95)] * 1000
+
+async def main(repo_path):
+    documents = SimpleDirectoryReader(input_dir=repo_path, recursive=True).load_data()
+    embed_model = load_embed_model(model_name)
+    nodes = IngestionPipeline(transformations=[CodeNodeParser(), embed_model]).run(documents=documents)
+    print(f"{len(nodes)} chunks from {repo_path}, {len(queries)} queries, recall@{top_k}")
+
+    client = AsyncElasticsearch(es_url, request_timeout=120)
+    try:
+        for m, ef_construction in hnsw_configs:
+            await build_index(client, nodes, m, ef_construction)
+            print(f"m={m} ef_construction={ef_construction}")
+            for mode in RETRIEVAL_MODES:
+                for num_candidates in (num_candidates_values if mode != "bm25" else [None]):
+                    recall, p50, p95 = await evaluate(client, embed_model, mode, num_candidates or 100)
+                    label = f"{mode} num_candidates={num_candidates}" if num_candidates else mode
+                    print(f"  {label:<30} recall {recall:.2f}  p50 {p50:6.1f} ms  p95 {p95:6.1f} ms")
+    finally:
+        await client.options(ignore_status=404).indices.delete(index=index_name)
+        await client.close()
+
+if __name__ == "__main__":
+    asyncio.run(main(sys.argv[1] if len(sys.argv) > 1 else "test"))
@@ -0,0 +1,108 @@
+'''
+Benchmark for file- and directory-scoped retrieval.
+
+Indexes a repo (test/ by default) once, then asks a file template style
+question about every file through the hybrid retriever with no scope, scoped
+to the file's directory and scoped to the file itself. Prints p50/p95
+retrieval latency and how many of the top_k chunks came from the selected
+file, plus the latency of reading the file's chunks back from the index
+against reading the file from disk. Needs Elasticsearch at es_url and the
+embedding model.
+
+Run from the top-level folder: python testing/retrieval/benchmark_scoped.py [repo_path]
+'''
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.getcwd())
+from elasticsearch import AsyncElasticsearch
+from llama_index.core import SimpleDirectoryReader
+from llama_index.core.ingestion import IngestionPipeline
+from llama_index.vector_stores.elasticsearch import ElasticsearchStore
+
+from code_chunker import CodeNodeParser
+from embedding_engine import load_embed_model
+from retrieval import CODE_ANALYSIS, RETRIEVAL_SCOPES, HybridRetriever, fetch_file_chunks, scope_filters
+
+es_url = "http://127.0.0.1:9201"
+model_name = "sentence-transformers/all-MiniLM-L6-v2"
+dims = 384
+index_name = "github_rag_index_benchmark_scoped"
+top_k = 8
+rounds = 5
+question = "Explain what this file does, its main functions and how it is used."
+
+def percentiles(latencies):
+    latencies = sorted(latencies)
+    return latencies[len(latencies) // 2] * 1000, latencies[int(len(latencies) * 0.95)] * 1000
+
+async def build_index(client, nodes):
+    await client.options(ignore_status=404).indices.delete(index=index_name)
+    await client.indices.create(index=index_name, body={
+        "settings": {"analysis": CODE_ANALYSIS},
+        "mappings": {
+            "dynamic_templates": [{"metadata_as_keywords": {
+                "path_match": "metadata.*", "match_mapping_type": "string", "mapping": {"type": "keyword"},
+            }}],
+            "properties": {
+                "content": {"type": "text", "analyzer": "code"},
+                "embedding": {"type": "dense_vector", "dims": dims, "index": True, "similarity": "cosine"},
+            },
+        },
+    })
+    await ElasticsearchStore(index_name=index_name, es_client=client).async_add(nodes)
+    await client.indices.refresh(index=index_name)
+
+async def evaluate(client, embed_model, files, scope):
+    in_file, returned, latencies = 0, 0, []
+    for round_ in range(rounds):
+        for file_path in files:
+            retriever = HybridRetriever(
+                client, index_name, embed_model, top_k=top_k, filters=scope_filters(scope, file_path)
+            )
+            start = time.perf_counter()
+            results = await retriever.aretrieve(f"{question}\n\nFILE: {os.path.basename(file_path)}")
+            latencies.append(time.perf_counter() - start)
+            if round_ == 0:
+                returned += len(results)
+                in_file += sum(r.node.metadata.get("file_path") == file_path for r in results)
+    return in_file / (returned or 1), returned / len(files), *percentiles(latencies)
+
+async def file_reads(client, files):
+    index_latencies, disk_latencies = [], []
+    for _ in range(rounds):
+        for file_path in files:
+            start = time.perf_counter()
+            await fetch_file_chunks(client, index_name, file_path)
+            index_latencies.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            with open(file_path, encoding="utf-8", errors="ignore") as f:
+                f.read()
+            disk_latencies.append(time.perf_counter() - start)
+    return percentiles(index_latencies), percentiles(disk_latencies)
+
+async def main(repo_path):
+    documents = SimpleDirectoryReader(input_dir=repo_path, recursive=True).load_data()
+    embed_model = load_embed_model(model_name)
+    nodes = IngestionPipeline(transformations=[CodeNodeParser(), embed_model]).run(documents=documents)
+    files = sorted({node.metadata["file_path"] for node in nodes})
+    print(f"{len(nodes)} chunks in {len(files)} files from {repo_path}, top_k {top_k}")
+
+    client = AsyncElasticsearch(es_url, request_timeout=120)
+    try:
+        await build_index(client, nodes)
+        for scope in RETRIEVAL_SCOPES:
+            precision, hits, p50, p95 = await evaluate(client, embed_model, files, scope)
+            print(f"  scope {scope:<10} from selected file {precision:.2f}  hits/query {hits:4.1f}  "
+                  f"p50 {p50:6.1f} ms  p95 {p95:6.1f} ms")
+        (index_p50, index_p95), (disk_p50, disk_p95) = await file_reads(client, files)
+        print(f"  file chunks from index  p50 {index_p50:6.1f} ms  p95 {index_p95:6.1f} ms")
+        print(f"  file read from disk     p50 {disk_p50:6.1f} ms  p95 {disk_p95:6.1f} ms")
+    finally:
+        await client.options(ignore_status=404).indices.delete(index=index_name)
+        await client.close()
+
+if __name__ == "__main__":
+    asyncio.run(main(sys.argv[1] if len(sys.argv) > 1 else "test"))
@@ -0,0 +1,95 @@
+'''
+Vector index options and footprint
+
+Picks the dense_vector index_options for a new session index from the number
+of chunks it is expected to hold: tiny repos get a flat (brute-force) index
+with no graph at all, bigger ones a quantized HNSW graph. Also reports an
+index's on-disk size and the memory its vectors need to be searched quickly,
+using Elasticsearch's sizing formulas.
+'''
+import math
+
+# (up to this many vectors, index type); None means no upper bound
+VECTOR_INDEX_TIERS = [
+    (5_000, "int8_flat"),
+    (200_000, "int8_hnsw"),
+    (None, "int4_hnsw"),
+]
+VECTOR_INDEX_TYPES = ("hnsw", "int8_hnsw", "int4_hnsw", "bbq_hnsw", "flat", "int8_flat", "int4_flat", "bbq_flat")
+
+# Bytes per vector as a function of dims, per Elasticsearch's tuning guide
+_BYTES_PER_VECTOR = {
+    "": lambda dims: dims * 4,
+    "int8": lambda dims: dims + 4,
+    "int4": lambda dims: math.ceil(dims / 2) + 4,
+    "bbq": lambda dims: math.ceil(dims / 8) + 14,
+}
+
+
+def _quantization(index_type: str) -> str:
+    return index_type.split("_")[0] if "_" in index_type else ""
+
+
+def choose_index_options(estimated_vectors: int, m: int = 16, ef_construction: int = 100, override: str | None = None, tiers=VECTOR_INDEX_TIERS) -> dict:
+    """
+    index_options for a dense_vector field expected to hold estimated_vectors
+    vectors. override forces a type from VECTOR_INDEX_TYPES.
+    """
+    index_type = override
+    if index_type is None:
+        for limit, tier_type in tiers:
+            if limit is None or estimated_vectors <= limit:
+                index_type = tier_type
+                break
+    if index_type not in VECTOR_INDEX_TYPES:
+        raise ValueError(f"Unknown vector index type '{index_type}', expected one of {VECTOR_INDEX_TYPES}")
+
+    options = {"type": index_type}
+    if index_type.endswith("hnsw"):
+        options.update({"m": m, "ef_construction": ef_construction})
+    return options
+
+
+def estimate_vector_memory(index_options: dict, num_vectors: int, dims: int) -> int:
+    """
+    Off-heap memory (page cache) needed to keep the vectors and HNSW graph
+    resident, in bytes. Quantized types also keep the float vectors on disk
+    for rescoring, which is not counted here.
+    """
+    index_type = index_options.get("type", "hnsw")
+    vectors = num_vectors * _BYTES_PER_VECTOR[_quantization(index_type)](dims)
+    graph = num_vectors * 4 * index_options.get("m", 16) if index_type.endswith("hnsw") else 0
+    return vectors + graph
+
+
+async def index_footprint(async_es_client, index_name: str, vector_field: str = "embedding", detailed: bool = False) -> dict:
+    """
+    On-disk size, heap used by segments and estimated vector memory of an
+    index. detailed=True adds the per-field disk usage, which makes
+    Elasticsearch read the whole index and is slow on big ones.
+    """
+    mapping = await async_es_client.indices.get_mapping(index=index_name)
+    field = mapping[index_name]["mappings"]["properties"][vector_field]
+    index_options = field.get("index_options", {"type": "hnsw (default)"})
+    stats = await async_es_client.indices.stats(index=index_name, metric=["docs", "store", "segments"])
+    primaries = stats["indices"][index_name]["primaries"]
+    docs = primaries["docs"]["count"]
+
+    report = {
+        "index_name": index_name,
+        "docs": docs,
+        "index_options": index_options,
+        "dims": field.get("dims"),
+        "store_bytes": primaries["store"]["size_in_bytes"],
+        "segments": primaries["segments"]["count"],
+        "segments_heap_bytes": primaries["segments"].get("memory_in_bytes", 0),
+    }
+    if field.get("dims") and index_options.get("type") in VECTOR_INDEX_TYPES:
+        report["vector_memory_bytes"] = estimate_vector_memory(index_options, docs, field["dims"])
+        report["float_hnsw_memory_bytes"] = estimate_vector_memory({"type": "hnsw", "m": index_options.get("m", 16)}, docs, field["dims"])
+
+    if detailed:
+        usage = await async_es_client.indices.disk_usage(index=index_name, run_expensive_tasks=True)
+        fields = usage[index_name]["fields"]
+        report["field_disk_bytes"] = {name: info["total_in_bytes"] for name, info in fields.items()}
+    return report
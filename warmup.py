@@ -0,0 +1,92 @@
+'''
+Background template warm-up
+
+Once an index is built, the repository-wide templates are answered in the
+background at low LLM priority so their answers are already in the answer
+cache when a user first asks. Jobs are tracked per index for progress polling.
+'''
+import asyncio
+import time
+
+from llm_scheduler import BACKGROUND_PRIORITY
+
+
+class WarmupJob:
+    def __init__(self, index_name: str, template_keys: list):
+        self.index_name = index_name
+        self.template_keys = list(template_keys)
+        self.status = "pending"
+        self.completed = []
+        self.failed = {}
+        self.created_at = time.time()
+        self.finished_at = None
+        self.task = None
+
+    def summary(self) -> dict:
+        return {
+            "index_name": self.index_name,
+            "status": self.status,
+            "total": len(self.template_keys),
+            "completed": list(self.completed),
+            "failed": dict(self.failed),
+            "pending": [k for k in self.template_keys if k not in self.completed and k not in self.failed],
+            "elapsed_s": round((self.finished_at or time.time()) - self.created_at, 1),
+        }
+
+
+class WarmupManager:
+    """
+    Runs answer_fn(index_name, template_key, priority=...) for each template of
+    a job, at most `concurrency` at a time. Use from the ES pool loop.
+    """
+    def __init__(self, answer_fn, concurrency: int = 1):
+        self.answer_fn = answer_fn
+        self.concurrency = concurrency
+        self._jobs = {}
+
+    async def _run(self, job: WarmupJob, after=None):
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def warm(template_key):
+            async with semaphore:
+                try:
+                    await self.answer_fn(job.index_name, template_key, priority=BACKGROUND_PRIORITY)
+                    job.completed.append(template_key)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    print(f"[WARMUP] {job.index_name} {template_key} failed: {e}")
+                    job.failed[template_key] = str(e)
+
+        try:
+            if after is not None:
+                job.status = "waiting"
+                await after
+            job.status = "running"
+            await asyncio.gather(*(warm(key) for key in job.template_keys))
+            job.status = "done" if not job.failed else "done_with_errors"
+        except asyncio.CancelledError:
+            job.status = "cancelled"
+            raise
+        finally:
+            job.finished_at = time.time()
+
+    async def start(self, index_name: str, template_keys: list, after=None) -> dict:
+        """
+        Starts a warm-up job for index_name, replacing any job still running for it.
+        The job first waits for the awaitable after, if given.
+        """
+        self.cancel(index_name)
+        job = WarmupJob(index_name, template_keys)
+        job.task = asyncio.get_running_loop().create_task(self._run(job, after))
+        self._jobs[index_name] = job
+        return job.summary()
+
+    def cancel(self, index_name: str):
+        job = self._jobs.get(index_name)
+        if job is not None and job.task is not None and not job.task.done():
+            job.task.cancel()
+
+    def status(self, index_name: str) -> dict | None:
+        job = self._jobs.get(index_name)
+        return job.summary() if job else None